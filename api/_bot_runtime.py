@@ -0,0 +1,65 @@
+"""
+Общая часть webhook-эндпоинтов бота (api/index.py и api/webhook.py):
+ключ чата, кольцо последних update_id и вызовы в постоянном цикле бота.
+Имя начинается с '_', поэтому Vercel не делает из файла отдельную функцию.
+"""
+
+import os
+import abc
+import asyncio
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Сколько webhook-эндпоинты ждут служебных запросов к Telegram (секунды)
+BOT_CALL_TIMEOUT = float(os.getenv('BOT_CALL_TIMEOUT', 30))
+
+# Сколько последних update_id помнить, чтобы отбрасывать повторные доставки Telegram
+WEBHOOK_DEDUP_SIZE = int(os.getenv('WEBHOOK_DEDUP_SIZE', 10000))
+
+def update_chat_key(update):
+    """Чат (или пользователь), внутри которого обновления обрабатываются по порядку"""
+    chat = getattr(update, 'effective_chat', None)
+    if chat is not None:
+        return chat.id
+    user = getattr(update, 'effective_user', None)
+    return user.id if user is not None else None
+
+class RecentUpdateIds:
+    """Последние принятые update_id; самые старые вытесняются после size штук"""
+
+    def __init__(self, size=WEBHOOK_DEDUP_SIZE):
+        self.size = size
+        self._ids = OrderedDict()
+
+    def __contains__(self, update_id):
+        return update_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, update_id):
+        """Запомнить update_id (обновления без него не запоминаются)"""
+        if update_id is None:
+            return
+        self._ids[update_id] = None
+        if len(self._ids) > self.size:
+            self._ids.popitem(last=False)
+
+class BotRuntime(abc.ABC):
+    """Постоянный цикл событий бота (self.loop), в который потоки Flask передают корутины"""
+
+    loop: asyncio.AbstractEventLoop
+
+    @abc.abstractmethod
+    async def _ready(self):
+        """Дождаться однократной инициализации Application"""
+
+    def call(self, coro_factory, timeout=BOT_CALL_TIMEOUT):
+        """Выполнить корутину в цикле бота и дождаться результата"""
+        async def run():
+            await self._ready()
+            return await coro_factory()
+        return asyncio.run_coroutine_threadsafe(run(), self.loop).result(timeout)
@@ -2,9 +2,11 @@ from flask import Flask, jsonify, request
 import os
 import logging
 import asyncio
+import threading
 from dotenv import load_dotenv
 from telegram import Update, WebAppInfo, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+from api._bot_runtime import BOT_CALL_TIMEOUT, WEBHOOK_DEDUP_SIZE, BotRuntime, RecentUpdateIds, update_chat_key
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -22,6 +24,76 @@ app = Flask(__name__)
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', 'YOUR_BOT_TOKEN_HERE')
 WEBAPP_URL = os.getenv('WEBAPP_URL', 'https://telegram-games-two.vercel.app')
 
+# Отвечать Telegram только после обработки обновления. На Vercel функция
+# замораживается после ответа, а после 200 Telegram обновление не повторит
+WEBHOOK_WAIT_FOR_UPDATE = os.getenv(
+    'WEBHOOK_WAIT_FOR_UPDATE', 'true' if os.getenv('VERCEL') else 'false'
+).lower() == 'true'
+
+class BotLoop(BotRuntime):
+    """Постоянный цикл событий бота в фоновом потоке.
+
+    Application инициализируется один раз при старте цикла, а каждое обновление
+    лишь передается в цикл через run_coroutine_threadsafe. Повторные доставки
+    с уже принятым update_id отбрасываются; обновления одного чата выстраиваются
+    в цепочку, а разные чаты обрабатываются параллельно.
+    """
+    
+    def __init__(self, application, dedup_size=WEBHOOK_DEDUP_SIZE):
+        self.application = application
+        self.recent_ids = RecentUpdateIds(dedup_size)
+        self.chat_tails = {}  # {chat_key: задача последнего обновления чата}
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='bot-loop', daemon=True)
+        self.thread.start()
+        self.initialized = asyncio.run_coroutine_threadsafe(application.initialize(), self.loop)
+    
+    async def _ready(self):
+        """Дождаться однократной инициализации Application"""
+        await asyncio.wrap_future(self.initialized)
+    
+    def _is_duplicate(self, update):
+        """Запомнить update_id; True, если обновление уже принималось"""
+        update_id = getattr(update, 'update_id', None)
+        if update_id in self.recent_ids:
+            return True
+        self.recent_ids.add(update_id)
+        return False
+    
+    async def _process_update(self, update):
+        """Обработать обновление после инициализации и предыдущих обновлений его чата"""
+        if self._is_duplicate(update):
+            logger.info(f"Duplicate update {update.update_id} dropped")
+            return
+        
+        # Задачи стартуют в порядке отправки, поэтому хвост цепочки чата - предыдущее обновление
+        key = update_chat_key(update)
+        current = asyncio.current_task()
+        previous = self.chat_tails.get(key) if key is not None else None
+        if key is not None:
+            self.chat_tails[key] = current
+        
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            await self._ready()
+            await self.application.process_update(update)
+        finally:
+            if key is not None and self.chat_tails.get(key) is current:
+                del self.chat_tails[key]
+    
+    def submit_update(self, update):
+        """Передать обновление в цикл, не дожидаясь обработки"""
+        future = asyncio.run_coroutine_threadsafe(self._process_update(update), self.loop)
+        future.add_done_callback(self._log_failure)
+        return future
+    
+    @staticmethod
+    def _log_failure(future):
+        """Залогировать ошибку обработки обновления"""
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Error processing update: {future.exception()}")
+
 # Создаем приложение бота
 if BOT_TOKEN and BOT_TOKEN != 'YOUR_BOT_TOKEN_HERE':
     application = Application.builder().token(BOT_TOKEN).build()
@@ -127,8 +199,10 @@ if BOT_TOKEN and BOT_TOKEN != 'YOUR_BOT_TOKEN_HERE':
 
     # Настраиваем обработчики
     setup_handlers()
+    bot_loop = BotLoop(application)
 else:
     application = None
+    bot_loop = None
     logger.warning("Bot token not configured!")
 
 @app.route('/', methods=['GET'])
@@ -240,22 +314,16 @@ def webhook():
             return jsonify({'error': 'Bot not configured'}), 400
         
         try:
-            # Логируем входящие данные
             data = request.get_json()
-            logger.info(f"Received webhook data: {data}")
+            logger.debug("Received webhook update %s", data.get('update_id'))
             
             # Получаем данные от Telegram
             update = Update.de_json(data, application.bot)
             
-            # Создаем новую event loop для асинхронной операции
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            # Инициализируем приложение
-            loop.run_until_complete(application.initialize())
-            
-            # Обрабатываем обновление асинхронно
-            loop.run_until_complete(application.process_update(update))
+            # Обработка идет в постоянном цикле бота; ответ сразу, если процесс живет и после него
+            future = bot_loop.submit_update(update)
+            if WEBHOOK_WAIT_FOR_UPDATE:
+                future.result(BOT_CALL_TIMEOUT)
             
             return jsonify({'status': 'ok'}), 200
         except Exception as e:
@@ -272,15 +340,8 @@ def setup_webhook():
         # Получаем URL для webhook
         webhook_url = f"{WEBAPP_URL}/api/webhook"
         
-        # Создаем новую event loop для асинхронной операции
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        # Инициализируем приложение
-        loop.run_until_complete(application.initialize())
-        
         # Устанавливаем webhook
-        result = loop.run_until_complete(application.bot.set_webhook(url=webhook_url))
+        result = bot_loop.call(lambda: application.bot.set_webhook(url=webhook_url))
         
         return jsonify({
             'status': 'ok',
@@ -298,14 +359,7 @@ def webhook_status():
         return jsonify({'error': 'Bot not configured'}), 400
     
     try:
-        # Создаем новую event loop для асинхронной операции
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        # Инициализируем приложение
-        loop.run_until_complete(application.initialize())
-        
-        webhook_info = loop.run_until_complete(application.bot.get_webhook_info())
+        webhook_info = bot_loop.call(application.bot.get_webhook_info)
         return jsonify({
             'status': 'ok',
             'webhook_info': webhook_info.to_dict()
@@ -1,68 +1,480 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 import os
 import json
 import time
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
 import uuid
-from datetime import datetime
+import sqlite3
+import bisect
+import heapq
+import itertools
+import threading
+from collections import deque
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
+from debounced_writer import DebouncedWriter
+
 # Загружаем переменные окружения
 load_dotenv()
 
+# Уровень логов лобби и доля запросов, для которых пишутся DEBUG-записи горячих путей
+LOBBY_LOG_LEVEL = os.getenv('LOBBY_LOG_LEVEL', 'INFO').upper()
+LOBBY_LOG_SAMPLE_RATE = float(os.getenv('LOBBY_LOG_SAMPLE_RATE', 0.01))
+
+def setup_logging(level=LOBBY_LOG_LEVEL):
+    """Настроить логгер лобби.
+
+    Обработчик запроса только кладет запись в очередь (QueueHandler), а в stderr
+    её пишет поток QueueListener, поэтому запросы не ждут вывода.
+    """
+    logger = logging.getLogger('lobby')
+    if logger.handlers:
+        return logger
+    
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
+
+logger = setup_logging()
+
+def debug_sampled(msg, *args):
+    """DEBUG-запись горячего пути: пишется лишь для доли LOBBY_LOG_SAMPLE_RATE вызовов"""
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < LOBBY_LOG_SAMPLE_RATE:
+        logger.debug(msg, *args, stacklevel=2)
+
 app = Flask(__name__)
 
 # Добавляем CORS заголовки
 @app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,If-None-Match')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+    response.headers.add('Access-Control-Expose-Headers', 'ETag,Last-Modified')
     return response
 
-# Хранилище лобби (в реальном проекте это должна быть база данных)
-LOBBY_STORAGE = {
-    'games': {},  # {game_id: game_info}
-    'users': {}   # {user_id: user_info}
-}
-
 # Файл для persistent storage
 STORAGE_FILE = 'lobby_data.json'
 
-def load_storage():
-    """Загрузить данные из файла"""
-    try:
-        if os.path.exists(STORAGE_FILE):
-            with open(STORAGE_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                LOBBY_STORAGE['games'] = data.get('games', {})
-                LOBBY_STORAGE['users'] = data.get('users', {})
-                print(f"Загружено {len(LOBBY_STORAGE['games'])} игр и {len(LOBBY_STORAGE['users'])} пользователей")
-    except Exception as e:
-        print(f"Ошибка загрузки данных: {e}")
+# Хранилище лобби: sqlite (по умолчанию) или json.
+# На Vercel файловая система только для чтения, писать можно лишь в /tmp
+LOBBY_STORAGE_BACKEND = os.getenv('LOBBY_STORAGE_BACKEND', 'sqlite')
+LOBBY_DB_FILE = os.getenv('LOBBY_DB_FILE', '/tmp/lobby_data.db' if os.getenv('VERCEL') else 'lobby_data.db')
+
+# Минимальный интервал между снимками JSON-хранилища (мс)
+LOBBY_SNAPSHOT_INTERVAL_MS = int(os.getenv('LOBBY_SNAPSHOT_INTERVAL_MS', 500))
+
+def encode_record(record):
+    """Компактный JSON записи игры или пользователя"""
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+
+class JsonLobbyStore:
+    """Хранилище лобби в JSON-файле.
+
+    write() кодирует изменённые записи сразу, пока менеджер держит их
+    блокировки, и хранит у себя их JSON. Фоновый поток собирает из этих
+    строк компактный снимок не чаще раза в interval_ms и пишет его через
+    временный файл и os.replace, поэтому обработчики не ждут диска, а
+    снимок никогда не читает изменяемые менеджером словари.
+    """
+    
+    def __init__(self, path, interval_ms=LOBBY_SNAPSHOT_INTERVAL_MS):
+        self.path = path
+        self.interval = interval_ms / 1000
+        self.records = {
+            'games': {},  # {game_id: JSON игры}
+            'users': {}   # {user_id: JSON пользователя}
+        }
+        self.metrics = {
+            'snapshots': 0,
+            'errors': 0,
+            'last_size_bytes': 0,
+            'last_duration_ms': 0.0,
+            'max_duration_ms': 0.0
+        }
+        self._dirty = False
+        self._writer = DebouncedWriter(self.flush, lambda: self._dirty, self.interval, name='lobby-snapshot')
+        self._cond = self._writer.cond
+        self._flush_lock = threading.Lock()
+    
+    def load(self):
+        """Загрузить данные из файла"""
+        data = {'games': {}, 'users': {}}
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    saved = json.load(f)
+                    data['games'] = saved.get('games', {})
+                    data['users'] = saved.get('users', {})
+                    logger.info("Загружено игр=%d пользователей=%d path=%s",
+                                len(data['games']), len(data['users']), self.path)
+        except Exception as e:
+            logger.error("Ошибка загрузки данных path=%s: %s", self.path, e)
+        
+        # Менеджер получает свои словари, у хранилища остаются только строки
+        self.records = {kind: {key: encode_record(value) for key, value in data[kind].items()} for kind in data}
+        return data
+    
+    def write(self, games=(), users=(), deleted_games=(), deleted_users=()):
+        """Запомнить изменённые записи.
+
+        Вызывается под блокировками менеджера, поэтому все записи одного
+        изменения кодируются согласованными и попадают в снимок вместе.
+        """
+        encoded_games = [(game['id'], encode_record(game)) for game in games]
+        encoded_users = [(user_id, encode_record(info)) for user_id, info in users]
+        
+        with self._cond:
+            self.records['games'].update(encoded_games)
+            self.records['users'].update(encoded_users)
+            for game_id in deleted_games:
+                self.records['games'].pop(game_id, None)
+            for user_id in deleted_users:
+                self.records['users'].pop(user_id, None)
+            
+            self._dirty = True
+            self._writer.wake()
+    
+    def wait(self, ticket):
+        """Снимок пишется в фоне, обработчики его не ждут"""
+    
+    def flush(self):
+        """Атомарно записать снимок, если есть несохранённые изменения"""
+        with self._flush_lock:
+            with self._cond:
+                if not self._dirty:
+                    return
+                self._dirty = False
+                # Копируем только ссылки на готовые строки: снимок согласован на момент копии
+                games = list(self.records['games'].items())
+                users = list(self.records['users'].items())
+            
+            started = time.perf_counter()
+            tmp_path = f"{self.path}.tmp"
+            try:
+                payload = (
+                    '{"games":{' + ','.join(f'{encode_record(key)}:{value}' for key, value in games) +
+                    '},"users":{' + ','.join(f'{encode_record(key)}:{value}' for key, value in users) + '}}'
+                ).encode('utf-8')
+                with open(tmp_path, 'wb') as f:
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                # Повторим запись в следующий раз
+                with self._cond:
+                    self._dirty = True
+                self.metrics['errors'] += 1
+                logger.error("Ошибка сохранения снимка path=%s: %s", self.path, e)
+                return
+            
+            duration_ms = (time.perf_counter() - started) * 1000
+            self.metrics['snapshots'] += 1
+            self.metrics['last_size_bytes'] = len(payload)
+            self.metrics['last_duration_ms'] = round(duration_ms, 3)
+            self.metrics['max_duration_ms'] = round(max(self.metrics['max_duration_ms'], duration_ms), 3)
+    
+    def close(self):
+        """Записать последний снимок и остановить фоновый поток"""
+        self._writer.close()
+    
+    def stats(self):
+        """Метрики снимков"""
+        return dict(self.metrics, backend='json', path=self.path, dirty=self._dirty)
+
+class SqliteLobbyStore:
+    """Хранилище лобби в SQLite (WAL): каждая запись сохраняется отдельно.
 
-def save_storage():
-    """Сохранить данные в файл"""
+    write() только кодирует изменённые записи и ставит их в очередь (его
+    вызывают под блокировкой менеджера), а единственный поток записи
+    сохраняет всё накопленное одной транзакцией. Обработчик ждет своей
+    транзакции через wait() уже без блокировок, поэтому изменения разных
+    игр не выстраиваются в очередь за диском.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS games (
+            id TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            status TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_games_status ON games (status);
+        CREATE INDEX IF NOT EXISTS idx_games_type ON games (type);
+        CREATE INDEX IF NOT EXISTS idx_games_created_at ON games (created_at);
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            current_game TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+    
+    def __init__(self, path, migrate_from=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+        
+        # Очередь закодированных изменений и номер последнего сохраненного
+        self._pending = []
+        self._submitted = 0
+        self._saved = 0
+        # Без интервала: поток забирает всё, что накопилось за время прошлой транзакции
+        self._writer = DebouncedWriter(self.flush, lambda: bool(self._pending), 0, name='lobby-sqlite-writer')
+        self._cond = self._writer.cond
+        self._flush_lock = threading.Lock()
+        self.metrics = {'transactions': 0, 'changes': 0}
+        
+        if migrate_from:
+            self._migrate_from_json(migrate_from)
+    
+    def _migrate_from_json(self, json_path):
+        """Однократно перенести данные из старого JSON-файла"""
+        migrated = self._conn.execute("SELECT value FROM meta WHERE key = 'migrated_from_json'").fetchone()
+        if migrated or not os.path.exists(json_path):
+            return
+        
+        data = JsonLobbyStore(json_path).load()
+        self.wait(self.write(
+            games=data['games'].values(),
+            users=data['users'].items(),
+            meta={'migrated_from_json': datetime.now().isoformat()}
+        ))
+        logger.info("Перенесено из %s игр=%d пользователей=%d", json_path, len(data['games']), len(data['users']))
+    
+    def load(self):
+        """Загрузить все записи в память"""
+        with self._lock:
+            games = {row[0]: json.loads(row[1]) for row in self._conn.execute('SELECT id, data FROM games')}
+            users = {row[0]: json.loads(row[1]) for row in self._conn.execute('SELECT id, data FROM users')}
+        logger.info("Загружено игр=%d пользователей=%d path=%s", len(games), len(users), self.path)
+        return {'games': games, 'users': users}
+    
+    def write(self, games=(), users=(), deleted_games=(), deleted_users=(), meta=None):
+        """Закодировать изменённые записи и поставить их в очередь; вернуть номер для wait()"""
+        game_rows = [
+            (game['id'], game['type'], game['status'], game['created_at'], encode_record(game))
+            for game in games
+        ]
+        user_rows = [
+            (user_id, info.get('current_game'), encode_record(info))
+            for user_id, info in users
+        ]
+        change = (game_rows, user_rows, list(deleted_games), list(deleted_users), meta)
+        
+        with self._cond:
+            self._pending.append(change)
+            self._submitted += 1
+            self._writer.wake()
+            return self._submitted
+    
+    def wait(self, ticket):
+        """Дождаться, пока изменение с номером ticket будет сохранено"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._saved >= ticket)
+    
+    def flush(self):
+        """Сохранить все изменения из очереди одной транзакцией"""
+        with self._flush_lock:
+            with self._cond:
+                changes, self._pending = self._pending, []
+                last = self._submitted
+            if changes:
+                self._write_changes(changes)
+            
+            with self._cond:
+                self._saved = max(self._saved, last)
+                self._cond.notify_all()
+    
+    def _write_changes(self, changes):
+        """Применить изменения по порядку в одной транзакции"""
+        try:
+            with self._lock, self._conn:
+                self._conn.execute('BEGIN IMMEDIATE')
+                for game_rows, user_rows, deleted_games, deleted_users, meta in changes:
+                    self._conn.executemany(
+                        'INSERT INTO games (id, type, status, created_at, data) VALUES (?, ?, ?, ?, ?) '
+                        'ON CONFLICT(id) DO UPDATE SET type = excluded.type, status = excluded.status, '
+                        'created_at = excluded.created_at, data = excluded.data',
+                        game_rows
+                    )
+                    self._conn.executemany(
+                        'INSERT INTO users (id, current_game, data) VALUES (?, ?, ?) '
+                        'ON CONFLICT(id) DO UPDATE SET current_game = excluded.current_game, data = excluded.data',
+                        user_rows
+                    )
+                    self._conn.executemany('DELETE FROM games WHERE id = ?', [(game_id,) for game_id in deleted_games])
+                    self._conn.executemany('DELETE FROM users WHERE id = ?', [(user_id,) for user_id in deleted_users])
+                    if meta:
+                        self._conn.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', meta.items())
+            self.metrics['transactions'] += 1
+            self.metrics['changes'] += len(changes)
+        except Exception as e:
+            logger.error("Ошибка сохранения данных path=%s: %s", self.path, e)
+    
+    def close(self):
+        """Остановить поток записи, сохранив очередь"""
+        self._writer.close()
+    
+    def stats(self):
+        """Сведения о хранилище"""
+        return {
+            'backend': 'sqlite',
+            'path': self.path,
+            'transactions': self.metrics['transactions'],
+            'changes': self.metrics['changes'],
+            'pending': len(self._pending),
+            'size_bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        }
+
+def create_store():
+    """Создать хранилище лобби согласно LOBBY_STORAGE_BACKEND"""
+    if LOBBY_STORAGE_BACKEND == 'json':
+        return JsonLobbyStore(STORAGE_FILE)
     try:
-        with open(STORAGE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(LOBBY_STORAGE, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"Ошибка сохранения данных: {e}")
+        return SqliteLobbyStore(LOBBY_DB_FILE, migrate_from=STORAGE_FILE)
+    except sqlite3.Error as e:
+        # Лобби должно работать и без диска: данные живут до перезапуска процесса
+        logger.error("Не удалось открыть базу лобби path=%s: %s, данные хранятся в памяти", LOBBY_DB_FILE, e)
+        return SqliteLobbyStore(':memory:', migrate_from=STORAGE_FILE)
+
+# Рейтинг по умолчанию для подбора соперника
+DEFAULT_RATING = 1200
+
+# Время жизни игры и период фоновой очистки (секунды)
+GAME_TTL = int(os.getenv('MAX_GAME_DURATION', 3600))
+CLEANUP_INTERVAL = int(os.getenv('CLEANUP_INTERVAL', 300))
+
+# Максимальный размер страницы списка игр
+MAX_PAGE_SIZE = 100
 
-# Загружаем данные при запуске
-load_storage()
+# SSE: интервал keep-alive и максимальная длительность одного соединения (секунды)
+SSE_KEEPALIVE = int(os.getenv('SSE_KEEPALIVE', 15))
+SSE_MAX_DURATION = int(os.getenv('SSE_MAX_DURATION', 55))
+
+# Поток событий нужен долгоживущий процесс: на Vercel ответы буферизуются,
+# а функции живут недолго, поэтому там клиенты сразу переходят на опрос
+LOBBY_SSE_ENABLED = os.getenv('LOBBY_SSE_ENABLED', 'false' if os.getenv('VERCEL') else 'true').lower() == 'true'
+
+# Сколько последних изменений списка игр хранится для запросов ?since=
+LOBBY_CHANGELOG_SIZE = int(os.getenv('LOBBY_CHANGELOG_SIZE', 1000))
+
+# Максимальное время ожидания long-poll запроса (секунды)
+LONG_POLL_TIMEOUT = int(os.getenv('LONG_POLL_TIMEOUT', 25))
+
+# Сколько секунд живет заявка подбора без продления (long-poll ожидания продлевает её)
+MATCHMAKING_TICKET_TTL = int(os.getenv('MATCHMAKING_TICKET_TTL', 60))
+
+# Число блокировок, между которыми распределяются игры
+LOBBY_LOCK_STRIPES = int(os.getenv('LOBBY_LOCK_STRIPES', 64))
 
 class LobbyManager:
-    def __init__(self):
-        self.games = LOBBY_STORAGE['games']
-        self.users = LOBBY_STORAGE['users']
+    def __init__(self, store):
+        self.store = store
+        data = store.load()
+        self.games = data['games']
+        self.users = data['users']
+        
+        # Проверка и изменение игры идут под блокировкой её полосы, поэтому
+        # операции с разными играми не ждут друг друга. Общие индексы, журнал
+        # и версия меняются коротко под self._lock (порядок: полоса -> self._lock);
+        # запись на диск ждется уже после снятия обеих блокировок
+        self._game_locks = [threading.Lock() for _ in range(LOBBY_LOCK_STRIPES)]
+        self._lock = threading.RLock()
+        # Будит long-poll и SSE подписчиков при каждом изменении лобби
+        self.changed = threading.Condition(self._lock)
+        
+        # Версия лобби растет при каждом изменении; старт с текущего времени в мс
+        # сохраняет монотонность между перезапусками
+        self.version = int(time.time() * 1000)
+        self.last_modified = datetime.now(timezone.utc)
+        
+        # Журнал изменений списка открытых игр: (version, game_id, added)
+        self.changelog = deque(maxlen=LOBBY_CHANGELOG_SIZE)
+        self.changelog_floor = self.version
+        
+        # Индекс открытых игр: {game_type: [(created_at, game_id), ...]} по возрастанию created_at
+        self.open_games = {}
+        for game in self.games.values():
+            self._update_open_index(game)
+        self.changelog.clear()
+        
+        # Куча сроков жизни игр: (expires_at, game_id, created_at), время - epoch float
+        self.expiry_heap = []
+        for game in self.games.values():
+            self._schedule_expiry(game)
     
-    def create_game(self, user_id, username, game_type):
-        """Создать новую игру"""
-        game_id = str(uuid.uuid4())[:8]
-        # Приводим user_id к строке для корректного сравнения
-        user_id = str(user_id)
+    def _game_lock(self, game_id):
+        """Блокировка полосы, к которой относится игра"""
+        return self._game_locks[hash(game_id) % len(self._game_locks)]
+    
+    def _commit(self, **changes):
+        """Поднять версию лобби и передать изменённые записи хранилищу (вызывается под self._lock).
+
+        Возвращает номер записи: его нужно передать в self.store.wait() после снятия блокировок.
+        """
+        self.version += 1
+        self.last_modified = datetime.now(timezone.utc)
+        ticket = self.store.write(**changes)
+        self.changed.notify_all()
+        return ticket
+    
+    def wait_for_change(self, version, timeout):
+        """Ждать, пока версия лобби не станет больше version; вернуть текущую версию"""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version > version, timeout)
+        return self.version
+    
+    def _log_change(self, game_id, added):
+        """Записать появление/исчезновение игры в списке открытых"""
+        if len(self.changelog) == self.changelog.maxlen:
+            self.changelog_floor = self.changelog[0][0]
+        # Изменение войдет в версию, которую поднимет ближайший _commit
+        self.changelog.append((self.version + 1, game_id, added))
+    
+    def _is_open(self, game):
+        """Можно ли присоединиться к игре"""
+        return game['status'] == 'waiting' and len(game['players']) < game['max_players']
+    
+    def _update_open_index(self, game, deleted=False):
+        """Добавить игру в индекс открытых игр или убрать из него"""
+        index = self.open_games.setdefault(game['type'], [])
+        key = (game['created_at'], game['id'])
+        position = bisect.bisect_left(index, key)
+        present = position < len(index) and index[position] == key
+        should_be_open = not deleted and self._is_open(game)
         
-        game_info = {
+        if should_be_open and not present:
+            index.insert(position, key)
+            self._log_change(game['id'], True)
+        elif present and not should_be_open:
+            del index[position]
+            self._log_change(game['id'], False)
+    
+    def _new_game(self, game_id, user_id, username, game_type, created_ts):
+        """Запись новой игры с создателем в качестве первого игрока"""
+        return {
             'id': game_id,
             'type': game_type,
             'creator': {
@@ -75,19 +487,65 @@ class LobbyManager:
                 'ready': True
             }],
             'status': 'waiting',  # waiting, playing, finished
-            'created_at': datetime.now().isoformat(),
+            'created_at': datetime.fromtimestamp(created_ts).isoformat(),
             'max_players': 2
         }
+    
+    def create_game(self, user_id, username, game_type):
+        """Создать новую игру"""
+        game_id = str(uuid.uuid4())[:8]
+        # Приводим user_id к строке для корректного сравнения
+        user_id = str(user_id)
         
-        self.games[game_id] = game_info
-        self.users[user_id] = {
-            'current_game': game_id,
-            'username': username
-        }
+        created_ts = time.time()
+        game_info = self._new_game(game_id, user_id, username, game_type, created_ts)
+        
+        with self._game_lock(game_id), self._lock:
+            self.games[game_id] = game_info
+            self._update_open_index(game_info)
+            self._schedule_expiry(game_info, created_ts)
+            self.users[user_id] = {
+                'current_game': game_id,
+                'username': username
+            }
+            
+            # Сохраняем только изменённые записи
+            saved = self._commit(games=[game_info], users=[(user_id, self.users[user_id])])
+        
+        self.store.wait(saved)
+        return game_info
+    
+    def create_match(self, creator_id, creator_name, player_id, player_name, game_type):
+        """Создать начавшуюся игру сразу с двумя игроками (для подбора соперника).
+
+        Игра ни на миг не бывает открытой, поэтому не попадает в список
+        и её место не может занять третий игрок.
+        """
+        game_id = str(uuid.uuid4())[:8]
+        creator_id, player_id = str(creator_id), str(player_id)
+        
+        created_ts = time.time()
+        game_info = self._new_game(game_id, creator_id, creator_name, game_type, created_ts)
+        game_info['players'].append({
+            'id': player_id,
+            'username': player_name,
+            'ready': True
+        })
+        game_info['status'] = 'playing'
+        game_info['started_at'] = datetime.now().isoformat()
         
-        # Сохраняем данные
-        save_storage()
+        with self._game_lock(game_id), self._lock:
+            self.games[game_id] = game_info
+            self._schedule_expiry(game_info, created_ts)
+            for user_id, username in ((creator_id, creator_name), (player_id, player_name)):
+                self.users[user_id] = {
+                    'current_game': game_id,
+                    'username': username
+                }
+            
+            saved = self._commit(games=[game_info], users=[(user_id, self.users[user_id]) for user_id in (creator_id, player_id)])
         
+        self.store.wait(saved)
         return game_info
     
     def join_game(self, user_id, username, game_id):
@@ -95,82 +553,139 @@ class LobbyManager:
         # Приводим user_id к строке для корректного сравнения
         user_id = str(user_id)
         
-        if game_id not in self.games:
-            return None, "Игра не найдена"
-        
-        game = self.games[game_id]
-        
-        if game['status'] != 'waiting':
-            return None, "Игра уже началась"
+        # Проверка мест и добавление игрока атомарны для игры
+        with self._game_lock(game_id):
+            game = self.games.get(game_id)
+            if game is None:
+                return None, "Игра не найдена"
+            
+            if game['status'] != 'waiting':
+                return None, "Игра уже началась"
+            
+            if len(game['players']) >= game['max_players']:
+                return None, "Игра заполнена"
+            
+            # Проверяем, не в игре ли уже пользователь
+            for player in game['players']:
+                if str(player['id']) == user_id:
+                    return game, "Вы уже в этой игре"
+            
+            # Добавляем игрока
+            game['players'].append({
+                'id': user_id,
+                'username': username,
+                'ready': True
+            })
+            
+            # Если игра заполнена, начинаем
+            if len(game['players']) == game['max_players']:
+                game['status'] = 'playing'
+                game['started_at'] = datetime.now().isoformat()
+            
+            with self._lock:
+                # Обновляем информацию о пользователе
+                self.users[user_id] = {
+                    'current_game': game_id,
+                    'username': username
+                }
+                self._update_open_index(game)
+                
+                # Сохраняем только изменённые записи
+                saved = self._commit(games=[game], users=[(user_id, self.users[user_id])])
         
-        if len(game['players']) >= game['max_players']:
-            return None, "Игра заполнена"
+        self.store.wait(saved)
+        return game, "Успешно присоединились"
+    
+    def get_available_games(self, game_type=None, limit=None, cursor=None):
+        """Получить список доступных игр из индекса (старые первыми); cursor - next_cursor прошлой страницы"""
+        if game_type is not None:
+            indexes = [self.open_games.get(game_type, [])]
+        else:
+            indexes = list(self.open_games.values())
         
-        # Проверяем, не в игре ли уже пользователь
-        for player in game['players']:
-            if str(player['id']) == user_id:
-                return game, "Вы уже в этой игре"
+        after = None
+        if cursor:
+            created_at, _, game_id = cursor.partition('|')
+            after = (created_at, game_id)
         
-        # Добавляем игрока
-        game['players'].append({
-            'id': user_id,
-            'username': username,
-            'ready': True
-        })
+        with self._lock:
+            # Сливаем отсортированные индексы по типам, начиная сразу после курсора
+            sources = [
+                itertools.islice(index, bisect.bisect_right(index, after) if after else 0, None)
+                for index in indexes
+            ]
+            keys = list(itertools.islice(heapq.merge(*sources), limit))
+            available = [self._game_summary(self.games[game_id]) for _, game_id in keys]
         
-        # Обновляем информацию о пользователе
-        self.users[user_id] = {
-            'current_game': game_id,
-            'username': username
-        }
+        next_cursor = None
+        if limit is not None and len(keys) == limit:
+            next_cursor = f"{keys[-1][0]}|{keys[-1][1]}"
         
-        # Если игра заполнена, начинаем
-        if len(game['players']) == game['max_players']:
-            game['status'] = 'playing'
-            game['started_at'] = datetime.now().isoformat()
+        debug_sampled("Доступных игр в ответе=%d type=%s", len(available), game_type)
+        return available, next_cursor
+    
+    def get_changes_since(self, since, game_type=None):
+        """Игры, появившиеся и исчезнувшие из списка после версии since; None - нужен полный список"""
+        with self._lock:
+            if since < self.changelog_floor or since > self.version:
+                return None
+            
+            # Для каждой игры важно только последнее изменение
+            latest = {}
+            for version, game_id, added in reversed(self.changelog):
+                if version <= since:
+                    break
+                latest.setdefault(game_id, added)
         
-        # Сохраняем данные
-        save_storage()
+        added, removed = [], []
+        for game_id, is_added in latest.items():
+            game = self.games.get(game_id)
+            if is_added and game and self._is_open(game):
+                if game_type is None or game['type'] == game_type:
+                    added.append(self._game_summary(game))
+            else:
+                removed.append(game_id)
         
-        return game, "Успешно присоединились"
+        added.sort(key=lambda game: (game['created_at'], game['id']))
+        return added, removed
     
-    def get_available_games(self):
-        """Получить список доступных игр"""
-        print(f"DEBUG: get_available_games - всего игр в системе: {len(self.games)}")
-        
-        available = []
-        for game_id, game in self.games.items():
-            print(f"DEBUG: Проверяем игру {game_id} - статус: {game['status']}, игроков: {len(game['players'])}/{game['max_players']}")
-            
-            if game['status'] == 'waiting' and len(game['players']) < game['max_players']:
-                available.append({
-                    'id': game_id,
-                    'type': game['type'],
-                    'creator': game['creator']['username'],
-                    'players_count': len(game['players']),
-                    'max_players': game['max_players'],
-                    'created_at': game['created_at']
-                })
-                print(f"DEBUG: Игра {game_id} добавлена в доступные")
-        
-        print(f"DEBUG: Доступных игр: {len(available)}")
-        return available
+    def _game_summary(self, game):
+        """Краткая информация об игре для списка"""
+        return {
+            'id': game['id'],
+            'type': game['type'],
+            'creator': game['creator']['username'],
+            'players_count': len(game['players']),
+            'max_players': game['max_players'],
+            'created_at': game['created_at']
+        }
+    
+    def count_available_games(self, game_type=None):
+        """Количество открытых игр"""
+        if game_type is not None:
+            return len(self.open_games.get(game_type, []))
+        return sum(len(index) for index in self.open_games.values())
     
     def create_user(self, user_id, username):
         """Создать пользователя если его нет в системе"""
         user_id = str(user_id)
         
-        if user_id not in self.users:
-            self.users[user_id] = {
-                'username': username,
-                'current_game': None,
-                'created_at': datetime.now().isoformat()
-            }
-            save_storage()
-            print(f"DEBUG: Создан новый пользователь {user_id} ({username})")
+        with self._lock:
+            created = user_id not in self.users
+            if created:
+                self.users[user_id] = {
+                    'username': username,
+                    'current_game': None,
+                    'created_at': datetime.now().isoformat()
+                }
+                saved = self._commit(users=[(user_id, self.users[user_id])])
+        
+        if created:
+            self.store.wait(saved)
+            logger.debug("Создан пользователь user_id=%s", user_id)
             return True
         else:
-            print(f"DEBUG: Пользователь {user_id} уже существует")
+            logger.debug("Пользователь уже существует user_id=%s", user_id)
             return False
     
     def get_or_create_user(self, user_id, username):
@@ -186,60 +701,249 @@ class LobbyManager:
         """Получить информацию об игре"""
         return self.games.get(game_id)
     
+    def get_started_game(self, user_id):
+        """Получить начавшуюся игру пользователя или None"""
+        user_info = self.users.get(str(user_id))
+        if not user_info or not user_info.get('current_game'):
+            return None
+        
+        game = self.games.get(user_info['current_game'])
+        if game and game['status'] == 'playing':
+            return game
+        return None
+    
+    def release_user(self, user_id):
+        """Отвязать пользователя от прежней игры (перед новым подбором соперника)"""
+        user_id = str(user_id)
+        with self._lock:
+            user_info = self.users.get(user_id)
+            if not user_info or not user_info.get('current_game'):
+                return
+            user_info['current_game'] = None
+            saved = self._commit(users=[(user_id, user_info)])
+        
+        self.store.wait(saved)
+    
+    def wait_for_game_start(self, user_id, timeout):
+        """Ждать (long-poll), пока игра пользователя не начнется"""
+        with self.changed:
+            self.changed.wait_for(lambda: self.get_started_game(user_id), timeout)
+        return self.get_started_game(user_id)
+    
     def leave_game(self, user_id, game_id):
         """Покинуть игру"""
         # Приводим user_id к строке для корректного сравнения
         user_id = str(user_id)
         
-        if game_id not in self.games:
-            return False, "Игра не найдена"
+        with self._game_lock(game_id):
+            game = self.games.get(game_id)
+            if game is None:
+                return False, "Игра не найдена"
+            
+            # Удаляем игрока из игры
+            game['players'] = [p for p in game['players'] if str(p['id']) != user_id]
+            
+            with self._lock:
+                # Если игра пустая, удаляем её
+                if len(game['players']) == 0:
+                    del self.games[game_id]
+                    self._update_open_index(game, deleted=True)
+                    changed_games, deleted_games = [], [game_id]
+                else:
+                    # Если игра была в процессе, возвращаем в ожидание
+                    if game['status'] == 'playing':
+                        game['status'] = 'waiting'
+                    self._update_open_index(game)
+                    changed_games, deleted_games = [game], []
+                
+                # Удаляем пользователя из хранилища
+                self.users.pop(user_id, None)
+                
+                # Сохраняем только изменённые записи
+                saved = self._commit(games=changed_games, deleted_games=deleted_games, deleted_users=[user_id])
         
-        game = self.games[game_id]
+        self.store.wait(saved)
+        return True, "Успешно покинули игру"
+    
+    def _schedule_expiry(self, game, created_ts=None):
+        """Добавить срок жизни игры в кучу дедлайнов"""
+        if created_ts is None:
+            created_ts = datetime.fromisoformat(game['created_at']).timestamp()
+        heapq.heappush(self.expiry_heap, (created_ts + GAME_TTL, game['id'], game['created_at']))
+    
+    def cleanup_old_games(self, now=None):
+        """Удалить игры с истекшим сроком жизни; стоимость пропорциональна числу удаленных"""
+        now = time.time() if now is None else now
+        with self._lock:
+            due = []
+            while self.expiry_heap and self.expiry_heap[0][0] <= now:
+                due.append(heapq.heappop(self.expiry_heap))
         
-        # Удаляем игрока из игры
-        game['players'] = [p for p in game['players'] if str(p['id']) != user_id]
+        removed = 0
+        saved = None
+        for _, game_id, created_at in due:
+            with self._game_lock(game_id), self._lock:
+                game = self.games.get(game_id)
+                # Игра уже удалена (или id занят новой игрой)
+                if game is None or game['created_at'] != created_at:
+                    continue
+                del self.games[game_id]
+                self._update_open_index(game, deleted=True)
+                
+                # Отвязываем пользователей от удаленной игры
+                changed_users = []
+                for player in game['players']:
+                    user_id = str(player['id'])
+                    user_info = self.users.get(user_id)
+                    if user_info and user_info.get('current_game') == game_id:
+                        user_info['current_game'] = None
+                        changed_users.append((user_id, user_info))
+                
+                saved = self._commit(users=changed_users, deleted_games=[game_id])
+                removed += 1
         
-        # Если игра пустая, удаляем её
-        if len(game['players']) == 0:
-            del self.games[game_id]
-        else:
-            # Если игра была в процессе, возвращаем в ожидание
-            if game['status'] == 'playing':
-                game['status'] = 'waiting'
+        if not removed:
+            return 0
         
-        # Удаляем пользователя из хранилища
-        if user_id in self.users:
-            del self.users[user_id]
+        # Номера записей растут, поэтому достаточно дождаться последней
+        self.store.wait(saved)
         
-        # Сохраняем данные
-        save_storage()
+        logger.info("Удалено устаревших игр=%d осталось=%d", removed, len(self.games))
+        return removed
+
+def start_cleanup_thread(manager, interval=None):
+    """Периодически удалять устаревшие игры в фоновом потоке"""
+    interval = CLEANUP_INTERVAL if interval is None else interval
+    
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                manager.cleanup_old_games()
+            except Exception as e:
+                logger.exception("Ошибка очистки старых игр")
+    
+    thread = threading.Thread(target=run, name='lobby-cleanup', daemon=True)
+    thread.start()
+    return thread
+
+class MatchmakingQueue:
+    """Очередь подбора соперников по типу игры и рейтингу.
+
+    Для каждого типа игры хранится список заявок, отсортированный по рейтингу,
+    поэтому ближайший по рейтингу соперник находится бинарным поиском,
+    а не перебором всего лобби. Заявка живет ticket_ttl секунд с последнего
+    продления: игрок, закрывший страницу, не станет чьим-то соперником.
+    """
+    
+    def __init__(self, lobby, ticket_ttl=MATCHMAKING_TICKET_TTL):
+        self.lobby = lobby
+        self.ticket_ttl = ticket_ttl
+        self.queues = {}   # {game_type: [(rating, seq, user_id), ...]}
+        self.tickets = {}  # {user_id: ticket}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+    
+    def enqueue(self, user_id, username, game_type, rating=None, band=None):
+        """Поставить игрока в очередь; вернуть созданную игру, если соперник найден сразу"""
+        user_id = str(user_id)
+        rating = DEFAULT_RATING if rating is None else int(rating)
+        # Иначе ожидание начала игры сразу вернуло бы прежнюю начавшуюся игру
+        self.lobby.release_user(user_id)
         
-        return True, "Успешно покинули игру"
+        with self._lock:
+            self._remove(user_id)
+            queue = self.queues.setdefault(game_type, [])
+            opponent, stale = self._find_opponent(queue, rating, band)
+            for stale_user_id in stale:
+                self._remove(stale_user_id)
+            
+            if opponent is None:
+                ticket = {
+                    'key': (rating, next(self._seq), user_id),
+                    'username': username,
+                    'game_type': game_type,
+                    'band': band,
+                    'expires_at': time.monotonic() + self.ticket_ttl
+                }
+                bisect.insort(queue, ticket['key'])
+                self.tickets[user_id] = ticket
+                return None
+            
+            opponent_ticket = self._remove(opponent)
+        
+        # Ожидавший дольше игрок становится создателем игры; оба игрока
+        # добавляются одной операцией, поэтому подбор не может сорваться
+        return self.lobby.create_match(opponent, opponent_ticket['username'], user_id, username, game_type)
     
-    def cleanup_old_games(self):
-        """Очистка старых игр"""
-        print(f"DEBUG: cleanup_old_games - начинаем очистку")
-        current_time = datetime.now()
-        games_to_remove = []
+    def cancel(self, user_id):
+        """Убрать игрока из очереди"""
+        with self._lock:
+            return self._remove(str(user_id)) is not None
+    
+    def heartbeat(self, user_id):
+        """Продлить заявку игрока; False, если её нет или она уже истекла"""
+        with self._lock:
+            ticket = self.tickets.get(str(user_id))
+            if ticket is None or ticket['expires_at'] <= time.monotonic():
+                return False
+            ticket['expires_at'] = time.monotonic() + self.ticket_ttl
+            return True
+    
+    def is_queued(self, user_id):
+        """Находится ли игрок в очереди"""
+        ticket = self.tickets.get(str(user_id))
+        return ticket is not None and ticket['expires_at'] > time.monotonic()
+    
+    def _find_opponent(self, queue, rating, band):
+        """Найти ближайшего по рейтингу соперника, подходящего под оба диапазона.
+
+        Возвращает (user_id соперника или None, истекшие заявки, встреченные по пути).
+        """
+        now = time.monotonic()
+        stale = []
+        position = bisect.bisect_left(queue, (rating,))
+        left, right = position - 1, position
         
-        for game_id, game in self.games.items():
-            created_time = datetime.fromisoformat(game['created_at'])
-            time_diff = (current_time - created_time).seconds
-            print(f"DEBUG: Игра {game_id} создана {time_diff} секунд назад")
+        while left >= 0 or right < len(queue):
+            # Берем ближайшую по рейтингу заявку; равные по рейтингу идут от ранних к поздним
+            if right >= len(queue) or (left >= 0 and rating - queue[left][0] <= queue[right][0] - rating):
+                candidate = queue[left]
+                left -= 1
+            else:
+                candidate = queue[right]
+                right += 1
+            
+            distance = abs(candidate[0] - rating)
+            if band is not None and distance > band:
+                return None, stale
             
-            if time_diff > 3600:  # 1 час
-                games_to_remove.append(game_id)
-                print(f"DEBUG: Игра {game_id} будет удалена (старше 1 часа)")
+            candidate_ticket = self.tickets[candidate[2]]
+            if candidate_ticket['expires_at'] <= now:
+                stale.append(candidate[2])
+                continue
+            
+            candidate_band = candidate_ticket['band']
+            if candidate_band is None or distance <= candidate_band:
+                return candidate[2], stale
         
-        for game_id in games_to_remove:
-            del self.games[game_id]
-            print(f"DEBUG: Игра {game_id} удалена")
+        return None, stale
+    
+    def _remove(self, user_id):
+        """Удалить заявку игрока и вернуть её (вызывается под блокировкой)"""
+        ticket = self.tickets.pop(user_id, None)
+        if ticket is None:
+            return None
         
-        print(f"DEBUG: Очистка завершена, осталось игр: {len(self.games)}")
-        save_storage() # Добавляем сохранение после очистки
+        queue = self.queues[ticket['game_type']]
+        index = bisect.bisect_left(queue, ticket['key'])
+        del queue[index]
+        return ticket
 
 # Создаем менеджер лобби
-lobby_manager = LobbyManager()
+lobby_manager = LobbyManager(create_store())
+matchmaking = MatchmakingQueue(lobby_manager)
+start_cleanup_thread(lobby_manager)
 
 @app.route('/')
 def index():
@@ -252,29 +956,142 @@ def index():
             '/api/lobby/create',
             '/api/lobby/join',
             '/api/lobby/game/<game_id>',
-            '/api/lobby/leave'
+            '/api/lobby/leave',
+            '/api/lobby/matchmaking/join',
+            '/api/lobby/matchmaking/cancel',
+            '/api/lobby/user/<user_id>/wait',
+            '/api/lobby/storage/stats',
+            '/api/lobby/events'
         ]
     })
 
+def not_modified():
+    """Ответ 304, если клиент прислал ETag текущей версии лобби, иначе None"""
+    etag = str(lobby_manager.version)
+    if not request.if_none_match.contains(etag):
+        return None
+    
+    response = app.response_class(status=304)
+    return with_version(response, etag)
+
+def with_version(response, etag=None):
+    """Добавить к ответу ETag и Last-Modified версии лобби"""
+    response.set_etag(etag or str(lobby_manager.version))
+    response.last_modified = lobby_manager.last_modified
+    # Клиент может кешировать ответ, но обязан перепроверять его по ETag
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def sse_event(event, data, event_id=None):
+    """Сформировать одно событие Server-Sent Events"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+def lobby_event_stream(since, game_type=None, max_duration=SSE_MAX_DURATION):
+    """Генератор SSE-событий об изменениях списка открытых игр"""
+    # Клиент переподключится сам и продолжит с последнего id
+    yield "retry: 3000\n\n"
+    
+    version = since
+    if version is None or lobby_manager.get_changes_since(version, game_type) is None:
+        version = lobby_manager.version
+        games, _ = lobby_manager.get_available_games(game_type)
+        yield sse_event('snapshot', {'version': version, 'games': games}, version)
+    
+    deadline = time.monotonic() + max_duration
+    while time.monotonic() < deadline:
+        new_version = lobby_manager.wait_for_change(version, min(SSE_KEEPALIVE, deadline - time.monotonic()))
+        if new_version == version:
+            yield ": keep-alive\n\n"
+            continue
+        
+        changes = lobby_manager.get_changes_since(version, game_type)
+        version = new_version
+        if changes is None:
+            # Подписчик отстал больше, чем хранит журнал
+            games, _ = lobby_manager.get_available_games(game_type)
+            yield sse_event('snapshot', {'version': version, 'games': games}, version)
+            continue
+        
+        added, removed = changes
+        for game in added:
+            yield sse_event('game_created', game, version)
+        for game_id in removed:
+            game = lobby_manager.get_game_info(game_id)
+            event = 'game_filled' if game and game['status'] == 'playing' else 'game_removed'
+            yield sse_event(event, {'id': game_id}, version)
+
+@app.route('/api/lobby/events', methods=['GET'])
+def lobby_events():
+    """Поток Server-Sent Events с изменениями лобби вместо периодического опроса"""
+    if not LOBBY_SSE_ENABLED:
+        # 204: EventSource закрывается без переподключения, страница опрашивает /games
+        return app.response_class(status=204)
+    
+    since = request.args.get('since', type=int)
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    
+    response = Response(
+        stream_with_context(lobby_event_stream(since, request.args.get('type'))),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/api/lobby/games', methods=['GET'])
 def get_games():
     """Получить список доступных игр"""
     try:
-        print(f"DEBUG: Запрос списка игр")
-        
-        # Очищаем старые игры
+        # Удаляем истекшие игры: без них это O(1) (на serverless фоновый поток может не работать)
         lobby_manager.cleanup_old_games()
         
-        games = lobby_manager.get_available_games()
-        print(f"DEBUG: Найдено игр: {len(games)}")
+        cached = not_modified()
+        if cached:
+            return cached
         
-        return jsonify({
+        # Версию берем до построения ответа: при гонке клиент лишь перезапросит список
+        version = lobby_manager.version
+        game_type = request.args.get('type')
+        since = request.args.get('since', type=int)
+        
+        if since is not None:
+            changes = lobby_manager.get_changes_since(since, game_type)
+            if changes is not None:
+                added, removed = changes
+                return with_version(jsonify({
+                    'status': 'ok',
+                    'full': False,
+                    'version': version,
+                    'added': added,
+                    'removed': removed
+                }), str(version))
+        
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit', type=int)
+        if limit is not None:
+            limit = max(1, min(limit, MAX_PAGE_SIZE))
+        
+        games, next_cursor = lobby_manager.get_available_games(game_type, limit, cursor)
+        debug_sampled("Список игр count=%d type=%s cursor=%s", len(games), game_type, cursor)
+        
+        return with_version(jsonify({
             'status': 'ok',
+            'full': True,
+            'version': version,
             'games': games,
-            'count': len(games)
-        })
+            'count': len(games),
+            'total': lobby_manager.count_available_games(game_type),
+            'next_cursor': next_cursor
+        }), str(version))
     except Exception as e:
-        print(f"DEBUG: Ошибка при получении игр: {str(e)}")
+        logger.exception("Ошибка при получении игр")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/lobby/create', methods=['POST'])
@@ -286,18 +1103,19 @@ def create_game():
         username = data.get('username')
         game_type = data.get('game_type', 'chess')
         
-        print(f"DEBUG: Создание игры - user_id: {user_id}, username: {username}, game_type: {game_type}")
-        
         if not user_id or not username:
-            print(f"DEBUG: Ошибка - отсутствуют user_id или username")
+            logger.debug("Создание игры без user_id или username")
             return jsonify({'error': 'user_id и username обязательны'}), 400
         
         # Приводим user_id к строке
         user_id = str(user_id)
         
+        # Создавший свою игру больше не ждет подбора
+        matchmaking.cancel(user_id)
+        
         game_info = lobby_manager.create_game(user_id, username, game_type)
         
-        print(f"DEBUG: Игра создана успешно - game_id: {game_info['id']}")
+        logger.info("Игра создана game_id=%s user_id=%s type=%s", game_info['id'], user_id, game_type)
         
         return jsonify({
             'status': 'ok',
@@ -305,7 +1123,7 @@ def create_game():
             'game': game_info
         })
     except Exception as e:
-        print(f"DEBUG: Ошибка при создании игры: {str(e)}")
+        logger.exception("Ошибка при создании игры")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/lobby/join', methods=['POST'])
@@ -317,10 +1135,8 @@ def join_game():
         username = data.get('username')
         game_id = data.get('game_id')
         
-        print(f"DEBUG: Присоединение к игре - user_id: {user_id}, username: {username}, game_id: {game_id}")
-        
         if not user_id or not username or not game_id:
-            print(f"DEBUG: Ошибка - отсутствуют обязательные параметры")
+            logger.debug("Присоединение без обязательных параметров")
             return jsonify({'error': 'user_id, username и game_id обязательны'}), 400
         
         # Приводим user_id к строке
@@ -328,7 +1144,7 @@ def join_game():
         
         game_info, message = lobby_manager.join_game(user_id, username, game_id)
         
-        print(f"DEBUG: Результат присоединения - game_info: {game_info is not None}, message: {message}")
+        logger.info("Присоединение game_id=%s user_id=%s ok=%s: %s", game_id, user_id, game_info is not None, message)
         
         if game_info is None:
             return jsonify({'error': message}), 400
@@ -339,7 +1155,7 @@ def join_game():
             'game': game_info
         })
     except Exception as e:
-        print(f"DEBUG: Ошибка при присоединении к игре: {str(e)}")
+        logger.exception("Ошибка при присоединении к игре")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/lobby/game/<game_id>', methods=['GET'])
@@ -382,7 +1198,7 @@ def create_user():
             'username': username
         })
     except Exception as e:
-        print(f"DEBUG: Ошибка при создании пользователя: {str(e)}")
+        logger.exception("Ошибка при создании пользователя")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/lobby/user/<user_id>', methods=['GET'])
@@ -392,53 +1208,54 @@ def get_user_game(user_id):
         # Приводим user_id к строке
         user_id = str(user_id)
         
-        print(f"DEBUG: Запрос информации о пользователе {user_id}")
-        print(f"DEBUG: Всего пользователей в системе: {len(lobby_manager.users)}")
-        print(f"DEBUG: Пользователи: {list(lobby_manager.users.keys())}")
+        cached = not_modified()
+        if cached:
+            return cached
+        etag = str(lobby_manager.version)
         
         user_info = lobby_manager.users.get(user_id)
         
         if not user_info:
-            print(f"DEBUG: Пользователь {user_id} не найден в системе")
-            return jsonify({
+            debug_sampled("Пользователь не найден user_id=%s", user_id)
+            return with_version(jsonify({
                 'status': 'not_found',
                 'message': 'Пользователь не найден в системе',
                 'user_id': user_id,
                 'has_active_game': False
-            }), 200  # Возвращаем 200 вместо 404 для лучшего UX
+            }), etag)  # Возвращаем 200 вместо 404 для лучшего UX
         
         if not user_info.get('current_game'):
-            print(f"DEBUG: У пользователя {user_id} нет активной игры")
-            return jsonify({
+            debug_sampled("Нет активной игры user_id=%s", user_id)
+            return with_version(jsonify({
                 'status': 'no_game',
                 'message': 'У пользователя нет активной игры',
                 'user_id': user_id,
                 'username': user_info.get('username'),
                 'has_active_game': False
-            }), 200
+            }), etag)
         
         game_id = user_info['current_game']
         game_info = lobby_manager.get_game_info(game_id)
         
         if not game_info:
-            print(f"DEBUG: Игра {game_id} не найдена для пользователя {user_id}")
-            return jsonify({
+            logger.debug("Игра пользователя не найдена user_id=%s game_id=%s", user_id, game_id)
+            return with_version(jsonify({
                 'status': 'game_not_found',
                 'message': 'Игра не найдена',
                 'user_id': user_id,
                 'game_id': game_id,
                 'has_active_game': False
-            }), 200
+            }), etag)
         
-        print(f"DEBUG: Найдена активная игра {game_id} для пользователя {user_id}")
-        return jsonify({
+        debug_sampled("Активная игра user_id=%s game_id=%s", user_id, game_id)
+        return with_version(jsonify({
             'status': 'ok',
             'game': game_info,
             'user_id': user_id,
             'has_active_game': True
-        })
+        }), etag)
     except Exception as e:
-        print(f"DEBUG: Ошибка при получении информации о пользователе {user_id}: {str(e)}")
+        logger.exception("Ошибка при получении информации о пользователе user_id=%s", user_id)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/lobby/leave', methods=['POST'])
@@ -467,6 +1284,103 @@ def leave_game():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/lobby/storage/stats', methods=['GET'])
+def storage_stats():
+    """Метрики хранилища лобби"""
+    return jsonify({
+        'status': 'ok',
+        'storage': lobby_manager.store.stats()
+    })
+
+@app.route('/api/lobby/matchmaking/join', methods=['POST'])
+def matchmaking_join():
+    """Встать в очередь подбора соперника"""
+    try:
+        data = request.get_json()
+        user_id = data.get('user_id')
+        username = data.get('username')
+        game_type = data.get('game_type', 'chess')
+        rating = data.get('rating')
+        band = data.get('rating_band')
+        
+        if not user_id or not username:
+            return jsonify({'error': 'user_id и username обязательны'}), 400
+        
+        try:
+            rating = int(rating) if rating is not None else None
+            band = int(band) if band is not None else None
+        except (TypeError, ValueError, OverflowError):
+            return jsonify({'error': 'rating и rating_band должны быть целыми числами'}), 400
+        if band is not None and band < 0:
+            return jsonify({'error': 'rating_band не может быть отрицательным'}), 400
+        
+        # Приводим user_id к строке
+        user_id = str(user_id)
+        
+        game_info = matchmaking.enqueue(user_id, username, game_type, rating=rating, band=band)
+        
+        if game_info is None:
+            return jsonify({
+                'status': 'ok',
+                'matched': False,
+                'message': 'Поиск соперника...'
+            })
+        
+        return jsonify({
+            'status': 'ok',
+            'matched': True,
+            'message': 'Соперник найден',
+            'game': game_info
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/lobby/matchmaking/cancel', methods=['POST'])
+def matchmaking_cancel():
+    """Выйти из очереди подбора соперника"""
+    try:
+        # sendBeacon при закрытии страницы присылает JSON как text/plain
+        data = request.get_json(force=True)
+        user_id = data.get('user_id')
+        
+        if not user_id:
+            return jsonify({'error': 'user_id обязателен'}), 400
+        
+        removed = matchmaking.cancel(user_id)
+        
+        return jsonify({
+            'status': 'ok',
+            'cancelled': removed
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/lobby/user/<user_id>/wait', methods=['GET'])
+def wait_for_game(user_id):
+    """Long-poll: ответить, как только игра пользователя начнется"""
+    try:
+        timeout = min(float(request.args.get('timeout', LONG_POLL_TIMEOUT)), LONG_POLL_TIMEOUT)
+        # Ожидающий игрок жив: продлеваем его заявку подбора
+        matchmaking.heartbeat(user_id)
+        game_info = lobby_manager.wait_for_game_start(user_id, timeout)
+        
+        if not game_info:
+            return jsonify({
+                'status': 'waiting',
+                'user_id': str(user_id),
+                'queued': matchmaking.is_queued(user_id),
+                'has_active_game': False
+            })
+        
+        return jsonify({
+            'status': 'ok',
+            'game': game_info,
+            'user_id': str(user_id),
+            'has_active_game': True
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # Export the Flask app for Vercel
 app.debug = False
 
@@ -1,8 +1,13 @@
 from flask import Flask, request, jsonify
 import os
+import atexit
+import asyncio
 import logging
+import threading
+from collections import deque
 from telegram import Update, WebAppInfo, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+from api._bot_runtime import BOT_CALL_TIMEOUT, WEBHOOK_DEDUP_SIZE, BotRuntime, RecentUpdateIds, update_chat_key
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
@@ -21,6 +26,125 @@ app = Flask(__name__)
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', 'YOUR_BOT_TOKEN_HERE')
 WEBAPP_URL = os.getenv('WEBAPP_URL', 'https://your-app-name.vercel.app')
 
+# Очередь обновлений: размер, число одновременных обработчиков и пауза перед
+# повторной доставкой, которую просим у Telegram при переполнении (секунды)
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 100))
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 8))
+WEBHOOK_RETRY_AFTER = int(os.getenv('WEBHOOK_RETRY_AFTER', 5))
+
+class UpdateQueue(BotRuntime):
+    """Ограниченная очередь обновлений в постоянном цикле событий.
+
+    Обновления разбирают WEBHOOK_WORKERS обработчиков, поэтому пропускная
+    способность webhook предсказуема, а при заполненной очереди обновление
+    не теряется: Telegram получает 503 и повторяет доставку.
+
+    Повторные доставки с уже принятым update_id отбрасываются. Обновления
+    одного чата обрабатываются по порядку: пока чат занят, его следующие
+    обновления ждут в почтовом ящике чата и не занимают других обработчиков.
+    """
+    
+    def __init__(self, application, workers=WEBHOOK_WORKERS, maxsize=WEBHOOK_QUEUE_SIZE,
+                 dedup_size=WEBHOOK_DEDUP_SIZE):
+        self.application = application
+        self.recent_ids = RecentUpdateIds(dedup_size)
+        self.mailboxes = {}  # {chat_key: deque обновлений, ждущих занятый чат}
+        self.parked = 0  # Сколько обновлений ждет в почтовых ящиках
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='webhook-loop', daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(workers, maxsize), self.loop).result()
+        atexit.register(self.close)
+    
+    async def _start(self, workers, maxsize):
+        """Создать очередь и обработчики внутри цикла"""
+        self.queue = asyncio.Queue(maxsize)
+        self.initialized = asyncio.ensure_future(self.application.initialize())
+        self.workers = [asyncio.ensure_future(self._worker()) for _ in range(workers)]
+    
+    async def _worker(self):
+        """Обрабатывать обновления из очереди по одному"""
+        while True:
+            update = await self.queue.get()
+            try:
+                key = update_chat_key(update)
+                if key in self.mailboxes:
+                    # Чат уже обрабатывается: обновление дождется своей очереди там
+                    self.mailboxes[key].append(update)
+                    self.parked += 1
+                else:
+                    await self._process_chat(key, update)
+            finally:
+                self.queue.task_done()
+    
+    async def _process_chat(self, key, update):
+        """Обработать обновление и всё, что пришло в этот чат за время обработки"""
+        if key is None:
+            await self._process(update)
+            return
+        
+        mailbox = self.mailboxes[key] = deque()
+        try:
+            while True:
+                await self._process(update)
+                if not mailbox:
+                    break
+                update = mailbox.popleft()
+                self.parked -= 1
+        finally:
+            self.parked -= len(mailbox)
+            del self.mailboxes[key]
+    
+    async def _ready(self):
+        """Дождаться однократной инициализации Application"""
+        await self.initialized
+    
+    async def _process(self, update):
+        """Передать обновление в Application"""
+        try:
+            await self._ready()
+            await self.application.process_update(update)
+        except Exception as e:
+            logger.error(f"Error processing update: {e}")
+    
+    async def _offer(self, update):
+        """Положить обновление в очередь без ожидания"""
+        update_id = getattr(update, 'update_id', None)
+        if update_id in self.recent_ids:
+            logger.info(f"Duplicate update {update_id} dropped")
+            return True
+        
+        # Ждущие в почтовых ящиках тоже занимают место в очереди
+        if self.queue.qsize() + self.parked >= self.queue.maxsize:
+            return False
+        self.queue.put_nowait(update)
+        self.recent_ids.add(update_id)
+        return True
+    
+    def offer(self, update):
+        """Поставить обновление в очередь (повтор принимается без обработки); False - очередь заполнена"""
+        return asyncio.run_coroutine_threadsafe(self._offer(update), self.loop).result(BOT_CALL_TIMEOUT)
+    
+    async def _stop(self):
+        """Отменить обработчики и незавершенную инициализацию"""
+        tasks = self.workers + [self.initialized]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def close(self):
+        """Остановить обработчики и цикл событий"""
+        if self.loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self._stop(), self.loop).result(BOT_CALL_TIMEOUT)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+    
+    def qsize(self):
+        """Число принятых, но еще не начатых обновлений"""
+        return self.queue.qsize() + self.parked
+
 # Создаем приложение бота
 if BOT_TOKEN and BOT_TOKEN != 'YOUR_BOT_TOKEN_HERE':
     application = Application.builder().token(BOT_TOKEN).build()
@@ -126,8 +250,10 @@ if BOT_TOKEN and BOT_TOKEN != 'YOUR_BOT_TOKEN_HERE':
 
     # Настраиваем обработчики
     setup_handlers()
+    update_queue = UpdateQueue(application)
 else:
     application = None
+    update_queue = None
     logger.warning("Bot token not configured!")
 
 @app.route('/webhook', methods=['POST'])
@@ -140,8 +266,12 @@ def webhook():
         # Получаем данные от Telegram
         update = Update.de_json(request.get_json(), application.bot)
         
-        # Обрабатываем обновление
-        application.process_update(update)
+        # Обновление обработают воркеры; при переполнении Telegram повторит доставку
+        if not update_queue.offer(update):
+            logger.warning(f"Update queue is full ({update_queue.qsize()}), asking Telegram to retry")
+            response = jsonify({'error': 'Update queue is full'})
+            response.headers['Retry-After'] = str(WEBHOOK_RETRY_AFTER)
+            return response, 503
         
         return jsonify({'status': 'ok'}), 200
     except Exception as e:
@@ -159,7 +289,7 @@ def setup_webhook():
         webhook_url = f"{WEBAPP_URL}/api/webhook"
         
         # Устанавливаем webhook
-        result = application.bot.set_webhook(url=webhook_url)
+        result = update_queue.call(lambda: application.bot.set_webhook(url=webhook_url))
         
         return jsonify({
             'status': 'ok',
@@ -177,7 +307,7 @@ def webhook_status():
         return jsonify({'error': 'Bot not configured'}), 400
     
     try:
-        webhook_info = application.bot.get_webhook_info()
+        webhook_info = update_queue.call(application.bot.get_webhook_info)
         return jsonify({
             'status': 'ok',
             'webhook_info': webhook_info.to_dict()
@@ -193,6 +323,7 @@ def index():
         'message': 'Telegram Bot Webhook API',
         'status': 'running',
         'bot_configured': bool(application),
+        'queue_size': update_queue.qsize() if update_queue else None,
         'webhook_url': f"{WEBAPP_URL}/api/webhook" if application else None
     })
 
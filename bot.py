@@ -1,8 +1,13 @@
+import os
+import asyncio
 import logging
-from telegram import Update, InlineKeyboardMarkup
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 from config import BOT_TOKEN, BOT_NAME
-from game_logic import QuizGame
+from game_data import QUIZ_QUESTIONS
+from game_logic import QuizGame, QUIZ_SESSION_TTL, QUIZ_GROUP_ROUND_SECONDS
+from question_bank import QuestionBank, QUIZ_BANK_FILE
+from quiz_store import SqliteQuizStore, QUIZ_DB_FILE
 
 # Настройка логирования
 logging.basicConfig(
@@ -11,13 +16,25 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Создаем экземпляр игры
-quiz_game = QuizGame()
+# Период проверки брошенных игр (секунды)
+QUIZ_EXPIRY_INTERVAL = int(os.getenv('QUIZ_EXPIRY_INTERVAL', 60))
+
+# Кнопка начала игры одна на все приветствия
+START_GAME_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("🎮 Начать игру", callback_data="start_game")]])
+
+# Создаем экземпляр игры; счета и незавершенные игры переживают перезапуск
+quiz_questions = QuestionBank(QUIZ_BANK_FILE) if QUIZ_BANK_FILE else QUIZ_QUESTIONS
+quiz_game = QuizGame(quiz_questions, store=SqliteQuizStore(QUIZ_DB_FILE))
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик команды /start"""
+    """Обработчик команды /start (/start <категория> - сразу начать игру по категории)"""
     user = update.effective_user
     
+    if context.args:
+        text, reply_markup = quiz_game.start_game(user.id, category=' '.join(context.args))
+        await update.message.reply_text(text, reply_markup=reply_markup)
+        return
+    
     welcome_text = f"""
 🎮 Привет, {user.first_name}! 
 
@@ -29,6 +46,8 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 Команды:
 /start - Начать новую игру
+/start <категория> - Игра по одной категории
+/quiz - Вопрос для всех в групповом чате
 /stats - Ваша статистика
 /leaderboard - Таблица лидеров
 /help - Помощь
@@ -36,12 +55,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 Нажмите кнопку ниже, чтобы начать игру!
     """.strip()
     
-    # Создаем кнопку для начала игры
-    from telegram import InlineKeyboardButton
-    keyboard = [[InlineKeyboardButton("🎮 Начать игру", callback_data="start_game")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.message.reply_text(welcome_text, reply_markup=reply_markup)
+    await update.message.reply_text(welcome_text, reply_markup=START_GAME_MARKUP)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /help"""
@@ -54,6 +68,10 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 3. За каждый правильный ответ получаете 1 очко
 4. В конце игры увидите свой результат
 
+👥 В групповом чате:
+• /quiz задает вопрос всем участникам
+• Ответы принимаются {round_seconds} секунд, затем бот покажет итоги
+
 📊 Статистика:
 • Ваш общий счет сохраняется между играми
 • Используйте /stats для просмотра ваших результатов
@@ -65,7 +83,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Изучайте объяснения к неправильным ответам
 
 Удачи в игре! 🍀
-    """.strip()
+    """.strip().format(round_seconds=QUIZ_GROUP_ROUND_SECONDS)
     
     await update.message.reply_text(help_text)
 
@@ -79,10 +97,13 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 👤 Пользователь: {update.effective_user.first_name}
 🎯 Общий счет: {stats['total_score']} очков
-🎮 Игр сыграно: {stats['games_played']}
+🎮 Игр сыграно: {stats['games_played']} (до конца: {stats['games_completed']})
+✅ Правильных ответов: {stats['correct_answers']} из {stats['answers']}
+🔥 Лучшая серия: {stats['best_streak']}
+⏱ Среднее время ответа: {stats['average_answer_time']:.1f} с
 🎲 Текущая игра: {'Да' if stats['current_game'] else 'Нет'}
 
-🏆 Ваша позиция в рейтинге: {quiz_game.get_leaderboard().index((user_id, stats['total_score'])) + 1 if (user_id, stats['total_score']) in quiz_game.get_leaderboard() else 'Не в топе'}
+🏆 Ваша позиция в рейтинге: {f"{stats['rank']} из {stats['players']}" if stats['rank'] else 'Нет в рейтинге'}
     """.strip()
     
     await update.message.reply_text(stats_text)
@@ -96,8 +117,20 @@ async def leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     leaderboard_text = "🏆 Таблица лидеров\n\n"
+    rows = [(i, user_id, score) for i, (user_id, score) in enumerate(leaderboard, 1)]
+    
+    # Если пользователь не в топе, показываем и его соседей по рейтингу
+    own_rank = quiz_game.get_user_rank(update.effective_user.id)
+    if own_rank and own_rank > len(leaderboard):
+        rows.append(None)
+        rows.extend(quiz_game.get_leaderboard_around(update.effective_user.id))
     
-    for i, (user_id, score) in enumerate(leaderboard, 1):
+    for row in rows:
+        if row is None:
+            leaderboard_text += "...\n"
+            continue
+        
+        i, user_id, score = row
         # Получаем информацию о пользователе
         try:
             user = await context.bot.get_chat(user_id)
@@ -110,33 +143,93 @@ async def leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     await update.message.reply_text(leaderboard_text)
 
+async def quiz_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /quiz: вопрос для всех участников группового чата"""
+    chat = update.effective_chat
+    if chat.type == chat.PRIVATE:
+        await update.message.reply_text("👥 /quiz работает в групповых чатах. Для личной игры используйте /start")
+        return
+    
+    text, reply_markup = quiz_game.start_group_round(chat.id, category=' '.join(context.args) or None)
+    if reply_markup is None:
+        await update.message.reply_text(text)
+        return
+    
+    try:
+        message = await update.message.reply_text(text, reply_markup=reply_markup)
+    except Exception:
+        # Вопрос не отправлен - раунд не должен занимать чат
+        quiz_game.group_rounds.pop(chat.id, None)
+        raise
+    
+    quiz_game.group_rounds[chat.id].message_id = message.message_id
+    schedule_group_round_close(context, chat.id)
+
+def schedule_group_round_close(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
+    """Запланировать закрытие раунда по окончании окна ответов"""
+    if context.job_queue is not None:
+        context.job_queue.run_once(close_group_round_job, QUIZ_GROUP_ROUND_SECONDS, chat_id=chat_id)
+        return
+    
+    async def close_later():
+        await asyncio.sleep(QUIZ_GROUP_ROUND_SECONDS)
+        await close_group_round(context.bot, chat_id)
+    
+    context.application.create_task(close_later())
+
+async def close_group_round_job(context: ContextTypes.DEFAULT_TYPE):
+    """Задача JobQueue: закрыть раунд в чате"""
+    await close_group_round(context.bot, context.job.chat_id)
+
+async def close_group_round(bot, chat_id: int):
+    """Подвести итоги раунда и показать их одним редактированием сообщения"""
+    group_round = quiz_game.group_rounds.get(chat_id)
+    if group_round is None:
+        return
+    
+    message_id = group_round.message_id
+    text = quiz_game.close_group_round(chat_id)
+    await bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id)
+
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик нажатий на кнопки"""
     query = update.callback_query
+    
+    if query.data.startswith("group_answer_"):
+        # Ответ в групповом раунде только учитывается: сообщение правится один раз при закрытии
+        answer_index = int(query.data.rsplit("_", 1)[1])
+        notice = quiz_game.record_group_answer(update.effective_chat.id, query.from_user.id, answer_index)
+        await query.answer(notice)
+        return
+    
     await query.answer()  # Убираем "часики" у кнопки
     
     user_id = query.from_user.id
     
     if query.data == "start_game":
         # Начинаем новую игру
-        text, keyboard = quiz_game.start_game(user_id)
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        text, reply_markup = quiz_game.start_game(user_id)
         
         await query.edit_message_text(text=text, reply_markup=reply_markup)
     
     elif query.data.startswith("answer_"):
         # Обрабатываем ответ
         answer_index = int(query.data.split("_")[1])
-        text, keyboard, is_finished = quiz_game.process_answer(user_id, answer_index)
+        text, reply_markup, is_finished = quiz_game.process_answer(user_id, answer_index)
         
         if is_finished:
             # Игра окончена, убираем клавиатуру
             await query.edit_message_text(text=text)
         else:
             # Показываем следующий вопрос
-            reply_markup = InlineKeyboardMarkup(keyboard)
             await query.edit_message_text(text=text, reply_markup=reply_markup)
 
+async def expire_sessions_job(context: ContextTypes.DEFAULT_TYPE):
+    """Периодическая задача: удалить игры, брошенные дольше QUIZ_SESSION_TTL"""
+    expired = quiz_game.expire_idle_sessions()
+    if expired:
+        logger.info(f"Удалено брошенных игр: {expired}, активных: {len(quiz_game.active_games)}")
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик ошибок"""
     logger.error(f"Exception while handling an update: {context.error}")
@@ -157,6 +250,7 @@ def main():
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("stats", stats_command))
     application.add_handler(CommandHandler("leaderboard", leaderboard_command))
+    application.add_handler(CommandHandler("quiz", quiz_command))
     
     # Добавляем обработчик нажатий на кнопки
     application.add_handler(CallbackQueryHandler(button_callback))
@@ -164,6 +258,15 @@ def main():
     # Добавляем обработчик ошибок
     application.add_error_handler(error_handler)
     
+    # Брошенные игры удаляются периодической задачей
+    if application.job_queue is not None:
+        application.job_queue.run_repeating(expire_sessions_job, interval=QUIZ_EXPIRY_INTERVAL, first=QUIZ_EXPIRY_INTERVAL)
+    else:
+        logger.warning(
+            f"JobQueue недоступна (pip install 'python-telegram-bot[job-queue]'): "
+            f"брошенные игры не будут удаляться через {QUIZ_SESSION_TTL} с"
+        )
+    
     # Запускаем бота
     logger.info(f"Бот {BOT_NAME} запущен!")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
@@ -49,6 +49,7 @@ class CheckersGame:
         self.winner = None
         self.must_capture = False
         self.capture_chain = []
+        self.time_out = False
     
     def _initialize_board(self) -> List[List[Optional[Checker]]]:
         """Инициализирует начальную расстановку шашек"""
@@ -338,6 +339,12 @@ class CheckersGame:
             self.game_over = True
             self.winner = CheckerColor.BLACK if self.current_turn == CheckerColor.WHITE else CheckerColor.WHITE
     
+    def lose_on_time(self, color: CheckerColor):
+        """Завершает игру поражением стороны, у которой истекло время"""
+        self.time_out = True
+        self.game_over = True
+        self.winner = CheckerColor.BLACK if color == CheckerColor.WHITE else CheckerColor.WHITE
+    
     def _position_to_notation(self, pos: Tuple[int, int]) -> str:
         """Преобразует позицию в нотацию"""
         row, col = pos
@@ -347,6 +354,8 @@ class CheckersGame:
         """Возвращает текущий статус игры"""
         if self.game_over:
             winner_name = "Белые" if self.winner == CheckerColor.WHITE else "Черные"
+            if self.time_out:
+                return f"⏰ Время вышло! {winner_name} победили!"
             return f"🏁 Игра окончена! {winner_name} победили!"
         elif self.must_capture:
             current_player = "Белые" if self.current_turn == CheckerColor.WHITE else "Черные"
@@ -366,6 +375,7 @@ class CheckersGame:
             'game_over': self.game_over,
             'winner': self.winner.value if self.winner else None,
             'must_capture': self.must_capture,
+            'time_out': self.time_out,
             'moves_count': len(self.game_history),
             'status': self.get_game_status()
         } 
\ No newline at end of file
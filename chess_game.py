@@ -54,6 +54,7 @@ class ChessGame:
         self.check = False
         self.checkmate = False
         self.stalemate = False
+        self.time_out = False
     
     def _initialize_board(self) -> List[List[Optional[ChessPiece]]]:
         """Инициализирует начальную расстановку фигур"""
@@ -408,6 +409,12 @@ class ChessGame:
         
         return True
     
+    def lose_on_time(self, color: Color):
+        """Завершает игру поражением стороны, у которой истекло время"""
+        self.time_out = True
+        self.game_over = True
+        self.winner = Color.BLACK if color == Color.WHITE else Color.WHITE
+    
     def _position_to_notation(self, pos: Tuple[int, int]) -> str:
         """Преобразует позицию в шахматную нотацию"""
         row, col = pos
@@ -421,6 +428,9 @@ class ChessGame:
                 return f"🏁 Мат! {winner_name} победили!"
             elif self.stalemate:
                 return "🤝 Пат! Ничья!"
+            elif self.time_out:
+                winner_name = "Белые" if self.winner == Color.WHITE else "Черные"
+                return f"⏰ Время вышло! {winner_name} победили!"
         elif self.check:
             return "⚠️ Шах!"
         else:
@@ -449,6 +459,7 @@ class ChessGame:
             'check': self.check,
             'checkmate': self.checkmate,
             'stalemate': self.stalemate,
+            'time_out': self.time_out,
             'moves_count': len(self.game_history),
             'status': self.get_game_status()
         } 
\ No newline at end of file
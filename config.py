@@ -6,6 +6,10 @@ load_dotenv()
 
 # Конфигурация Telegram бота
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', 'YOUR_BOT_TOKEN_HERE')
+
+# Конфигурация бота-викторины (bot.py)
+BOT_TOKEN = TELEGRAM_BOT_TOKEN
+BOT_NAME = os.getenv('BOT_NAME', 'Quiz Bot')
 WEBAPP_URL = os.getenv('WEBAPP_URL', 'http://localhost:5000')
 
 # Конфигурация Flask приложения
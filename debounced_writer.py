@@ -0,0 +1,59 @@
+import time
+import atexit
+import threading
+from typing import Callable
+
+class DebouncedWriter:
+    """Фоновый поток, сохраняющий накопленные изменения не чаще раза в interval секунд.
+
+    Владелец меняет свои несохраненные данные под writer.cond и вызывает
+    wake(). Поток ждет, пока pending() не станет истинным, выжидает остаток
+    интервала и вызывает flush() владельца уже без блокировки. close()
+    останавливает поток и вызывает flush() в последний раз.
+
+    На writer.cond могут ждать и потоки владельца (например, сохранения
+    своей записи), поэтому поток будится через notify_all.
+    """
+
+    def __init__(self, flush: Callable[[], None], pending: Callable[[], bool], interval: float,
+                 name: str, delay_first: bool = False):
+        self.flush = flush
+        self.pending = pending
+        self.interval = interval
+        self.name = name
+        # True - первая запись тоже ждет интервал (изменения при старте приходят пачкой)
+        self.delay_first = delay_first
+        self.cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+
+    def wake(self):
+        """Запустить поток при первой записи и разбудить его (под self.cond)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        self.cond.notify_all()
+
+    def _run(self):
+        """Дождаться изменений и вызвать flush() не чаще интервала"""
+        last_flush = time.monotonic() if self.delay_first else float('-inf')
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending() or self._closed)
+                delay = last_flush + self.interval - time.monotonic()
+                # Остаток интервала ждем, но закрытие прерывает ожидание: последний flush() за close()
+                if self.cond.wait_for(lambda: self._closed, max(delay, 0)):
+                    return
+
+            self.flush()
+            last_flush = time.monotonic()
+
+    def close(self):
+        """Остановить поток и сохранить оставшиеся изменения"""
+        with self.cond:
+            self._closed = True
+            self.cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
@@ -0,0 +1,132 @@
+import math
+import heapq
+import itertools
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Контроли времени: (основное время в секундах, добавление за ход в секундах)
+TIME_CONTROLS = {
+    'bullet': (60, 0),
+    'blitz': (180, 2),
+    'rapid': (600, 5),
+    'classical': (1800, 20)
+}
+
+# Пределы пользовательского контроля времени: основное время и добавление (секунды)
+MAX_BASE_SECONDS = 24 * 3600
+MAX_INCREMENT_SECONDS = 600
+
+def parse_time_control(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Разбирает контроль времени: имя из TIME_CONTROLS или строку вида '5+3' (минуты+секунды)"""
+    if not value:
+        return None
+
+    if value in TIME_CONTROLS:
+        return TIME_CONTROLS[value]
+
+    try:
+        minutes, increment = value.split('+')
+        minutes = float(minutes)
+        increment = int(increment)
+    except ValueError:
+        return None
+
+    # inf, nan и гигантские значения не должны доходить до часов
+    if not math.isfinite(minutes) or not 0 < minutes * 60 <= MAX_BASE_SECONDS:
+        return None
+    base = int(minutes * 60)
+    if base <= 0 or not 0 <= increment <= MAX_INCREMENT_SECONDS:
+        return None
+    return base, increment
+
+class GameClock:
+    """Шахматные часы одной партии"""
+
+    def __init__(self, base_seconds: float, increment: float = 0):
+        self.increment = increment
+        self.remaining = {'white': float(base_seconds), 'black': float(base_seconds)}
+        self.running: Optional[str] = None  # Цвет, чьи часы сейчас идут
+        self.started_at: Optional[float] = None
+        self.version = 0  # Меняется при каждом переключении, устаревшие дедлайны игнорируются
+
+    def start(self, color: str, now: Optional[float] = None):
+        """Запускает часы указанной стороны"""
+        self.running = color
+        self.started_at = time.monotonic() if now is None else now
+        self.version += 1
+
+    def stop(self, now: Optional[float] = None):
+        """Останавливает часы (конец партии)"""
+        if self.running:
+            now = time.monotonic() if now is None else now
+            self.remaining[self.running] -= now - self.started_at
+            self.running = None
+            self.started_at = None
+        self.version += 1
+
+    def switch_to(self, color: str, now: Optional[float] = None):
+        """Списывает потраченное время и передает ход; при смене стороны начисляет добавление"""
+        now = time.monotonic() if now is None else now
+        previous = self.running
+        if previous:
+            self.remaining[previous] -= now - self.started_at
+            if previous != color:
+                self.remaining[previous] += self.increment
+        self.start(color, now)
+
+    def time_left(self, color: str, now: Optional[float] = None) -> float:
+        """Оставшееся время стороны с учетом идущих часов"""
+        left = self.remaining[color]
+        if self.running == color:
+            now = time.monotonic() if now is None else now
+            left -= now - self.started_at
+        return left
+
+    def deadline(self) -> Optional[float]:
+        """Момент (time.monotonic), когда у идущей стороны упадет флажок"""
+        if not self.running:
+            return None
+        return self.started_at + self.remaining[self.running]
+
+    def is_flagged(self, now: Optional[float] = None) -> bool:
+        """Истекло ли время у стороны, чьи часы идут"""
+        return bool(self.running) and self.time_left(self.running, now) <= 0
+
+    def to_dict(self, now: Optional[float] = None) -> Dict:
+        """Состояние часов для отправки клиенту"""
+        now = time.monotonic() if now is None else now
+        return {
+            'white': round(max(self.time_left('white', now), 0), 2),
+            'black': round(max(self.time_left('black', now), 0), 2),
+            'running': self.running,
+            'increment': self.increment
+        }
+
+class ClockScheduler:
+    """Общая куча дедлайнов всех партий воркера.
+
+    Вместо потока или задачи на каждую игру один цикл раз в тик забирает
+    только истекшие записи; проверка пустого тика стоит O(1).
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, str, int]] = []
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, game_id: str, clock: GameClock):
+        """Регистрирует текущий дедлайн часов партии"""
+        deadline = clock.deadline()
+        if deadline is not None:
+            heapq.heappush(self._heap, (deadline, next(self._counter), game_id, clock.version))
+
+    def pop_expired(self, now: Optional[float] = None) -> List[Tuple[str, int]]:
+        """Возвращает (game_id, version) всех дедлайнов, наступивших к моменту now"""
+        now = time.monotonic() if now is None else now
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, game_id, version = heapq.heappop(self._heap)
+            expired.append((game_id, version))
+        return expired
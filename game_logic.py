@@ -1,105 +1,498 @@
+import os
+import time
 import random
-from typing import Dict, List, Tuple
+import bisect
+import heapq
+import itertools
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from game_data import QUIZ_QUESTIONS, WELCOME_MESSAGES, RESULT_MESSAGES
 
+# Сколько вопросов в одной игре (если в банке меньше - все вопросы банка)
+QUESTIONS_PER_GAME = 10
+
+# Сколько подготовленных вопросов внешнего банка держать в памяти
+QUIZ_RENDER_CACHE_SIZE = int(os.getenv('QUIZ_RENDER_CACHE_SIZE', 1024))
+
+# Через сколько секунд без ответа игра считается брошенной и удаляется
+QUIZ_SESSION_TTL = int(os.getenv('QUIZ_SESSION_TTL', 1800))
+
+# Сколько ключей в корзине рейтинга (корзина делится, вырастая вдвое)
+QUIZ_LEADERBOARD_BUCKET_SIZE = int(os.getenv('QUIZ_LEADERBOARD_BUCKET_SIZE', 1000))
+
+# Сколько секунд в групповом чате принимаются ответы на вопрос
+QUIZ_GROUP_ROUND_SECONDS = int(os.getenv('QUIZ_GROUP_ROUND_SECONDS', 30))
+
+# Заголовки вопросов по номеру в игре
+QUESTION_HEADERS = tuple(f"❓ Вопрос {number}:\n" for number in range(1, QUESTIONS_PER_GAME + 1))
+
+class RenderedQuestion:
+    """Вопрос, подготовленный к показу: текст, строки результата и клавиатура строятся один раз.
+
+    Клавиатуры - неизменяемые InlineKeyboardMarkup, общие для всех игр с этим вопросом.
+    """
+    
+    __slots__ = ('body', 'options', 'correct', 'explanation', 'results', 'reply_markup', 'group_reply_markup')
+    
+    def __init__(self, question: Dict):
+        self.body = question['question']
+        self.options = tuple(question['options'])
+        self.correct = question['correct']
+        
+        explanation = self.explanation = f"\n💡 {question['explanation']}"
+        correct_answer = question['options'][question['correct']]
+        # Индексируется результатом проверки: results[is_correct]
+        self.results = (
+            f"❌ Неправильно! Правильный ответ: {correct_answer}{explanation}",
+            f"✅ Правильно!{explanation}"
+        )
+        self.reply_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton(option, callback_data=f"answer_{i}")]
+            for i, option in enumerate(question['options'])
+        ])
+        # Раунд в групповом чате: ответы собираются отдельно от личных игр
+        self.group_reply_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton(option, callback_data=f"group_answer_{i}")]
+            for i, option in enumerate(question['options'])
+        ])
+    
+    def text(self, position: int) -> str:
+        """Текст вопроса с его номером в игре"""
+        return QUESTION_HEADERS[position] + self.body
+
+def render_questions(questions: Sequence[Dict]) -> Tuple[RenderedQuestion, ...]:
+    """Подготовить к показу все вопросы банка"""
+    return tuple(RenderedQuestion(question) for question in questions)
+
+# Стандартный банк готовится один раз при импорте
+RENDERED_QUIZ_QUESTIONS = render_questions(QUIZ_QUESTIONS)
+
+class LazyRenderedQuestions:
+    """Подготовленные вопросы большого банка: готовятся при первом показе и держатся в LRU"""
+    
+    def __init__(self, questions: Sequence[Dict], maxsize: int = QUIZ_RENDER_CACHE_SIZE):
+        self.questions = questions
+        self.maxsize = maxsize
+        self._cache: OrderedDict = OrderedDict()  # индекс -> RenderedQuestion
+    
+    def __len__(self):
+        return len(self.questions)
+    
+    def __getitem__(self, index: int) -> RenderedQuestion:
+        rendered = self._cache.get(index)
+        if rendered is not None:
+            self._cache.move_to_end(index)
+            return rendered
+        
+        rendered = self._cache[index] = RenderedQuestion(self.questions[index])
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return rendered
+
+class QuizSession:
+    """Состояние игры пользователя: индексы вопросов в банке, счет и ответы.
+
+    Сами вопросы не копируются, поэтому размер сессии не зависит от размера банка.
+    """
+    
+    __slots__ = ('order', 'position', 'score', 'answers', 'asked_at')
+    
+    def __init__(self, order: array):
+        self.order = order          # Индексы вопросов банка в порядке показа
+        self.position = 0           # Номер текущего вопроса в order
+        self.score = 0
+        self.answers = array('B')   # Выбранные варианты ответов
+        self.asked_at = time.monotonic()  # Когда показан текущий вопрос
+    
+    @property
+    def total(self) -> int:
+        """Число вопросов в игре"""
+        return len(self.order)
+    
+    @property
+    def question_index(self) -> int:
+        """Индекс текущего вопроса в банке"""
+        return self.order[self.position]
+
+class GroupRound:
+    """Вопрос, открытый в групповом чате: ответы копятся в счетчиках до закрытия окна"""
+    
+    __slots__ = ('question_index', 'counts', 'answers', 'started_at', 'closes_at', 'message_id')
+    
+    def __init__(self, question_index: int, options: int, duration: float):
+        self.question_index = question_index
+        self.counts = array('I', bytes(4 * options))  # Число ответов на каждый вариант
+        self.answers: Dict[int, Tuple[int, float]] = {}  # user_id -> (вариант, время ответа)
+        self.started_at = time.monotonic()
+        self.closes_at = self.started_at + duration
+        self.message_id: Optional[int] = None  # Сообщение с вопросом (заполняет бот)
+
+class UserStats:
+    """Счетчики пользователя, обновляемые по ходу игры, чтобы /stats ничего не пересчитывал"""
+    
+    __slots__ = ('games_played', 'games_completed', 'answers', 'correct_answers',
+                 'streak', 'best_streak', 'answer_time')
+    
+    def __init__(self, games_played=0, games_completed=0, answers=0, correct_answers=0,
+                 streak=0, best_streak=0, answer_time=0.0):
+        self.games_played = games_played        # Начатые игры
+        self.games_completed = games_completed  # Доигранные до конца
+        self.answers = answers
+        self.correct_answers = correct_answers
+        self.streak = streak                    # Текущая серия правильных ответов
+        self.best_streak = best_streak
+        self.answer_time = answer_time          # Суммарное время ответов (секунды)
+    
+    @property
+    def average_answer_time(self) -> float:
+        """Среднее время ответа (секунды)"""
+        return self.answer_time / self.answers if self.answers else 0.0
+    
+    def record_answer(self, is_correct: bool, elapsed: float):
+        """Учесть ответ на вопрос"""
+        self.answers += 1
+        self.answer_time += elapsed
+        if is_correct:
+            self.correct_answers += 1
+            self.streak += 1
+            self.best_streak = max(self.best_streak, self.streak)
+        else:
+            self.streak = 0
+    
+    def astuple(self) -> Tuple:
+        """Значения счетчиков в порядке __slots__ (для хранилища)"""
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+class Leaderboard:
+    """Рейтинг игроков, обновляемый при каждом изменении счета.
+
+    Ключи (-счет, user_id) лежат в отсортированных корзинах примерно по
+    bucket_size штук: изменение счета сдвигает элементы только внутри одной
+    корзины, а саму корзину находит бинарный поиск по их максимумам. Место
+    игрока - позиция в корзине плюс число игроков в предыдущих корзинах
+    (дерево Фенвика по размерам корзин), поэтому обновление и место стоят
+    O(log n + bucket_size) вместо сдвига списка всех игроков.
+    """
+    
+    def __init__(self, bucket_size: int = QUIZ_LEADERBOARD_BUCKET_SIZE):
+        self.scores: Dict[int, int] = {}  # user_id -> total_score
+        self.bucket_size = bucket_size
+        self._buckets: List[List[Tuple[int, int]]] = []
+        self._maxes: List[Tuple[int, int]] = []  # последний ключ каждой корзины
+        self._tree: Optional[List[int]] = None  # дерево Фенвика по размерам корзин; None - перестроить
+        self._len = 0
+    
+    def __len__(self):
+        return self._len
+    
+    def load(self, scores: Dict[int, int]):
+        """Заполнить рейтинг сохраненными счетами одной сортировкой"""
+        self.scores.update(scores)
+        keys = sorted((-score, user_id) for user_id, score in self.scores.items())
+        self._buckets = [keys[start:start + self.bucket_size] for start in range(0, len(keys), self.bucket_size)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        self._tree = None
+        self._len = len(keys)
+    
+    def add(self, user_id: int, points: int) -> int:
+        """Добавить очки игроку и вернуть его новый счет"""
+        old_score = self.scores.get(user_id)
+        if old_score is not None:
+            self._remove((-old_score, user_id))
+        
+        score = (old_score or 0) + points
+        self.scores[user_id] = score
+        self._insert((-score, user_id))
+        return score
+    
+    def _insert(self, key: Tuple[int, int]):
+        """Вставить ключ; переполненная корзина делится пополам"""
+        self._len += 1
+        if not self._buckets:
+            self._buckets.append([key])
+            self._maxes.append(key)
+            self._tree = None
+            return
+        
+        number = bisect.bisect_left(self._maxes, key)
+        if number == len(self._buckets):
+            number -= 1
+            self._buckets[number].append(key)
+            self._maxes[number] = key
+        else:
+            bisect.insort(self._buckets[number], key)
+        
+        bucket = self._buckets[number]
+        if len(bucket) > 2 * self.bucket_size:
+            tail = bucket[self.bucket_size:]
+            del bucket[self.bucket_size:]
+            self._buckets.insert(number + 1, tail)
+            self._maxes[number] = bucket[-1]
+            self._maxes.insert(number + 1, tail[-1])
+            self._tree = None
+        else:
+            self._resize(number, 1)
+    
+    def _remove(self, key: Tuple[int, int]):
+        """Удалить ключ; пустая корзина удаляется"""
+        self._len -= 1
+        number = bisect.bisect_left(self._maxes, key)
+        bucket = self._buckets[number]
+        del bucket[bisect.bisect_left(bucket, key)]
+        if bucket:
+            self._maxes[number] = bucket[-1]
+            self._resize(number, -1)
+        else:
+            del self._buckets[number]
+            del self._maxes[number]
+            self._tree = None
+    
+    def _fenwick(self) -> List[int]:
+        """Дерево Фенвика по размерам корзин (строится заново после деления корзин)"""
+        if self._tree is None:
+            tree = [0] + [len(bucket) for bucket in self._buckets]
+            for node in range(1, len(tree)):
+                parent = node + (node & -node)
+                if parent < len(tree):
+                    tree[parent] += tree[node]
+            self._tree = tree
+        return self._tree
+    
+    def _resize(self, number: int, delta: int):
+        """Учесть изменение размера корзины number в дереве"""
+        tree = self._tree
+        if tree is None:
+            return
+        node = number + 1
+        while node < len(tree):
+            tree[node] += delta
+            node += node & -node
+    
+    def _count_before(self, number: int) -> int:
+        """Число ключей в корзинах перед корзиной number"""
+        tree = self._fenwick()
+        total = 0
+        while number:
+            total += tree[number]
+            number -= number & -number
+        return total
+    
+    def _keys_from(self, position: int) -> Iterator[Tuple[int, int]]:
+        """Ключи рейтинга по порядку, начиная с позиции position (с 0)"""
+        tree = self._fenwick()
+        # Спуск по дереву: сколько корзин целиком лежит до позиции
+        number = 0
+        step = 1 << (len(tree) - 1).bit_length()
+        while step:
+            node = number + step
+            if node < len(tree) and tree[node] <= position:
+                number = node
+                position -= tree[node]
+            step >>= 1
+        
+        for bucket in itertools.islice(self._buckets, number, None):
+            yield from bucket[position:]
+            position = 0
+    
+    def top(self, k: int) -> List[Tuple[int, int]]:
+        """Первые k игроков: [(user_id, score), ...]"""
+        return [(user_id, -neg_score) for neg_score, user_id in itertools.islice(self._keys_from(0), k)]
+    
+    def rank(self, user_id: int) -> Optional[int]:
+        """Место игрока (с 1) или None, если он еще не играл"""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        key = (-score, user_id)
+        number = bisect.bisect_left(self._maxes, key)
+        return self._count_before(number) + bisect.bisect_left(self._buckets[number], key) + 1
+    
+    def around(self, user_id: int, radius: int = 2) -> List[Tuple[int, int, int]]:
+        """Игрок и его соседи по рейтингу: [(место, user_id, score), ...]"""
+        rank = self.rank(user_id)
+        if rank is None:
+            return []
+        start = max(rank - 1 - radius, 0)
+        keys = itertools.islice(self._keys_from(start), rank + radius - start)
+        return [(start + offset + 1, uid, -neg_score) for offset, (neg_score, uid) in enumerate(keys)]
+
 class QuizGame:
     """Класс для управления игрой-викториной"""
     
-    def __init__(self):
-        self.active_games: Dict[int, Dict] = {}  # user_id -> game_state
-        self.user_scores: Dict[int, int] = {}    # user_id -> total_score
+    def __init__(self, questions: Sequence[Dict] = QUIZ_QUESTIONS, store=None,
+                 session_ttl: int = QUIZ_SESSION_TTL):
+        self.questions = questions
+        # Другие банки (например, question_bank.QuestionBank) готовятся по мере показа вопросов
+        self.rendered = RENDERED_QUIZ_QUESTIONS if questions is QUIZ_QUESTIONS else LazyRenderedQuestions(questions)
+        self.active_games: Dict[int, QuizSession] = {}  # user_id -> сессия
+        self.leaderboard = Leaderboard()
+        self.user_scores = self.leaderboard.scores  # user_id -> total_score (только чтение)
+        self.user_stats: Dict[int, UserStats] = {}  # user_id -> счетчики
+        
+        # Куча (срок, user_id) для удаления брошенных игр: не больше одной записи на пользователя
+        self.session_ttl = session_ttl
+        self.expiry_heap: List[Tuple[float, int]] = []
+        self._expiry_scheduled = set()
+        
+        self.group_rounds: Dict[int, GroupRound] = {}  # chat_id -> открытый раунд
+        
+        # Хранилище (например, quiz_store.SqliteQuizStore); без него всё живет только в памяти
+        self.store = store
+        if store is not None:
+            self._restore(store.load())
+    
+    def _restore(self, data: Dict):
+        """Восстановить счета и незавершенные игры из хранилища"""
+        self.leaderboard.load(data['scores'])
+        self.user_stats.update((user_id, UserStats(*row)) for user_id, row in data['stats'].items())
+        
+        bank_size = len(self.questions)
+        for user_id, (typecode, order, position, score, answers) in data['sessions'].items():
+            session = QuizSession(array(typecode, order))
+            # Игры по вопросам, которых больше нет в банке, не восстанавливаем
+            if position >= session.total or any(index >= bank_size for index in session.order):
+                continue
+            session.position = position
+            session.score = score
+            session.answers.frombytes(answers)
+            self.active_games[user_id] = session
+            self._schedule_expiry(user_id, session)
+    
+    def _stats(self, user_id: int) -> UserStats:
+        """Счетчики пользователя (создаются при первой игре)"""
+        stats = self.user_stats.get(user_id)
+        if stats is None:
+            stats = self.user_stats[user_id] = UserStats()
+        return stats
+    
+    def _save_stats(self, user_id: int, stats: UserStats):
+        """Передать изменившиеся счетчики в хранилище"""
+        if self.store is not None:
+            self.store.save_stats(user_id, stats)
     
-    def start_game(self, user_id: int) -> Tuple[str, List[List]]:
-        """Начинает новую игру для пользователя"""
-        # Перемешиваем вопросы
-        questions = QUIZ_QUESTIONS.copy()
-        random.shuffle(questions)
+    def _schedule_expiry(self, user_id: int, session: QuizSession):
+        """Поставить игру пользователя в очередь на удаление по бездействию"""
+        if user_id not in self._expiry_scheduled:
+            self._expiry_scheduled.add(user_id)
+            heapq.heappush(self.expiry_heap, (session.asked_at + self.session_ttl, user_id))
+    
+    def expire_idle_sessions(self, now: Optional[float] = None) -> int:
+        """Удалить игры без ответа дольше session_ttl; возвращает число удаленных.
+
+        Ответы не трогают кучу: наступивший срок сверяется с последней
+        активностью игры, и живая игра просто переставляется на новый срок.
+        """
+        now = time.monotonic() if now is None else now
+        expired = 0
+        while self.expiry_heap and self.expiry_heap[0][0] <= now:
+            _, user_id = heapq.heappop(self.expiry_heap)
+            session = self.active_games.get(user_id)
+            if session is None:
+                self._expiry_scheduled.discard(user_id)
+                continue
+            
+            deadline = session.asked_at + self.session_ttl
+            if deadline > now:
+                heapq.heappush(self.expiry_heap, (deadline, user_id))
+                continue
+            
+            self._expiry_scheduled.discard(user_id)
+            del self.active_games[user_id]
+            if self.store is not None:
+                self.store.delete_session(user_id)
+            expired += 1
+        return expired
+    
+    def _sample_order(self, category: Optional[str] = None, difficulty: Optional[int] = None) -> array:
+        """Случайная выборка индексов вопросов для новой игры"""
+        bank_size = len(self.questions)
+        typecode = 'H' if bank_size <= 0xFFFF else 'I'
         
-        # Создаем состояние игры
-        game_state = {
-            'current_question': 0,
-            'questions': questions,
-            'score': 0,
-            'answers': []
-        }
+        if category is None and difficulty is None:
+            indices = random.sample(range(bank_size), min(QUESTIONS_PER_GAME, bank_size))
+        elif hasattr(self.questions, 'sample'):
+            # Банк в файле выбирает по своему индексу групп, не декодируя вопросы
+            indices = self.questions.sample(QUESTIONS_PER_GAME, category, difficulty)
+        else:
+            candidates = [
+                index for index, question in enumerate(self.questions)
+                if (category is None or question.get('category') == category)
+                and (difficulty is None or question.get('difficulty') == difficulty)
+            ]
+            indices = random.sample(candidates, min(QUESTIONS_PER_GAME, len(candidates)))
+        return array(typecode, indices)
+    
+    def start_game(self, user_id: int, category: Optional[str] = None,
+                   difficulty: Optional[int] = None) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+        """Начинает новую игру для пользователя (можно выбрать категорию и сложность)"""
+        order = self._sample_order(category, difficulty)
+        if not order:
+            return "😔 Нет вопросов в этой категории. Начните игру командой /start", None
         
-        self.active_games[user_id] = game_state
+        session = QuizSession(order)
+        self.active_games[user_id] = session
+        self._schedule_expiry(user_id, session)
+        stats = self._stats(user_id)
+        stats.games_played += 1
+        self._save_stats(user_id, stats)
+        if self.store is not None:
+            self.store.save_session(user_id, session)
         
         # Формируем первое сообщение
+        question = self.rendered[session.question_index]
         welcome = random.choice(WELCOME_MESSAGES)
-        first_question = self._format_question(questions[0], 0)
         
-        return welcome + "\n\n" + first_question, self._create_keyboard(questions[0])
+        return welcome + "\n\n" + question.text(0), question.reply_markup
     
-    def process_answer(self, user_id: int, answer_index: int) -> Tuple[str, List[List], bool]:
+    def process_answer(self, user_id: int, answer_index: int) -> Tuple[str, Optional[InlineKeyboardMarkup], bool]:
         """Обрабатывает ответ пользователя"""
         if user_id not in self.active_games:
-            return "Игра не найдена. Начните новую игру командой /start", [], False
+            return "Игра не найдена. Начните новую игру командой /start", None, False
         
-        game_state = self.active_games[user_id]
-        current_q = game_state['current_question']
-        question = game_state['questions'][current_q]
+        session = self.active_games[user_id]
+        question = self.rendered[session.question_index]
         
         # Проверяем ответ
-        is_correct = answer_index == question['correct']
+        is_correct = answer_index == question.correct
         if is_correct:
-            game_state['score'] += 1
+            session.score += 1
+        
+        session.answers.append(answer_index)
         
-        game_state['answers'].append(answer_index)
+        now = time.monotonic()
+        stats = self._stats(user_id)
+        stats.record_answer(is_correct, now - session.asked_at)
+        session.asked_at = now
+        self._save_stats(user_id, stats)
         
-        # Формируем сообщение о результате
-        result_text = self._format_answer_result(question, is_correct, answer_index)
+        # Готовая строка результата
+        result_text = question.results[is_correct]
         
         # Переходим к следующему вопросу
-        game_state['current_question'] += 1
+        session.position += 1
         
-        if game_state['current_question'] >= len(game_state['questions']):
+        if session.position >= session.total:
             # Игра окончена
-            return self._finish_game(user_id), [], True
+            return self._finish_game(user_id), None, True
         else:
+            if self.store is not None:
+                self.store.save_session(user_id, session)
+            
             # Показываем следующий вопрос
-            next_question = self._format_question(
-                game_state['questions'][game_state['current_question']], 
-                game_state['current_question']
-            )
-            full_text = result_text + "\n\n" + next_question
-            return full_text, self._create_keyboard(game_state['questions'][game_state['current_question']]), False
-    
-    def _format_question(self, question: Dict, question_num: int) -> str:
-        """Форматирует вопрос для отображения"""
-        return f"❓ Вопрос {question_num + 1}:\n{question['question']}"
-    
-    def _create_keyboard(self, question: Dict) -> List[List]:
-        """Создает клавиатуру с вариантами ответов"""
-        from telegram import InlineKeyboardButton
-        
-        keyboard = []
-        for i, option in enumerate(question['options']):
-            keyboard.append([InlineKeyboardButton(option, callback_data=f"answer_{i}")])
-        
-        return keyboard
-    
-    def _format_answer_result(self, question: Dict, is_correct: bool, user_answer: int) -> str:
-        """Форматирует результат ответа"""
-        if is_correct:
-            result = "✅ Правильно!"
-        else:
-            correct_answer = question['options'][question['correct']]
-            result = f"❌ Неправильно! Правильный ответ: {correct_answer}"
-        
-        explanation = f"\n💡 {question['explanation']}"
-        return result + explanation
+            question = self.rendered[session.question_index]
+            full_text = result_text + "\n\n" + question.text(session.position)
+            return full_text, question.reply_markup, False
     
     def _finish_game(self, user_id: int) -> str:
         """Завершает игру и показывает результаты"""
-        game_state = self.active_games[user_id]
-        score = game_state['score']
-        total = len(game_state['questions'])
+        session = self.active_games[user_id]
+        score = session.score
+        total = session.total
         
-        # Обновляем общий счет пользователя
-        if user_id not in self.user_scores:
-            self.user_scores[user_id] = 0
-        self.user_scores[user_id] += score
+        # Обновляем общий счет пользователя и его место в рейтинге
+        total_score = self.leaderboard.add(user_id, score)
         
         # Определяем категорию результата
         percentage = (score / total) * 100
@@ -121,28 +514,112 @@ class QuizGame:
 📊 Ваш результат: {score}/{total} ({percentage:.1f}%)
 {result_message}
 
-🎯 Общий счет: {self.user_scores[user_id]}
+🎯 Общий счет: {total_score}
 
 🔄 Начните новую игру командой /start
         """.strip()
         
         # Удаляем завершенную игру
         del self.active_games[user_id]
+        stats = self._stats(user_id)
+        stats.games_completed += 1
+        self._save_stats(user_id, stats)
+        if self.store is not None:
+            self.store.save_score(user_id, total_score)
+            self.store.delete_session(user_id)
         
         return final_text
     
-    def get_leaderboard(self) -> List[Tuple[int, int]]:
-        """Возвращает таблицу лидеров"""
-        sorted_scores = sorted(self.user_scores.items(), key=lambda x: x[1], reverse=True)
-        return sorted_scores[:10]  # Топ-10 игроков
+    def start_group_round(self, chat_id: int, category: Optional[str] = None,
+                          duration: float = QUIZ_GROUP_ROUND_SECONDS) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+        """Открывает вопрос для всех участников группового чата"""
+        if chat_id in self.group_rounds:
+            return "⏳ В этом чате уже идет раунд, дождитесь его окончания", None
+        
+        order = self._sample_order(category)
+        if not order:
+            return "😔 Нет вопросов в этой категории", None
+        
+        question = self.rendered[order[0]]
+        self.group_rounds[chat_id] = GroupRound(order[0], len(question.options), duration)
+        text = f"👥 Вопрос для всех (⏱ {duration:g} с):\n{question.body}"
+        return text, question.group_reply_markup
+    
+    def record_group_answer(self, chat_id: int, user_id: int, answer_index: int) -> str:
+        """Учитывает ответ участника; возвращает короткое уведомление для него"""
+        group_round = self.group_rounds.get(chat_id)
+        now = time.monotonic()
+        if group_round is None or now > group_round.closes_at:
+            return "⌛ Прием ответов закончен"
+        if user_id in group_round.answers:
+            return "Ответ уже принят"
+        if not 0 <= answer_index < len(group_round.counts):
+            return "Нет такого варианта"
+        
+        group_round.answers[user_id] = (answer_index, now - group_round.started_at)
+        group_round.counts[answer_index] += 1
+        return "✍️ Ответ принят"
+    
+    def close_group_round(self, chat_id: int) -> Optional[str]:
+        """Закрывает раунд: начисляет очки всем ответившим за один проход и возвращает итог"""
+        group_round = self.group_rounds.pop(chat_id, None)
+        if group_round is None:
+            return None
+        
+        question = self.rendered[group_round.question_index]
+        winners = 0
+        for user_id, (answer_index, elapsed) in group_round.answers.items():
+            is_correct = answer_index == question.correct
+            stats = self._stats(user_id)
+            stats.record_answer(is_correct, elapsed)
+            self._save_stats(user_id, stats)
+            if is_correct:
+                winners += 1
+                total_score = self.leaderboard.add(user_id, 1)
+                if self.store is not None:
+                    self.store.save_score(user_id, total_score)
+        
+        distribution = "\n".join(
+            f"{option} — {count}{' ✅' if i == question.correct else ''}"
+            for i, (option, count) in enumerate(zip(question.options, group_round.counts))
+        )
+        
+        return f"""
+👥 {question.body}
+
+✅ Правильный ответ: {question.options[question.correct]}{question.explanation}
+
+📊 Ответы:
+{distribution}
+
+🏆 Правильно ответили: {winners} из {len(group_round.answers)}
+        """.strip()
+    
+    def get_leaderboard(self, limit: int = 10) -> List[Tuple[int, int]]:
+        """Возвращает таблицу лидеров (по умолчанию топ-10)"""
+        return self.leaderboard.top(limit)
+    
+    def get_user_rank(self, user_id: int) -> Optional[int]:
+        """Место пользователя в рейтинге или None"""
+        return self.leaderboard.rank(user_id)
+    
+    def get_leaderboard_around(self, user_id: int, radius: int = 2) -> List[Tuple[int, int, int]]:
+        """Соседи пользователя по рейтингу: [(место, user_id, score), ...]"""
+        return self.leaderboard.around(user_id, radius)
     
     def get_user_stats(self, user_id: int) -> Dict:
         """Возвращает статистику пользователя"""
-        total_score = self.user_scores.get(user_id, 0)
-        games_played = len([game for game in self.active_games.values() if game.get('user_id') == user_id])
+        stats = self.user_stats.get(user_id) or UserStats()
         
         return {
-            'total_score': total_score,
-            'games_played': games_played,
-            'current_game': user_id in self.active_games
+            'total_score': self.user_scores.get(user_id, 0),
+            'games_played': stats.games_played,
+            'games_completed': stats.games_completed,
+            'correct_answers': stats.correct_answers,
+            'answers': stats.answers,
+            'best_streak': stats.best_streak,
+            'average_answer_time': stats.average_answer_time,
+            'current_game': user_id in self.active_games,
+            'rank': self.leaderboard.rank(user_id),
+            'players': len(self.leaderboard)
         } 
\ No newline at end of file
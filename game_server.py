@@ -1,8 +1,11 @@
-from flask import Flask
+from flask import Flask, request
 from flask_socketio import SocketIO, emit, join_room, leave_room
 import json
+import time
+from collections import deque
 from chess_game import ChessGame
 from checkers_game import CheckersGame
+from game_clock import GameClock, ClockScheduler, parse_time_control
 import os
 from dotenv import load_dotenv
 
@@ -16,6 +19,118 @@ socketio = SocketIO(app, cors_allowed_origins="*")
 # Хранилище активных игр
 active_games = {}
 
+# Сколько последних ходов хранится для зрителей, подключившихся позже
+SPECTATOR_RING_SIZE = int(os.getenv('SPECTATOR_RING_SIZE', 50))
+
+# sid зрителя -> game_id, чтобы убрать его из игры при отключении
+spectator_sessions = {}
+
+# Одна куча дедлайнов и один цикл проверки флажков на все партии воркера
+CLOCK_TICK = float(os.getenv('CLOCK_TICK', 0.1))
+clock_scheduler = ClockScheduler()
+_clock_loop_started = False
+
+def _spectator_room(game_id):
+    """Комната зрителей игры (отдельно от комнаты игроков)"""
+    return f"{game_id}:spectators"
+
+def _serialize_board(board):
+    """Преобразует доску с объектами фигур в JSON-совместимый вид"""
+    return [
+        [
+            {
+                'type': piece.type.value,
+                'color': piece.color.value,
+                'symbol': piece.get_symbol()
+            } if piece else None
+            for piece in row
+        ]
+        for row in board
+    ]
+
+def _encode_event(event):
+    """Кодирует событие в компактный JSON один раз для всех зрителей"""
+    return json.dumps(event, ensure_ascii=False, separators=(',', ':'))
+
+def _get_snapshot(game_id, game_info):
+    """Возвращает закодированный снимок игры, пересобирая его не чаще раза за ход"""
+    if game_info['snapshot'] is None:
+        game = game_info['game']
+        game_info['snapshot'] = _encode_event({
+            'game_id': game_id,
+            'game_type': game_info['type'],
+            'board': _serialize_board(game.board),
+            'status': game.get_game_status(),
+            'game_over': game.game_over,
+            'winner': game.winner.value if game.winner else None
+        })
+    return game_info['snapshot']
+
+def _ensure_clock_loop():
+    """Запускает фоновую проверку флажков при первой партии с контролем времени"""
+    global _clock_loop_started
+    if not _clock_loop_started:
+        _clock_loop_started = True
+        socketio.start_background_task(_clock_loop)
+
+def _clock_loop():
+    """Раз в тик забирает из кучи только наступившие дедлайны"""
+    while True:
+        socketio.sleep(CLOCK_TICK)
+        check_flags()
+
+def check_flags(now=None):
+    """Завершает партии, у которых упал флажок"""
+    now = time.monotonic() if now is None else now
+    for game_id, version in clock_scheduler.pop_expired(now):
+        game_info = active_games.get(game_id)
+        if not game_info or not game_info['clock']:
+            continue
+        
+        clock = game_info['clock']
+        # После хода часы переключились, и этот дедлайн уже неактуален
+        if clock.version != version or not clock.is_flagged(now):
+            continue
+        
+        _flag_fall(game_id, game_info, now)
+
+def _flag_fall(game_id, game_info, now):
+    """Фиксирует поражение по времени и уведомляет игроков и зрителей"""
+    game = game_info['game']
+    clock = game_info['clock']
+    loser = clock.running
+    
+    clock.stop(now)
+    # Перечисление цветов у шахмат и шашек разное, берем его у текущей игры
+    game.lose_on_time(type(game.current_turn)(loser))
+    game_info['snapshot'] = None
+    
+    event = {
+        'loser': loser,
+        'status': game.get_game_status(),
+        'game_over': True,
+        'winner': game.winner.value,
+        'clock': clock.to_dict(now)
+    }
+    socketio.emit('time_over', event, room=game_id)
+    if game_info['spectators']:
+        socketio.emit('time_over', event, room=_spectator_room(game_id))
+
+def _join_as_spectator(game_id, game_info):
+    """Подключает текущий сокет к игре в режиме только для чтения"""
+    join_room(_spectator_room(game_id))
+    game_info['spectators'].add(request.sid)
+    spectator_sessions[request.sid] = game_id
+    
+    # Снимок текущей позиции и хвост последних ходов уже закодированы
+    clock = game_info['clock']
+    emit('spectator_joined', {
+        'snapshot': _get_snapshot(game_id, game_info),
+        'moves': list(game_info['move_ring']),
+        'spectators': len(game_info['spectators']),
+        'clock': clock.to_dict() if clock else None
+    })
+
 @app.route('/')
 def index():
     return "Game Server is running"
@@ -27,19 +142,21 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     print('Client disconnected')
+    
+    game_id = spectator_sessions.pop(request.sid, None)
+    if game_id and game_id in active_games:
+        active_games[game_id]['spectators'].discard(request.sid)
 
 @socketio.on('join_game')
 def handle_join_game(data):
     game_id = data.get('game_id')
     player_id = data.get('player_id')
+    role = data.get('role', 'player')
     
     if not game_id:
         emit('error', {'message': 'Game ID required'})
         return
     
-    # Присоединяемся к комнате игры
-    join_room(game_id)
-    
     # Если игра не существует, создаем её
     if game_id not in active_games:
         # Получаем информацию об игре из API лобби
@@ -50,22 +167,36 @@ def handle_join_game(data):
         else:
             game = CheckersGame('player1', 'player2')
         
+        # Контроль времени: 'blitz', 'rapid' и т.д. или '5+3'
+        time_control = parse_time_control(data.get('time_control'))
+        
         active_games[game_id] = {
             'game': game,
             'players': {},
-            'type': game_type
+            'type': game_type,
+            'spectators': set(),
+            'move_ring': deque(maxlen=SPECTATOR_RING_SIZE),
+            'snapshot': None,
+            'clock': GameClock(*time_control) if time_control else None
         }
     
     game_info = active_games[game_id]
     
-    # Определяем цвет игрока
-    if len(game_info['players']) == 0:
+    # Зрители и все, кто пришел в заполненную игру, смотрят партию без права хода
+    if role == 'spectator' or (player_id not in game_info['players'] and len(game_info['players']) >= 2):
+        _join_as_spectator(game_id, game_info)
+        return
+    
+    # Присоединяемся к комнате игры
+    join_room(game_id)
+    
+    # Определяем цвет игрока (при переподключении цвет сохраняется)
+    if player_id in game_info['players']:
+        color = game_info['players'][player_id]['color']
+    elif len(game_info['players']) == 0:
         color = 'white'
-    elif len(game_info['players']) == 1:
-        color = 'black'
     else:
-        emit('error', {'message': 'Game is full'})
-        return
+        color = 'black'
     
     # Добавляем игрока
     game_info['players'][player_id] = {
@@ -73,19 +204,28 @@ def handle_join_game(data):
         'ready': True
     }
     
+    # Часы белых запускаются, когда за доску сели оба игрока
+    clock = game_info['clock']
+    if clock and clock.running is None and len(game_info['players']) == 2 and not game_info['game'].game_over:
+        clock.start('white')
+        clock_scheduler.schedule(game_id, clock)
+        _ensure_clock_loop()
+    
     # Отправляем информацию об игре
     emit('game_joined', {
         'game_id': game_id,
         'color': color,
         'game_type': game_info['type'],
-        'board': game_info['game'].board,
-        'status': game_info['game'].get_game_status()
+        'board': _serialize_board(game_info['game'].board),
+        'status': game_info['game'].get_game_status(),
+        'clock': clock.to_dict() if clock else None
     })
     
-    # Уведомляем других игроков
+    # Уведомляем других игроков (первый игрок узнает отсюда, что его часы пошли)
     emit('player_joined', {
         'player_id': player_id,
-        'color': color
+        'color': color,
+        'clock': clock.to_dict() if clock else None
     }, room=game_id, include_self=False)
 
 @socketio.on('make_move')
@@ -110,22 +250,48 @@ def handle_make_move(data):
         emit('error', {'message': 'Not your turn'})
         return
     
+    if game.game_over:
+        emit('error', {'message': 'Game over'})
+        return
+    
+    # Ход, сделанный после падения флажка, не засчитывается
+    clock = game_info['clock']
+    now = time.monotonic()
+    if clock and clock.is_flagged(now):
+        _flag_fall(game_id, game_info, now)
+        return
+    
     # Делаем ход
     success = game.make_move(from_pos, to_pos)
     
     if success:
-        # Обновляем статус игры
-        game.check_game_state()
+        # Состояние игры уже обновлено в make_move; при серии взятий ход может остаться у той же стороны
+        if clock:
+            if game.game_over:
+                clock.stop(now)
+            else:
+                clock.switch_to(game.current_turn.value, now)
+                clock_scheduler.schedule(game_id, clock)
         
-        # Отправляем обновление всем игрокам
-        emit('move_made', {
+        move_event = {
             'from_pos': from_pos,
             'to_pos': to_pos,
-            'board': game.board,
+            'board': _serialize_board(game.board),
             'status': game.get_game_status(),
             'game_over': game.game_over,
-            'winner': game.winner.value if game.winner else None
-        }, room=game_id)
+            'winner': game.winner.value if game.winner else None,
+            'clock': clock.to_dict(now) if clock else None
+        }
+        
+        # Отправляем обновление всем игрокам
+        emit('move_made', move_event, room=game_id)
+        
+        # Для зрителей событие кодируется один раз и рассылается одним буфером
+        encoded = _encode_event(move_event)
+        game_info['move_ring'].append(encoded)
+        game_info['snapshot'] = None
+        if game_info['spectators']:
+            emit('spectator_event', encoded, room=_spectator_room(game_id))
     else:
         emit('error', {'message': 'Invalid move'})
 
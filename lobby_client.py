@@ -0,0 +1,205 @@
+import os
+import sys
+import abc
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+# Способ связи бота с лобби: http - через API лобби, local - напрямую с LobbyManager
+# (только когда API лобби (api.lobby) уже загружено в этот же процесс)
+LOBBY_CLIENT = os.getenv('LOBBY_CLIENT', 'http')
+
+# Дедлайн одного запроса к API лобби (секунды) и размер пула соединений
+LOBBY_HTTP_TIMEOUT = float(os.getenv('LOBBY_HTTP_TIMEOUT', 10))
+LOBBY_HTTP_MAX_CONNECTIONS = int(os.getenv('LOBBY_HTTP_MAX_CONNECTIONS', 32))
+
+class LobbyError(Exception):
+    """Лобби отклонило операцию (сообщение можно показать пользователю)"""
+
+class LobbyUnavailable(LobbyError):
+    """Лобби не ответило или ответило ошибкой сервера"""
+
+class LobbyClient(abc.ABC):
+    """Операции лобби, которые нужны боту"""
+
+    async def open(self):
+        """Подготовить клиент к работе"""
+
+    async def close(self):
+        """Освободить ресурсы клиента"""
+
+    @abc.abstractmethod
+    async def create_game(self, user_id: str, username: str, game_type: str) -> Dict:
+        """Создать игру и вернуть её"""
+
+    @abc.abstractmethod
+    async def join_game(self, user_id: str, username: str, game_id: str) -> Dict:
+        """Присоединиться к игре и вернуть её"""
+
+    @abc.abstractmethod
+    async def list_games(self, limit: Optional[int] = None) -> List[Dict]:
+        """Открытые игры (старые первыми)"""
+
+    @abc.abstractmethod
+    async def get_user_game(self, user_id: str) -> Optional[Dict]:
+        """Текущая игра пользователя или None"""
+
+    @abc.abstractmethod
+    async def list_games_since(self, version: Optional[int],
+                               limit: Optional[int] = None) -> Tuple[int, Optional[List[Dict]]]:
+        """Версия лобби и открытые игры; вместо игр None, если версия всё ещё равна version"""
+
+class HttpLobbyClient(LobbyClient):
+    """Лобби в другом процессе: запросы к /api/lobby через общий пул соединений.
+
+    Число одновременных запросов ограничено пулом, а дедлайн действует
+    на весь вызов, включая ожидание свободного соединения.
+    """
+
+    def __init__(self, base_url: str, timeout: float = LOBBY_HTTP_TIMEOUT,
+                 max_connections: int = LOBBY_HTTP_MAX_CONNECTIONS, transport=None):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.transport = transport
+        self.http: Optional[httpx.AsyncClient] = None
+
+    async def open(self):
+        """Открыть keep-alive пул, общий для всех обновлений"""
+        self.http = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections
+            ),
+            transport=self.transport
+        )
+
+    async def close(self):
+        """Закрыть пул соединений"""
+        if self.http is not None:
+            await self.http.aclose()
+            self.http = None
+
+    async def _send(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Выполнить запрос с общим дедлайном"""
+        try:
+            return await asyncio.wait_for(self.http.request(method, path, **kwargs), self.timeout)
+        except asyncio.TimeoutError as e:
+            raise LobbyUnavailable('Лобби не ответило вовремя') from e
+        except httpx.HTTPError as e:
+            raise LobbyUnavailable(str(e)) from e
+
+    @staticmethod
+    def _json(response: httpx.Response) -> Dict:
+        """JSON ответа; ошибки сервера превращаются в LobbyUnavailable"""
+        try:
+            data = response.json()
+        except ValueError as e:
+            raise LobbyUnavailable(str(e)) from e
+
+        if response.status_code >= 500:
+            raise LobbyUnavailable(data.get('error', 'Ошибка сервера'))
+        return data
+
+    async def _request(self, method: str, path: str, **kwargs) -> Dict:
+        """Выполнить запрос и вернуть JSON ответа"""
+        return self._json(await self._send(method, path, **kwargs))
+
+    async def _game_request(self, path: str, payload: Dict) -> Dict:
+        """POST-запрос, возвращающий игру"""
+        data = await self._request('POST', path, json=payload)
+        if data.get('status') != 'ok':
+            raise LobbyError(data.get('error', 'Неизвестная ошибка'))
+        return data['game']
+
+    async def create_game(self, user_id, username, game_type):
+        return await self._game_request('/create', {
+            'user_id': str(user_id),
+            'username': username,
+            'game_type': game_type
+        })
+
+    async def join_game(self, user_id, username, game_id):
+        return await self._game_request('/join', {
+            'user_id': str(user_id),
+            'username': username,
+            'game_id': game_id
+        })
+
+    async def list_games(self, limit=None):
+        params = {'limit': limit} if limit is not None else None
+        data = await self._request('GET', '/games', params=params)
+        return data.get('games', [])
+
+    async def get_user_game(self, user_id):
+        data = await self._request('GET', f'/user/{user_id}')
+        return data.get('game')
+
+    async def list_games_since(self, version, limit=None):
+        # Неизменившийся список лобби отвечает 304 по ETag версии
+        params = {'limit': limit} if limit is not None else None
+        headers = {'If-None-Match': f'"{version}"'} if version is not None else None
+        response = await self._send('GET', '/games', params=params, headers=headers)
+        if response.status_code == 304:
+            return version, None
+        data = self._json(response)
+        return data['version'], data.get('games', [])
+
+class LocalLobbyClient(LobbyClient):
+    """Лобби в этом же процессе: прямые вызовы LobbyManager без HTTP и JSON.
+
+    Изменения лобби ждут блокировок и записи на диск, поэтому идут в
+    потоке (asyncio.to_thread) и не останавливают цикл событий бота.
+    """
+
+    def __init__(self, manager=None, matchmaking=None):
+        if manager is None:
+            from api.lobby import lobby_manager as manager, matchmaking
+        self.manager = manager
+        self.matchmaking = matchmaking
+
+    def _create_game(self, user_id, username, game_type):
+        # Как и API: создавший свою игру больше не ждет подбора
+        if self.matchmaking is not None:
+            self.matchmaking.cancel(user_id)
+        return self.manager.create_game(user_id, username, game_type)
+
+    async def create_game(self, user_id, username, game_type):
+        return await asyncio.to_thread(self._create_game, str(user_id), username, game_type)
+
+    async def join_game(self, user_id, username, game_id):
+        game, message = await asyncio.to_thread(self.manager.join_game, str(user_id), username, game_id)
+        if game is None:
+            raise LobbyError(message)
+        return game
+
+    async def list_games(self, limit=None):
+        games, _ = self.manager.get_available_games(limit=limit)
+        return games
+
+    async def get_user_game(self, user_id):
+        user_info = self.manager.users.get(str(user_id))
+        if not user_info or not user_info.get('current_game'):
+            return None
+        return self.manager.get_game_info(user_info['current_game'])
+
+    async def list_games_since(self, version, limit=None):
+        current = self.manager.version
+        if version == current:
+            return current, None
+        games, _ = self.manager.get_available_games(limit=limit)
+        return current, games
+
+def create_lobby_client(base_url: str, kind: str = LOBBY_CLIENT) -> LobbyClient:
+    """Создать клиент лобби по настройке LOBBY_CLIENT"""
+    if kind == 'local':
+        # Иначе бот создал бы своё отдельное лобби, которого не видит веб-приложение
+        if 'api.lobby' not in sys.modules:
+            raise ValueError("LOBBY_CLIENT=local: API лобби (api.lobby) не запущено в этом процессе, используйте http")
+        return LocalLobbyClient()
+    if kind == 'http':
+        return HttpLobbyClient(base_url)
+    raise ValueError(f"Неизвестный LOBBY_CLIENT: {kind}")
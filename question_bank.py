@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Внешний банк вопросов викторины: индексированный файл, читаемый через mmap.
+
+Формат (little-endian):
+    заголовок      <4sHIII: сигнатура, версия, число вопросов, число групп, длина списка категорий
+    категории      JSON-список названий
+    группы         <HBII на группу: номер категории, сложность, первый и последний+1 индекс
+    смещения       <Q на вопрос и одно завершающее: начало записи в файле
+    записи         JSON каждого вопроса (UTF-8)
+
+Вопросы отсортированы по (категория, сложность), поэтому каждая группа -
+непрерывный диапазон индексов. При открытии читаются только заголовок и
+таблица групп; вопрос декодируется при обращении к нему.
+
+Сборка банка из JSON-списка вопросов:
+    python question_bank.py questions.json questions.qbank
+"""
+
+import io
+import os
+import sys
+import json
+import mmap
+import bisect
+import random
+import struct
+import itertools
+from typing import Dict, Iterable, List, Optional
+
+# Файл банка вопросов для bot.py (пусто - встроенные вопросы game_data.py)
+QUIZ_BANK_FILE = os.getenv('QUIZ_BANK_FILE', '')
+
+MAGIC = b'QBNK'
+VERSION = 1
+HEADER = struct.Struct('<4sHIII')
+GROUP = struct.Struct('<HBII')
+OFFSET = struct.Struct('<Q')
+
+DEFAULT_CATEGORY = 'general'
+DEFAULT_DIFFICULTY = 1
+
+def build_question_bank(path: str, questions: Iterable[Dict]):
+    """Записать вопросы в файл банка.
+
+    Категория и сложность берутся из полей 'category' и 'difficulty' вопроса.
+    """
+    def group_key(question):
+        return question.get('category', DEFAULT_CATEGORY), question.get('difficulty', DEFAULT_DIFFICULTY)
+
+    questions = sorted(questions, key=group_key)
+    categories = sorted({category for category, _ in map(group_key, questions)})
+    category_ids = {category: number for number, category in enumerate(categories)}
+
+    groups = []
+    start = 0
+    for (category, difficulty), members in itertools.groupby(questions, key=group_key):
+        end = start + sum(1 for _ in members)
+        groups.append(GROUP.pack(category_ids[category], difficulty, start, end))
+        start = end
+
+    records = [json.dumps(question, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+               for question in questions]
+    category_data = json.dumps(categories, ensure_ascii=False).encode('utf-8')
+
+    offset = HEADER.size + len(category_data) + GROUP.size * len(groups) + OFFSET.size * (len(records) + 1)
+    offsets = io.BytesIO()
+    for record in records:
+        offsets.write(OFFSET.pack(offset))
+        offset += len(record)
+    offsets.write(OFFSET.pack(offset))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(records), len(groups), len(category_data)))
+        f.write(category_data)
+        f.writelines(groups)
+        f.write(offsets.getvalue())
+        f.writelines(records)
+    os.replace(tmp_path, path)
+
+class QuestionBank:
+    """Банк вопросов в файле: последовательность вопросов, декодируемых по запросу.
+
+    Время открытия и занятая память не зависят от числа вопросов: страницы
+    файла подгружает ОС по мере обращения.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.count, group_count, category_size = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Неизвестный формат банка вопросов: {path}")
+
+        position = HEADER.size
+        self.categories: List[str] = json.loads(self._mm[position:position + category_size])
+        position += category_size
+
+        self.groups = [GROUP.unpack_from(self._mm, position + GROUP.size * number) for number in range(group_count)]
+        self._offsets_at = position + GROUP.size * group_count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index: int) -> Dict:
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        start, end = struct.unpack_from('<QQ', self._mm, self._offsets_at + OFFSET.size * index)
+        return json.loads(self._mm[start:end])
+
+    def _ranges(self, category: Optional[str], difficulty: Optional[int]) -> List[range]:
+        """Диапазоны индексов групп, подходящих под фильтр"""
+        if category is not None and category not in self.categories:
+            return []
+        category_id = self.categories.index(category) if category is not None else None
+        return [
+            range(start, end) for group_category, group_difficulty, start, end in self.groups
+            if (category_id is None or group_category == category_id)
+            and (difficulty is None or group_difficulty == difficulty)
+        ]
+
+    def count_questions(self, category: Optional[str] = None, difficulty: Optional[int] = None) -> int:
+        """Число вопросов с заданной категорией и сложностью"""
+        return sum(len(indices) for indices in self._ranges(category, difficulty))
+
+    def sample(self, k: int, category: Optional[str] = None, difficulty: Optional[int] = None) -> List[int]:
+        """Случайные индексы до k разных вопросов с заданной категорией и сложностью"""
+        ranges = self._ranges(category, difficulty)
+        bounds = list(itertools.accumulate(len(indices) for indices in ranges))
+        total = bounds[-1] if bounds else 0
+
+        indices = []
+        for pick in random.sample(range(total), min(k, total)):
+            number = bisect.bisect_right(bounds, pick)
+            indices.append(ranges[number][pick - (bounds[number - 1] if number else 0)])
+        return indices
+
+    def close(self):
+        """Закрыть файл банка"""
+        self._mm.close()
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Использование: python question_bank.py questions.json questions.qbank")
+        sys.exit(1)
+
+    with open(sys.argv[1], 'r', encoding='utf-8') as f:
+        source = json.load(f)
+    build_question_bank(sys.argv[2], source)
+    print(f"✅ Записано вопросов: {len(source)} -> {sys.argv[2]}")
@@ -0,0 +1,165 @@
+import os
+import logging
+import sqlite3
+import threading
+from typing import Dict, Tuple
+
+from debounced_writer import DebouncedWriter
+
+logger = logging.getLogger(__name__)
+
+# Файл базы викторины и минимальный интервал между записями на диск (мс)
+QUIZ_DB_FILE = os.getenv('QUIZ_DB_FILE', 'quiz_data.db')
+QUIZ_FLUSH_INTERVAL_MS = int(os.getenv('QUIZ_FLUSH_INTERVAL_MS', 1000))
+
+# Сохраненная сессия: (typecode, индексы вопросов, позиция, счет, ответы)
+SessionRow = Tuple[str, bytes, int, int, bytes]
+
+class SqliteQuizStore:
+    """Хранилище счетов и незавершенных игр викторины в SQLite (WAL).
+
+    Ответы только запоминают последнее состояние пользователя в памяти,
+    а фоновый поток пишет накопленное одной транзакцией не чаще раза
+    в interval_ms, поэтому бот не ждет диска на каждом ответе.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS scores (
+            user_id INTEGER PRIMARY KEY,
+            score INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS sessions (
+            user_id INTEGER PRIMARY KEY,
+            typecode TEXT NOT NULL,
+            question_order BLOB NOT NULL,
+            position INTEGER NOT NULL,
+            score INTEGER NOT NULL,
+            answers BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            games_played INTEGER NOT NULL,
+            games_completed INTEGER NOT NULL,
+            answers INTEGER NOT NULL,
+            correct_answers INTEGER NOT NULL,
+            streak INTEGER NOT NULL,
+            best_streak INTEGER NOT NULL,
+            answer_time REAL NOT NULL
+        );
+    """
+
+    STATS_COLUMNS = 'games_played, games_completed, answers, correct_answers, streak, best_streak, answer_time'
+
+    def __init__(self, path=QUIZ_DB_FILE, interval_ms=QUIZ_FLUSH_INTERVAL_MS):
+        self.path = path
+        self.interval = interval_ms / 1000
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+
+        # Несохраненные изменения: на каждого пользователя только последнее значение
+        self._scores: Dict[int, int] = {}
+        self._sessions: Dict[int, SessionRow] = {}  # None - сессию нужно удалить
+        self._stats: Dict[int, Tuple] = {}
+        # Ответы при старте бота идут пачкой, поэтому первая запись тоже ждет интервал
+        self._writer = DebouncedWriter(
+            self.flush, lambda: bool(self._scores or self._sessions or self._stats),
+            self.interval, name='quiz-store', delay_first=True
+        )
+        self._cond = self._writer.cond
+        self._flush_lock = threading.Lock()
+
+    def load(self):
+        """Загрузить счета, незавершенные игры и счетчики пользователей"""
+        with self._flush_lock:
+            scores = dict(self._conn.execute('SELECT user_id, score FROM scores'))
+            sessions = {
+                row[0]: row[1:] for row in self._conn.execute(
+                    'SELECT user_id, typecode, question_order, position, score, answers FROM sessions'
+                )
+            }
+            stats = {
+                row[0]: row[1:] for row in self._conn.execute(
+                    f'SELECT user_id, {self.STATS_COLUMNS} FROM user_stats'
+                )
+            }
+        logger.info("Загружено счетов=%d игр=%d path=%s", len(scores), len(sessions), self.path)
+        return {'scores': scores, 'sessions': sessions, 'stats': stats}
+
+    def save_score(self, user_id: int, score: int):
+        """Запомнить общий счет пользователя"""
+        with self._cond:
+            self._scores[user_id] = score
+            self._wake()
+
+    def save_session(self, user_id: int, session):
+        """Запомнить текущее состояние игры пользователя"""
+        row = (session.order.typecode, session.order.tobytes(), session.position,
+               session.score, session.answers.tobytes())
+        with self._cond:
+            self._sessions[user_id] = row
+            self._wake()
+
+    def save_stats(self, user_id: int, stats):
+        """Запомнить счетчики пользователя (game_logic.UserStats)"""
+        row = stats.astuple()
+        with self._cond:
+            self._stats[user_id] = row
+            self._wake()
+
+    def delete_session(self, user_id: int):
+        """Удалить завершенную игру пользователя"""
+        with self._cond:
+            self._sessions[user_id] = None
+            self._wake()
+
+    def _wake(self):
+        """Разбудить поток записи (под self._cond)"""
+        self._writer.wake()
+
+    def flush(self):
+        """Записать накопленные изменения одной транзакцией"""
+        with self._flush_lock:
+            with self._cond:
+                scores, self._scores = self._scores, {}
+                sessions, self._sessions = self._sessions, {}
+                stats, self._stats = self._stats, {}
+            if not scores and not sessions and not stats:
+                return
+
+            try:
+                with self._conn:
+                    self._conn.execute('BEGIN IMMEDIATE')
+                    self._conn.executemany(
+                        'INSERT OR REPLACE INTO scores (user_id, score) VALUES (?, ?)',
+                        scores.items()
+                    )
+                    self._conn.executemany(
+                        'INSERT OR REPLACE INTO sessions '
+                        '(user_id, typecode, question_order, position, score, answers) VALUES (?, ?, ?, ?, ?, ?)',
+                        [(user_id,) + row for user_id, row in sessions.items() if row is not None]
+                    )
+                    self._conn.executemany(
+                        'DELETE FROM sessions WHERE user_id = ?',
+                        [(user_id,) for user_id, row in sessions.items() if row is None]
+                    )
+                    self._conn.executemany(
+                        f'INSERT OR REPLACE INTO user_stats (user_id, {self.STATS_COLUMNS}) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        [(user_id,) + row for user_id, row in stats.items()]
+                    )
+            except Exception as e:
+                # Вернем изменения в очередь, не затирая более новые
+                with self._cond:
+                    for user_id, score in scores.items():
+                        self._scores.setdefault(user_id, score)
+                    for user_id, row in sessions.items():
+                        self._sessions.setdefault(user_id, row)
+                    for user_id, row in stats.items():
+                        self._stats.setdefault(user_id, row)
+                logger.error("Ошибка сохранения викторины path=%s: %s", self.path, e)
+
+    def close(self):
+        """Записать оставшиеся счета и игры и остановить поток записи"""
+        self._writer.close()
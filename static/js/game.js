@@ -12,6 +12,8 @@ let moveHistory = [];
 let telegramWebApp = null;
 let isTelegramApp = false;
 let isComputerTurn = false;
+let clockState = null;
+let clockTimer = null;
 
 // Инициализация при загрузке страницы
 document.addEventListener('DOMContentLoaded', function() {
@@ -200,7 +202,9 @@ function initializeSocket() {
             socket.emit('join_game', { 
                 game_id: GAME_ID,
                 game_type: GAME_TYPE,
-                player_id: user.id
+                player_id: user.id,
+                role: gameMode === 'spectator' ? 'spectator' : 'player',
+                time_control: new URLSearchParams(window.location.search).get('tc')
             });
         });
         
@@ -219,6 +223,7 @@ function initializeSocket() {
             updateGameStatus(data.status);
             updatePlayerStatus();
             updateGameTitle();
+            updateClock(data.clock);
             
             // Показываем главную кнопку в Telegram
             showMainButton();
@@ -228,6 +233,7 @@ function initializeSocket() {
             console.log('Ход сделан:', data);
             updateBoard(data.board);
             updateGameStatus(data.status);
+            updateClock(data.clock);
             addMoveToHistory(data);
             clearSelection();
             
@@ -238,6 +244,57 @@ function initializeSocket() {
             }
         });
         
+        // Соперник сел за доску: часы белых запускаются с этого момента
+        socket.on('player_joined', function(data) {
+            console.log('Соперник присоединился:', data);
+            updateClock(data.clock);
+        });
+        
+        // Режим зрителя: сервер присылает уже закодированные JSON-строки
+        socket.on('spectator_joined', function(data) {
+            console.log('Подключились как зритель:', data.spectators);
+            const snapshot = JSON.parse(data.snapshot);
+            gameId = snapshot.game_id;
+            gameType = snapshot.game_type;
+            playerColor = null;
+            updateBoard(snapshot.board);
+            updateGameStatus(snapshot.status);
+            updateGameTitle();
+            data.moves.forEach(encoded => addMoveToHistory(JSON.parse(encoded)));
+            updateClock(data.clock);
+            
+            const whiteStatus = document.getElementById('whiteStatus');
+            const blackStatus = document.getElementById('blackStatus');
+            if (whiteStatus && blackStatus) {
+                whiteStatus.textContent = 'Игрок';
+                blackStatus.textContent = 'Игрок';
+            }
+            
+            if (snapshot.game_over) {
+                showGameOver(snapshot.winner);
+            }
+        });
+        
+        socket.on('spectator_event', function(encoded) {
+            const data = JSON.parse(encoded);
+            updateBoard(data.board);
+            updateGameStatus(data.status);
+            updateClock(data.clock);
+            addMoveToHistory(data);
+            
+            if (data.game_over) {
+                showGameOver(data.winner);
+            }
+        });
+        
+        // Флажок упал: сервер сам завершает партию
+        socket.on('time_over', function(data) {
+            updateGameStatus(data.status);
+            updateClock(data.clock);
+            showGameOver(data.winner);
+            hideMainButton();
+        });
+        
         socket.on('valid_moves', function(data) {
             validMoves = data.moves;
             highlightValidMoves();
@@ -441,6 +498,11 @@ function createGameBoard() {
 
 // Обработка клика по клетке
 function handleSquareClick(row, col) {
+    // Зрители только наблюдают за партией
+    if (!playerColor) {
+        return;
+    }
+    
     const square = getSquare(row, col);
     
     if (selectedSquare) {
@@ -568,6 +630,47 @@ function updatePlayerStatus() {
     }
 }
 
+// Обновление шахматных часов (сервер присылает оставшееся время в секундах)
+function updateClock(clock) {
+    clockState = clock ? { ...clock, receivedAt: Date.now() } : null;
+    
+    if (clockTimer) {
+        clearInterval(clockTimer);
+        clockTimer = null;
+    }
+    
+    renderClock();
+    
+    // Локально отсчитываем только отображение, флажок фиксирует сервер
+    if (clockState && clockState.running) {
+        clockTimer = setInterval(renderClock, 250);
+    }
+}
+
+function renderClock() {
+    ['white', 'black'].forEach(color => {
+        const element = document.getElementById(`${color}Clock`);
+        if (!element) {
+            return;
+        }
+        
+        if (!clockState) {
+            element.textContent = '';
+            return;
+        }
+        
+        let seconds = clockState[color];
+        if (clockState.running === color) {
+            seconds -= (Date.now() - clockState.receivedAt) / 1000;
+        }
+        seconds = Math.max(0, Math.ceil(seconds));
+        
+        const minutes = Math.floor(seconds / 60);
+        element.textContent = `${minutes}:${String(seconds % 60).padStart(2, '0')}`;
+        element.classList.toggle('running', clockState.running === color);
+    });
+}
+
 // Обновление заголовка игры
 function updateGameTitle() {
     const titleElement = document.getElementById('gameTitle');
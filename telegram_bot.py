@@ -1,4 +1,5 @@
 import os
+import asyncio
 import logging
 from telegram import Update, WebAppInfo, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
@@ -6,6 +7,7 @@ from flask import Flask, render_template
 import threading
 import time
 from dotenv import load_dotenv
+from lobby_client import LobbyError, LobbyUnavailable, create_lobby_client
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -16,6 +18,8 @@ logging.basicConfig(
     level=logging.INFO
 )
 logger = logging.getLogger(__name__)
+# httpx пишет INFO на каждый запрос к API лобби и Telegram
+logging.getLogger('httpx').setLevel(logging.WARNING)
 
 # Конфигурация для Railway
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', 'YOUR_BOT_TOKEN_HERE')
@@ -24,10 +28,92 @@ PORT = int(os.getenv('PORT', 5000))
 HOST = os.getenv('HOST', '0.0.0.0')
 LOBBY_API_BASE = f"{WEBAPP_URL}/api/lobby"
 
+# Число обновлений, которые бот обрабатывает одновременно
+BOT_CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', 256))
+
+# Сколько секунд сообщение /lobby отдается из кеша без проверки версии лобби
+LOBBY_CACHE_TTL = float(os.getenv('LOBBY_CACHE_TTL', 3))
+# Сколько игр показывает /lobby
+LOBBY_LIST_LIMIT = 10
+
+def render_lobby_listing(games):
+    """Текст и клавиатура сообщения /lobby"""
+    if not games:
+        return "Пока нет открытых игр. Используйте /games чтобы создать лобби.", None
+    
+    rows = []
+    for game in games:
+        gid = game['id']
+        gtype = 'шахматы' if game['type'] == 'chess' else 'шашки'
+        text = f"{gtype} • {game['players_count']}/{game['max_players']} • {game['creator']}"
+        rows.append([InlineKeyboardButton(text, callback_data=f"join_game_{gid}")])
+    return "Выберите игру для присоединения:", InlineKeyboardMarkup(rows)
+
+class LobbyListingCache:
+    """Готовое сообщение /lobby, общее для всех чатов.
+
+    В пределах TTL сообщение отдается без обращения к лобби, затем лобби
+    перепроверяется по версии и сообщение перерисовывается, только если
+    список изменился. Одновременные промахи ждут один общий запрос.
+    """
+    
+    def __init__(self, lobby, ttl=LOBBY_CACHE_TTL):
+        self.lobby = lobby
+        self.ttl = ttl
+        self.version = None
+        self.message = None  # (text, reply_markup)
+        self.expires_at = 0.0
+        self._lock = asyncio.Lock()
+    
+    def invalidate(self):
+        """Перепроверить лобби при следующем /lobby (бот сам изменил список)"""
+        self.expires_at = 0.0
+    
+    def _fresh(self):
+        """Можно ли отдать сообщение без обращения к лобби"""
+        return self.message is not None and time.monotonic() < self.expires_at
+    
+    async def get(self):
+        """Текст и клавиатура списка открытых игр"""
+        if self._fresh():
+            return self.message
+        
+        async with self._lock:
+            if self._fresh():
+                return self.message
+            
+            version, games = await self.lobby.list_games_since(
+                self.version if self.message is not None else None,
+                limit=LOBBY_LIST_LIMIT
+            )
+            if games is not None:
+                self.message = render_lobby_listing(games)
+            self.version = version
+            self.expires_at = time.monotonic() + self.ttl
+            return self.message
+
 class TelegramGameBot:
     def __init__(self):
-        self.application = Application.builder().token(BOT_TOKEN).build()
+        # HTTP к API лобби или прямые вызовы LobbyManager (LOBBY_CLIENT)
+        self.lobby = create_lobby_client(LOBBY_API_BASE)
+        self.lobby_listing = LobbyListingCache(self.lobby)
+        self.application = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .concurrent_updates(BOT_CONCURRENT_UPDATES)
+            .post_init(self.open_lobby_client)
+            .post_shutdown(self.close_lobby_client)
+            .build()
+        )
         self.setup_handlers()
+    
+    async def open_lobby_client(self, application: Application):
+        """Открыть клиент лобби при старте бота"""
+        await self.lobby.open()
+    
+    async def close_lobby_client(self, application: Application):
+        """Закрыть клиент лобби при остановке бота"""
+        await self.lobby.close()
         
     def setup_handlers(self):
         """Настройка обработчиков команд"""
@@ -180,87 +266,64 @@ class TelegramGameBot:
     async def create_game_direct(self, update: Update, context: ContextTypes.DEFAULT_TYPE, game_type: str):
         """Создание игры прямо в боте"""
         user = update.effective_user
+        query = update.callback_query
         
         try:
-            # Создаем игру через API
-            import requests
-            import json
+            game = await self.lobby.create_game(
+                str(user.id),
+                user.username or user.first_name or 'Player',
+                game_type
+            )
+            self.lobby_listing.invalidate()
+            game_id = game['id']
+            game_name = "шахматы" if game_type == "chess" else "шашки"
             
-            game_data = {
-                'user_id': str(user.id),
-                'username': user.username or user.first_name or 'Player',
-                'game_type': game_type
-            }
+            # Создаем кнопку для присоединения к игре
+            keyboard = [
+                [InlineKeyboardButton("🎮 Присоединиться к игре", web_app=WebAppInfo(url=f"{WEBAPP_URL}/game?game_id={game_id}&type={game_type}"))],
+                [InlineKeyboardButton("📋 Поделиться ссылкой", callback_data=f"share_game_{game_id}")]
+            ]
+            reply_markup = InlineKeyboardMarkup(keyboard)
             
-            response = requests.post(
-                f"{LOBBY_API_BASE}/create",
-                headers={'Content-Type': 'application/json'},
-                json=game_data,
-                timeout=10
+            await query.edit_message_text(
+                f"✅ Игра в {game_name} создана!\n\n"
+                f"🆔 ID игры: <code>{game_id}</code>\n"
+                f"👤 Создатель: {user.first_name}\n"
+                f"⏳ Статус: Ожидание игрока\n\n"
+                f"Отправьте ID игры другу или нажмите кнопку для присоединения!",
+                reply_markup=reply_markup,
+                parse_mode='HTML'
             )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data['status'] == 'ok':
-                    game_id = data['game']['id']
-                    game_name = "шахматы" if game_type == "chess" else "шашки"
-                    
-                    # Создаем кнопку для присоединения к игре
-                    keyboard = [
-                        [InlineKeyboardButton("🎮 Присоединиться к игре", web_app=WebAppInfo(url=f"{WEBAPP_URL}/game?game_id={game_id}&type={game_type}"))],
-                        [InlineKeyboardButton("📋 Поделиться ссылкой", callback_data=f"share_game_{game_id}")]
-                    ]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-                    
-                    await query.edit_message_text(
-                        f"✅ Игра в {game_name} создана!\n\n"
-                        f"🆔 ID игры: <code>{game_id}</code>\n"
-                        f"👤 Создатель: {user.first_name}\n"
-                        f"⏳ Статус: Ожидание игрока\n\n"
-                        f"Отправьте ID игры другу или нажмите кнопку для присоединения!",
-                        reply_markup=reply_markup,
-                        parse_mode='HTML'
-                    )
-                else:
-                    await query.edit_message_text(f"❌ Ошибка создания игры: {data.get('error', 'Неизвестная ошибка')}")
-            else:
-                await query.edit_message_text("❌ Ошибка подключения к серверу")
-                
+        except LobbyUnavailable:
+            await query.edit_message_text("❌ Ошибка подключения к серверу")
+        except LobbyError as e:
+            await query.edit_message_text(f"❌ Ошибка создания игры: {e}")
         except Exception as e:
             await query.edit_message_text(f"❌ Ошибка: {str(e)}")
 
     async def join_game_via_callback(self, query, game_id: str):
         """Присоединение к игре из кнопки в списке лобби"""
-        import requests
         user = query.from_user
         try:
-            payload = {
-                'user_id': str(user.id),
-                'username': user.username or user.first_name or 'Player',
-                'game_id': game_id
-            }
-            response = requests.post(
-                f"{LOBBY_API_BASE}/join",
-                headers={'Content-Type': 'application/json'},
-                json=payload,
-                timeout=10
+            game = await self.lobby.join_game(
+                str(user.id),
+                user.username or user.first_name or 'Player',
+                game_id
             )
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('status') == 'ok':
-                    game_type = data['game']['type']
-                    keyboard = [
-                        [InlineKeyboardButton("🎮 Открыть игру", web_app=WebAppInfo(url=f"{WEBAPP_URL}/game?game_id={game_id}&type={game_type}"))]
-                    ]
-                    await query.edit_message_text(
-                        f"✅ Успешно присоединились!\n\n🆔 <code>{game_id}</code>",
-                        reply_markup=InlineKeyboardMarkup(keyboard),
-                        parse_mode='HTML'
-                    )
-                else:
-                    await query.edit_message_text(f"❌ {data.get('error', 'Не удалось присоединиться')}")
-            else:
-                await query.edit_message_text("❌ Ошибка подключения к серверу")
+            self.lobby_listing.invalidate()
+            game_type = game['type']
+            keyboard = [
+                [InlineKeyboardButton("🎮 Открыть игру", web_app=WebAppInfo(url=f"{WEBAPP_URL}/game?game_id={game_id}&type={game_type}"))]
+            ]
+            await query.edit_message_text(
+                f"✅ Успешно присоединились!\n\n🆔 <code>{game_id}</code>",
+                reply_markup=InlineKeyboardMarkup(keyboard),
+                parse_mode='HTML'
+            )
+        except LobbyUnavailable:
+            await query.edit_message_text("❌ Ошибка подключения к серверу")
+        except LobbyError as e:
+            await query.edit_message_text(f"❌ {e}")
         except Exception as e:
             await query.edit_message_text(f"❌ Ошибка: {str(e)}")
     
@@ -282,101 +345,65 @@ class TelegramGameBot:
         game_id = context.args[0]
         
         try:
-            # Присоединяемся к игре через API
-            import requests
-            
-            join_data = {
-                'user_id': str(user.id),
-                'username': user.username or user.first_name or 'Player',
-                'game_id': game_id
-            }
-            
-            response = requests.post(
-                f"{LOBBY_API_BASE}/join",
-                headers={'Content-Type': 'application/json'},
-                json=join_data,
-                timeout=10
+            game = await self.lobby.join_game(
+                str(user.id),
+                user.username or user.first_name or 'Player',
+                game_id
             )
+            self.lobby_listing.invalidate()
+            game_type = game['type']
+            game_name = "шахматы" if game_type == "chess" else "шашки"
             
-            if response.status_code == 200:
-                data = response.json()
-                if data['status'] == 'ok':
-                    game_type = data['game']['type']
-                    game_name = "шахматы" if game_type == "chess" else "шашки"
-                    
-                    if data['game']['status'] == 'playing':
-                        # Игра готова к началу
-                        keyboard = [
-                            [InlineKeyboardButton("🎮 Начать игру!", web_app=WebAppInfo(url=f"{WEBAPP_URL}/game?game_id={game_id}&type={game_type}"))]
-                        ]
-                        reply_markup = InlineKeyboardMarkup(keyboard)
-                        
-                        await update.message.reply_text(
-                            f"🎉 <b>Игра начинается!</b>\n\n"
-                            f"🎮 Тип: {game_name}\n"
-                            f"🆔 ID: <code>{game_id}</code>\n"
-                            f"👥 Игроков: {len(data['game']['players'])}/2\n\n"
-                            f"Нажмите кнопку, чтобы начать играть!",
-                            reply_markup=reply_markup,
-                            parse_mode='HTML'
-                        )
-                    else:
-                        # Ожидание второго игрока
-                        await update.message.reply_text(
-                            f"✅ <b>Присоединились к игре!</b>\n\n"
-                            f"🎮 Тип: {game_name}\n"
-                            f"🆔 ID: <code>{game_id}</code>\n"
-                            f"👥 Игроков: {len(data['game']['players'])}/2\n"
-                            f"⏳ Статус: Ожидание второго игрока\n\n"
-                            f"Вы будете уведомлены, когда игра начнется!",
-                            parse_mode='HTML'
-                        )
-                else:
-                    await update.message.reply_text(f"❌ Ошибка: {data.get('error', 'Неизвестная ошибка')}")
-            else:
-                await update.message.reply_text("❌ Ошибка подключения к серверу")
+            if game['status'] == 'playing':
+                # Игра готова к началу
+                keyboard = [
+                    [InlineKeyboardButton("🎮 Начать игру!", web_app=WebAppInfo(url=f"{WEBAPP_URL}/game?game_id={game_id}&type={game_type}"))]
+                ]
+                reply_markup = InlineKeyboardMarkup(keyboard)
                 
+                await update.message.reply_text(
+                    f"🎉 <b>Игра начинается!</b>\n\n"
+                    f"🎮 Тип: {game_name}\n"
+                    f"🆔 ID: <code>{game_id}</code>\n"
+                    f"👥 Игроков: {len(game['players'])}/2\n\n"
+                    f"Нажмите кнопку, чтобы начать играть!",
+                    reply_markup=reply_markup,
+                    parse_mode='HTML'
+                )
+            else:
+                # Ожидание второго игрока
+                await update.message.reply_text(
+                    f"✅ <b>Присоединились к игре!</b>\n\n"
+                    f"🎮 Тип: {game_name}\n"
+                    f"🆔 ID: <code>{game_id}</code>\n"
+                    f"👥 Игроков: {len(game['players'])}/2\n"
+                    f"⏳ Статус: Ожидание второго игрока\n\n"
+                    f"Вы будете уведомлены, когда игра начнется!",
+                    parse_mode='HTML'
+                )
+        except LobbyUnavailable:
+            await update.message.reply_text("❌ Ошибка подключения к серверу")
+        except LobbyError as e:
+            await update.message.reply_text(f"❌ Ошибка: {e}")
         except Exception as e:
             await update.message.reply_text(f"❌ Ошибка: {str(e)}")
 
     async def lobby_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать список открытых игр и дать кнопки для входа"""
-        import requests
         try:
-            resp = requests.get(f"{LOBBY_API_BASE}/games", timeout=10)
-            if resp.status_code != 200:
-                await update.message.reply_text("❌ Не удалось получить список игр")
-                return
-            data = resp.json()
-            games = data.get('games', [])
-            if not games:
-                await update.message.reply_text("Пока нет открытых игр. Используйте /games чтобы создать лобби.")
-                return
-            # Показываем первые 10 игр
-            rows = []
-            for game in games[:10]:
-                gid = game['id']
-                gtype = 'шахматы' if game['type'] == 'chess' else 'шашки'
-                text = f"{gtype} • {game['players_count']}/{game['max_players']} • {game['creator']}"
-                rows.append([InlineKeyboardButton(text, callback_data=f"join_game_{gid}")])
-            await update.message.reply_text(
-                "Выберите игру для присоединения:",
-                reply_markup=InlineKeyboardMarkup(rows)
-            )
+            # Сообщение общее для всех чатов и перерисовывается только при изменении лобби
+            text, reply_markup = await self.lobby_listing.get()
+            await update.message.reply_text(text, reply_markup=reply_markup)
+        except LobbyError:
+            await update.message.reply_text("❌ Не удалось получить список игр")
         except Exception as e:
             await update.message.reply_text(f"❌ Ошибка: {str(e)}")
 
     async def my_game_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать мою текущую игру и кнопку для входа"""
-        import requests
         user = update.effective_user
         try:
-            resp = requests.get(f"{LOBBY_API_BASE}/user/{user.id}", timeout=10)
-            if resp.status_code != 200:
-                await update.message.reply_text("Игр не найдено. Создайте новую через /games")
-                return
-            data = resp.json()
-            game = data.get('game')
+            game = await self.lobby.get_user_game(str(user.id))
             if not game:
                 await update.message.reply_text("Игр не найдено. Создайте новую через /games")
                 return
@@ -392,6 +419,8 @@ class TelegramGameBot:
                 reply_markup=InlineKeyboardMarkup(keyboard),
                 parse_mode='HTML'
             )
+        except LobbyUnavailable:
+            await update.message.reply_text("Игр не найдено. Создайте новую через /games")
         except Exception as e:
             await update.message.reply_text(f"❌ Ошибка: {str(e)}")
         
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Тесты игрового WebSocket сервера (без запуска сервера)
+"""
+
+import json
+import time
+from game_clock import GameClock, ClockScheduler, parse_time_control
+from game_server import app, socketio, active_games, check_flags
+
+def _received(client, name):
+    """Возвращает аргументы всех событий с указанным именем"""
+    return [event['args'][0] for event in client.get_received() if event['name'] == name]
+
+def test_spectator_mode():
+    """Тест режима зрителя"""
+    print("👀 Тестирование режима зрителя...")
+    active_games.clear()
+
+    white = socketio.test_client(app)
+    black = socketio.test_client(app)
+    white.emit('join_game', {'game_id': 'spec1', 'game_type': 'chess', 'player_id': 1})
+    black.emit('join_game', {'game_id': 'spec1', 'game_type': 'chess', 'player_id': 2})
+
+    # Третий участник больше не получает "Game is full", а становится зрителем
+    early = socketio.test_client(app)
+    early.emit('join_game', {'game_id': 'spec1', 'player_id': 3})
+    joined = _received(early, 'spectator_joined')
+    assert len(joined) == 1
+    assert json.loads(joined[0]['snapshot'])['game_id'] == 'spec1'
+    assert joined[0]['moves'] == []
+
+    white.emit('make_move', {'game_id': 'spec1', 'player_id': 1, 'from_pos': [6, 4], 'to_pos': [4, 4]})
+
+    # Ход рассылается зрителям одной закодированной строкой
+    events = _received(early, 'spectator_event')
+    assert len(events) == 1
+    assert json.loads(events[0])['to_pos'] == [4, 4]
+
+    # Опоздавший зритель получает снимок и хвост ходов
+    late = socketio.test_client(app)
+    late.emit('join_game', {'game_id': 'spec1', 'player_id': 4, 'role': 'spectator'})
+    joined = _received(late, 'spectator_joined')[0]
+    assert joined['moves'] == events
+    assert joined['spectators'] == 2
+    assert json.loads(joined['snapshot'])['board'][4][4]['type'] == 'pawn'
+
+    # Зритель не может ходить
+    late.emit('make_move', {'game_id': 'spec1', 'player_id': 4, 'from_pos': [1, 4], 'to_pos': [3, 4]})
+    assert _received(late, 'error')[0]['message'] == 'Not your turn'
+
+    late.disconnect()
+    assert len(active_games['spec1']['spectators']) == 1
+    print("✅ Режим зрителя работает корректно")
+
+def test_game_clock():
+    """Тест шахматных часов и общей кучи дедлайнов"""
+    print("⏱ Тестирование шахматных часов...")
+    assert parse_time_control('blitz') == (180, 2)
+    assert parse_time_control('5+3') == (300, 3)
+    assert parse_time_control('abc') is None
+    for value in ('inf+0', '1e309+0', 'nan+0', '-5+0', '100000+0', '5+99999999999999999999'):
+        assert parse_time_control(value) is None
+
+    clock = GameClock(60, 2)
+    clock.start('white', now=0)
+    clock.switch_to('black', now=10)
+    assert clock.time_left('white', now=10) == 52
+    assert clock.time_left('black', now=15) == 55
+
+    scheduler = ClockScheduler()
+    scheduler.schedule('g1', clock)
+    assert scheduler.pop_expired(now=69) == []
+    assert scheduler.pop_expired(now=70) == [('g1', clock.version)]
+    assert len(scheduler) == 0
+    print("✅ Часы работают корректно")
+
+def test_flag_fall():
+    """Тест поражения по времени на сервере"""
+    print("⏰ Тестирование падения флажка...")
+    active_games.clear()
+
+    white = socketio.test_client(app)
+    black = socketio.test_client(app)
+    white.emit('join_game', {'game_id': 'timed1', 'game_type': 'chess', 'player_id': 1, 'time_control': 'bullet'})
+    black.emit('join_game', {'game_id': 'timed1', 'player_id': 2})
+    clock = active_games['timed1']['clock']
+    assert clock.running == 'white'
+    # Белые узнают о запуске своих часов из события о сопернике
+    assert _received(white, 'player_joined')[0]['clock']['running'] == 'white'
+
+    white.emit('make_move', {'game_id': 'timed1', 'player_id': 1, 'from_pos': [6, 4], 'to_pos': [4, 4]})
+    assert clock.running == 'black'
+
+    # Дедлайн белых после хода устарел, флажок падает только у черных
+    check_flags(now=time.monotonic() + 61)
+    game = active_games['timed1']['game']
+    assert game.game_over and game.time_out
+    assert game.winner.value == 'white'
+    assert _received(white, 'time_over')[0]['loser'] == 'black'
+
+    black.emit('make_move', {'game_id': 'timed1', 'player_id': 2, 'from_pos': [1, 4], 'to_pos': [3, 4]})
+    assert _received(black, 'error')[0]['message'] == 'Game over'
+    print("✅ Поражение по времени фиксируется сервером")
+
+if __name__ == '__main__':
+    test_spectator_mode()
+    test_game_clock()
+    test_flag_fall()
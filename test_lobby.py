@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""
+Тесты менеджера лобби (без запуска сервера)
+"""
+
+import os
+import json
+import logging
+import logging.handlers
+import tempfile
+import threading
+import time
+
+# Модульный менеджер лобби не должен писать базу в корень репозитория
+os.environ.setdefault('LOBBY_DB_FILE', os.path.join(tempfile.mkdtemp(), 'lobby_data.db'))
+
+import api.lobby as lobby
+
+def _fresh_lobby():
+    """Создает пустое лобби с базой во временной папке"""
+    store = lobby.SqliteLobbyStore(os.path.join(tempfile.mkdtemp(), 'lobby_data.db'))
+    manager = lobby.LobbyManager(store)
+    return manager, lobby.MatchmakingQueue(manager)
+
+def test_matchmaking_pairs_players():
+    """Тест подбора соперника по типу игры"""
+    print("⚡ Тестирование подбора соперника...")
+    manager, queue = _fresh_lobby()
+
+    assert queue.enqueue(1, 'alice', 'chess') is None
+    assert queue.enqueue(2, 'bob', 'checkers') is None
+    game = queue.enqueue(3, 'carol', 'chess')
+
+    assert game['status'] == 'playing'
+    assert [p['id'] for p in game['players']] == ['1', '3']
+    assert not queue.is_queued(1)
+    assert queue.is_queued(2)
+    assert manager.get_started_game(1)['id'] == game['id']
+    print("✅ Подбор соперника работает корректно")
+
+def test_matchmaking_rating_band():
+    """Тест диапазона рейтинга"""
+    print("🎯 Тестирование диапазона рейтинга...")
+    manager, queue = _fresh_lobby()
+
+    assert queue.enqueue(1, 'low', 'chess', rating=1000, band=100) is None
+    assert queue.enqueue(2, 'high', 'chess', rating=1500, band=100) is None
+    assert queue.enqueue(3, 'mid', 'chess', rating=1150, band=100) is None
+
+    # Ближайший по рейтингу игрок подходит под оба диапазона
+    game = queue.enqueue(4, 'near_high', 'chess', rating=1450)
+    assert [p['id'] for p in game['players']] == ['2', '4']
+
+    assert queue.cancel(1)
+    assert not queue.cancel(1)
+    # Заявка 3 (1150 ± 100) слишком далека для 1000, но подходит для 1100
+    assert queue.enqueue(5, 'far', 'chess', rating=1000) is None
+    assert queue.enqueue(6, 'close', 'chess', rating=1100)['players'][0]['id'] == '3'
+    print("✅ Диапазон рейтинга учитывается")
+
+def test_matchmaking_match_is_never_open():
+    """Тест: подобранная игра не появляется в списке открытых"""
+    print("🔒 Тестирование атомарного создания пары...")
+    manager, queue = _fresh_lobby()
+    version = manager.version
+    queue.enqueue(1, 'alice', 'chess')
+    game = queue.enqueue(2, 'bob', 'chess')
+
+    assert game['status'] == 'playing' and len(game['players']) == 2
+    assert manager.get_available_games()[0] == []
+    # Игра не появлялась в журнале открытых игр, третий игрок не может её занять
+    assert manager.get_changes_since(version) == ([], [])
+    assert manager.join_game(3, 'carol', game['id']) == (None, "Игра уже началась")
+    assert manager.users['2']['current_game'] == game['id']
+    print("✅ Пара создается одной операцией")
+
+def test_matchmaking_tickets_expire():
+    """Тест истечения и продления заявок подбора"""
+    print("👻 Тестирование истечения заявок...")
+    manager, _ = _fresh_lobby()
+    queue = lobby.MatchmakingQueue(manager, ticket_ttl=0.05)
+
+    queue.enqueue(1, 'ghost', 'chess')
+    queue.enqueue(2, 'alive', 'checkers')
+    time.sleep(0.03)
+    assert queue.heartbeat(2)
+    time.sleep(0.03)
+
+    # Закрывший страницу игрок не становится соперником, его заявка убирается
+    assert not queue.is_queued(1) and not queue.heartbeat(1)
+    assert queue.enqueue(3, 'carol', 'chess') is None
+    assert '1' not in queue.tickets and queue.is_queued(3)
+
+    # Продленная заявка жива
+    assert queue.enqueue(4, 'dave', 'checkers')['players'][0]['id'] == '2'
+    print("✅ Заявки истекают без продления")
+
+def test_wait_for_game_start():
+    """Тест long-poll ожидания начала игры"""
+    print("⏳ Тестирование ожидания начала игры...")
+    manager, queue = _fresh_lobby()
+    queue.enqueue(1, 'alice', 'chess')
+
+    result = {}
+    waiter = threading.Thread(target=lambda: result.update(game=manager.wait_for_game_start(1, 5)))
+    waiter.start()
+    queue.enqueue(2, 'bob', 'chess')
+    waiter.join(5)
+
+    assert result['game']['status'] == 'playing'
+    assert manager.wait_for_game_start(99, 0.01) is None
+
+    # Повторный подбор не возвращает прежнюю начавшуюся игру
+    old_game = result['game']
+    assert queue.enqueue(1, 'alice', 'chess') is None
+    assert manager.wait_for_game_start(1, 0.01) is None and queue.is_queued(1)
+    new_game = queue.enqueue(3, 'carol', 'chess')
+    assert new_game['id'] != old_game['id']
+    assert manager.wait_for_game_start(1, 0.01)['id'] == new_game['id']
+    print("✅ Ожидание начала игры работает")
+
+def test_matchmaking_rejects_bad_numbers():
+    """Тест: нечисловые rating и rating_band отклоняются с 400"""
+    print("🔢 Тестирование проверки рейтинга...")
+    client = lobby.app.test_client()
+    for payload in ({'rating': 'abc'}, {'rating_band': 'wide'}, {'rating': 1e309}, {'rating_band': -5}):
+        response = client.post('/api/lobby/matchmaking/join',
+                               json={'user_id': 601, 'username': 'num', 'game_type': 'go', **payload})
+        assert response.status_code == 400 and 'rating' in response.get_json()['error']
+    assert not lobby.matchmaking.is_queued(601)
+
+    response = client.post('/api/lobby/matchmaking/join',
+                           json={'user_id': 601, 'username': 'num', 'game_type': 'go', 'rating': '1500'})
+    assert response.status_code == 200 and lobby.matchmaking.is_queued(601)
+    lobby.matchmaking.cancel(601)
+    print("✅ Некорректный рейтинг отклоняется")
+
+def test_sqlite_store_persists_records():
+    """Тест сохранения отдельных записей и миграции из JSON"""
+    print("💾 Тестирование SQLite хранилища...")
+    folder = tempfile.mkdtemp()
+    json_path = os.path.join(folder, 'lobby_data.json')
+    db_path = os.path.join(folder, 'lobby_data.db')
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump({'games': {}, 'users': {'7': {'username': 'old', 'current_game': None}}}, f)
+
+    manager = lobby.LobbyManager(lobby.SqliteLobbyStore(db_path, migrate_from=json_path))
+    assert manager.users['7']['username'] == 'old'
+
+    game = manager.create_game(1, 'alice', 'chess')
+    manager.join_game(2, 'bob', game['id'])
+    manager.leave_game(2, game['id'])
+
+    # Повторное открытие не повторяет миграцию и видит все изменения
+    reopened = lobby.LobbyManager(lobby.SqliteLobbyStore(db_path, migrate_from=json_path))
+    assert reopened.games[game['id']]['status'] == 'waiting'
+    assert set(reopened.users) == {'1', '7'}
+
+    manager.leave_game(1, game['id'])
+    reopened = lobby.LobbyManager(lobby.SqliteLobbyStore(db_path))
+    assert reopened.games == {}
+    print("✅ SQLite хранилище работает корректно")
+
+def test_unwritable_db_falls_back_to_memory():
+    """Тест: недоступный файл базы не ломает импорт лобби"""
+    print("📵 Тестирование лобби без записи на диск...")
+    path = lobby.LOBBY_DB_FILE
+    lobby.LOBBY_DB_FILE = os.path.join(tempfile.mkdtemp(), 'missing', 'lobby_data.db')
+    try:
+        store = lobby.create_store()
+    finally:
+        lobby.LOBBY_DB_FILE = path
+    assert store.path == ':memory:'
+
+    manager = lobby.LobbyManager(store)
+    game = manager.create_game(1, 'alice', 'chess')
+    assert [item['id'] for item in manager.get_available_games()[0]] == [game['id']]
+    print("✅ Лобби работает в памяти, если базу нельзя открыть")
+
+def test_json_store_background_snapshots():
+    """Тест отложенной атомарной записи JSON-хранилища"""
+    print("📝 Тестирование фоновых снимков JSON...")
+    path = os.path.join(tempfile.mkdtemp(), 'lobby_data.json')
+    store = lobby.JsonLobbyStore(path, interval_ms=60000)
+    manager = lobby.LobbyManager(store)
+
+    # Первая запись уходит сразу, остальные копятся до конца интервала
+    for user_id in range(20):
+        manager.create_user(user_id, f'user{user_id}')
+    store.close()
+
+    assert store.metrics['snapshots'] <= 2
+    assert store.metrics['last_size_bytes'] == os.path.getsize(path)
+    assert not os.path.exists(path + '.tmp')
+    with open(path, encoding='utf-8') as f:
+        content = f.read()
+    assert '\n' not in content
+    assert len(json.loads(content)['users']) == 20
+    print("✅ Фоновые снимки JSON работают корректно")
+
+def test_json_snapshot_is_consistent():
+    """Тест: снимок содержит только целые изменения, а не живые словари менеджера"""
+    print("🧊 Тестирование согласованности снимка JSON...")
+    path = os.path.join(tempfile.mkdtemp(), 'lobby_data.json')
+    store = lobby.JsonLobbyStore(path, interval_ms=60000)
+    manager = lobby.LobbyManager(store)
+    game = manager.create_game(1, 'alice', 'chess')
+
+    # Изменение, которое еще не дошло до _commit (как в середине join_game)
+    game['players'].append({'id': '2', 'username': 'bob', 'ready': True})
+    store.flush()
+    with open(path, encoding='utf-8') as f:
+        saved = json.load(f)
+    assert len(saved['games'][game['id']]['players']) == 1
+    assert saved['users']['1']['current_game'] == game['id'] and '2' not in saved['users']
+
+    game['players'].pop()
+    manager.join_game(2, 'bob', game['id'])
+    store.close()
+    reopened = lobby.LobbyManager(lobby.JsonLobbyStore(path))
+    assert reopened.games[game['id']]['status'] == 'playing'
+    assert reopened.users['2']['current_game'] == game['id']
+    # Менеджер не делит словари с хранилищем
+    assert reopened.games is not reopened.store.records['games']
+    print("✅ Снимок JSON согласован")
+
+def test_open_games_index_and_pagination():
+    """Тест индекса открытых игр и постраничного списка"""
+    print("📋 Тестирование индекса открытых игр...")
+    manager, _ = _fresh_lobby()
+
+    created = [manager.create_game(user_id, f'user{user_id}', 'chess' if user_id % 2 else 'checkers')
+               for user_id in range(1, 8)]
+    manager.join_game(100, 'joiner', created[0]['id'])
+    assert manager.count_available_games() == 6
+    assert manager.count_available_games('chess') == 3
+
+    # Постраничный обход возвращает все открытые игры по одному разу в порядке создания
+    seen, cursor = [], None
+    while True:
+        page, cursor = manager.get_available_games(limit=4, cursor=cursor)
+        seen.extend(game['id'] for game in page)
+        if cursor is None:
+            break
+    assert seen == [game['id'] for game in created[1:]]
+
+    chess, _ = manager.get_available_games('chess')
+    assert [game['id'] for game in chess] == [created[2]['id'], created[4]['id'], created[6]['id']]
+
+    # Игра снова открыта, когда второй игрок вышел
+    manager.leave_game(100, created[0]['id'])
+    first, _ = manager.get_available_games(limit=1)
+    assert first[0]['id'] == created[0]['id']
+    print("✅ Индекс открытых игр работает корректно")
+
+def test_conditional_get_and_since():
+    """Тест ETag/304 и списка изменений ?since="""
+    print("🏷 Тестирование условных запросов...")
+    client = lobby.app.test_client()
+
+    first = client.get('/api/lobby/games')
+    etag = first.headers['ETag']
+    version = first.get_json()['version']
+    assert first.headers['Last-Modified']
+    assert client.get('/api/lobby/games', headers={'If-None-Match': etag}).status_code == 304
+
+    created = client.post('/api/lobby/create', json={'user_id': 501, 'username': 'etag', 'game_type': 'chess'})
+    game_id = created.get_json()['game']['id']
+
+    changed = client.get('/api/lobby/games', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+    delta = client.get(f'/api/lobby/games?since={version}').get_json()
+    assert delta['full'] is False
+    assert [game['id'] for game in delta['added']] == [game_id]
+
+    client.post('/api/lobby/leave', json={'user_id': 501, 'game_id': game_id})
+    delta = client.get(f'/api/lobby/games?since={version}').get_json()
+    assert delta['added'] == [] and delta['removed'] == [game_id]
+
+    # Слишком старая версия - полный список
+    assert client.get('/api/lobby/games?since=1').get_json()['full'] is True
+
+    user = client.get('/api/lobby/user/501')
+    assert client.get('/api/lobby/user/501', headers={'If-None-Match': user.headers['ETag']}).status_code == 304
+    print("✅ Условные запросы работают корректно")
+
+def test_lobby_event_stream():
+    """Тест потока Server-Sent Events"""
+    print("📡 Тестирование потока событий лобби...")
+    manager = lobby.lobby_manager
+    stream = lobby.lobby_event_stream(None, max_duration=5)
+
+    assert next(stream).startswith('retry:')
+    assert next(stream).startswith(f'id: {manager.version}\nevent: snapshot')
+
+    game = manager.create_game(601, 'sse', 'checkers')
+    event = next(stream)
+    assert 'event: game_created' in event and game['id'] in event
+
+    manager.join_game(602, 'sse2', game['id'])
+    event = next(stream)
+    assert f'id: {manager.version}' in event and 'event: game_filled' in event
+
+    manager.leave_game(601, game['id'])
+    manager.leave_game(602, game['id'])
+    # Игра снова стала открытой и была удалена: подписчику важно только последнее
+    assert 'event: game_removed' in next(stream)
+
+    # Без долгоживущего процесса поток отключен: клиент переходит на опрос
+    enabled = lobby.LOBBY_SSE_ENABLED
+    lobby.LOBBY_SSE_ENABLED = False
+    try:
+        assert lobby.app.test_client().get('/api/lobby/events').status_code == 204
+    finally:
+        lobby.LOBBY_SSE_ENABLED = enabled
+    print("✅ Поток событий лобби работает корректно")
+
+def test_cleanup_expired_games():
+    """Тест инкрементальной очистки устаревших игр"""
+    print("🧹 Тестирование очистки устаревших игр...")
+    manager, _ = _fresh_lobby()
+
+    old = manager.create_game(1, 'alice', 'chess')
+    manager.join_game(2, 'bob', old['id'])
+    now = time.time()
+    fresh = manager.create_game(3, 'carol', 'checkers')
+    # Игра старше суток удаляется, хотя .seconds у такой разницы мал
+    manager.expiry_heap[0] = (now - 86400, old['id'], old['created_at'])
+
+    assert manager.cleanup_old_games(now) == 1
+    assert old['id'] not in manager.games and fresh['id'] in manager.games
+    assert manager.users['1']['current_game'] is None
+    assert manager.users['2']['current_game'] is None
+    assert manager.get_started_game(1) is None
+
+    # Удаленная через leave игра оставляет в куче только устаревшую запись
+    manager.leave_game(3, fresh['id'])
+    assert manager.cleanup_old_games(now + lobby.GAME_TTL + 1) == 0
+    assert manager.expiry_heap == []
+    print("✅ Очистка устаревших игр работает корректно")
+
+class _SlowPlayers(list):
+    """Список игроков, уступающий поток при проверке числа мест"""
+
+    def __len__(self):
+        size = super().__len__()
+        time.sleep(0.001)
+        return size
+
+def test_concurrent_joins_do_not_overfill():
+    """Стресс-тест одновременных присоединений"""
+    print("🔒 Тестирование одновременных присоединений...")
+    manager, _ = _fresh_lobby()
+    games = [manager.create_game(user_id, f'creator{user_id}', 'chess') for user_id in range(10)]
+    # Расширяем окно гонки между проверкой мест и добавлением игрока
+    for game in games:
+        game['players'] = _SlowPlayers(game['players'])
+
+    barrier = threading.Barrier(16)
+    joined = []
+
+    def worker(user_id):
+        barrier.wait()
+        for game in games:
+            _, message = manager.join_game(user_id, f'user{user_id}', game['id'])
+            if message == "Успешно присоединились":
+                joined.append(game['id'])
+
+    threads = [threading.Thread(target=worker, args=(user_id,)) for user_id in range(100, 116)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(joined) == sorted(game['id'] for game in games)
+    assert all(len(manager.games[game['id']]['players']) == 2 for game in games)
+    assert manager.count_available_games() == 0
+    print("✅ Игры не переполняются при одновременных присоединениях")
+
+def test_joins_on_different_games_overlap():
+    """Стресс-тест: запись на диск не сериализует изменения разных игр"""
+    print("⏱️ Тестирование параллельных присоединений к разным играм...")
+    manager, _ = _fresh_lobby()
+    games = [manager.create_game(user_id, f'creator{user_id}', 'chess') for user_id in range(10)]
+
+    # Медленный диск: каждая транзакция занимает 50 мс
+    write_changes = manager.store._write_changes
+    def slow_write(changes):
+        time.sleep(0.05)
+        write_changes(changes)
+    manager.store._write_changes = slow_write
+    transactions = manager.store.metrics['transactions']
+
+    barrier = threading.Barrier(len(games))
+    spans = []
+
+    def worker(number, game):
+        barrier.wait()
+        started = time.monotonic()
+        _, message = manager.join_game(100 + number, f'user{number}', game['id'])
+        spans.append((started, time.monotonic()))
+        assert message == "Успешно присоединились"
+
+    threads = [threading.Thread(target=worker, args=(number, game)) for number, game in enumerate(games)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(spans) == len(games)
+    # Все присоединения шли одновременно, а не по очереди за 10 * 50 мс
+    assert max(start for start, _ in spans) < min(end for _, end in spans)
+    assert max(end for _, end in spans) - min(start for start, _ in spans) < 0.3
+    assert manager.store.metrics['transactions'] - transactions <= 3
+
+    reopened = lobby.SqliteLobbyStore(manager.store.path).load()
+    assert all(len(reopened['games'][game['id']]['players']) == 2 for game in games)
+    print("✅ Присоединения к разным играм не ждут друг друга")
+
+def test_logging_is_sampled_and_queued():
+    """Тест логирования через очередь с выборкой DEBUG-записей"""
+    print("🪵 Тестирование логирования лобби...")
+    assert isinstance(lobby.logger.handlers[0], logging.handlers.QueueHandler)
+
+    records = []
+    collector = logging.Handler()
+    collector.emit = records.append
+    lobby.logger.addHandler(collector)
+    level, rate = lobby.logger.level, lobby.LOBBY_LOG_SAMPLE_RATE
+    lobby.logger.setLevel(logging.DEBUG)
+    try:
+        client = lobby.app.test_client()
+        lobby.LOBBY_LOG_SAMPLE_RATE = 0
+        for _ in range(20):
+            client.get('/api/lobby/games')
+        assert records == []
+
+        # Запрос пользователя больше не выводит список всех пользователей
+        lobby.lobby_manager.create_user(701, 'logged')
+        lobby.LOBBY_LOG_SAMPLE_RATE = 1
+        records.clear()
+        client.get('/api/lobby/user/702')
+        messages = [record.getMessage() for record in records]
+        assert messages and not any('701' in message for message in messages)
+    finally:
+        lobby.logger.removeHandler(collector)
+        lobby.logger.setLevel(level)
+        lobby.LOBBY_LOG_SAMPLE_RATE = rate
+    print("✅ Логирование лобби работает корректно")
+
+if __name__ == '__main__':
+    test_matchmaking_pairs_players()
+    test_matchmaking_rating_band()
+    test_matchmaking_match_is_never_open()
+    test_matchmaking_tickets_expire()
+    test_wait_for_game_start()
+    test_matchmaking_rejects_bad_numbers()
+    test_sqlite_store_persists_records()
+    test_unwritable_db_falls_back_to_memory()
+    test_json_store_background_snapshots()
+    test_json_snapshot_is_consistent()
+    test_open_games_index_and_pagination()
+    test_conditional_get_and_since()
+    test_lobby_event_stream()
+    test_cleanup_expired_games()
+    test_concurrent_joins_do_not_overfill()
+    test_joins_on_different_games_overlap()
+    test_logging_is_sampled_and_queued()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Тесты клиентов лобби для бота (без запуска сервера)
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+import httpx
+
+# Модульный менеджер лобби не должен писать базу в корень репозитория
+os.environ.setdefault('LOBBY_DB_FILE', os.path.join(tempfile.mkdtemp(), 'lobby_data.db'))
+
+import api.lobby as lobby
+from lobby_client import HttpLobbyClient, LobbyClient, LobbyError, LobbyUnavailable, LocalLobbyClient, create_lobby_client
+from telegram_bot import LobbyListingCache
+
+def _flask_transport():
+    """Транспорт httpx, передающий запросы во Flask-приложение лобби"""
+    client = lobby.app.test_client()
+
+    def handler(request):
+        response = client.open(
+            request.url.raw_path.decode(),
+            method=request.method,
+            data=request.content,
+            headers=dict(request.headers)
+        )
+        return httpx.Response(response.status_code, content=response.data, headers=dict(response.headers))
+
+    return httpx.MockTransport(handler)
+
+async def _play_scenario(client, prefix):
+    """Общий сценарий: создать игру, найти её в списке, присоединиться"""
+    await client.open()
+    try:
+        version, _ = await client.list_games_since(None)
+        game = await client.create_game(f'{prefix}1', 'alice', 'chess')
+        listed = await client.list_games(limit=100)
+        assert game['id'] in [item['id'] for item in listed]
+
+        # Список перезапрашивается только при изменении версии лобби
+        changed, games = await client.list_games_since(version, limit=100)
+        assert changed > version and game['id'] in [item['id'] for item in games]
+        assert await client.list_games_since(changed) == (changed, None)
+
+        joined = await client.join_game(f'{prefix}2', 'bob', game['id'])
+        assert joined['status'] == 'playing'
+        assert (await client.get_user_game(f'{prefix}1'))['id'] == game['id']
+        assert await client.get_user_game(f'{prefix}3') is None
+
+        try:
+            await client.join_game(f'{prefix}3', 'carol', game['id'])
+            assert False, "Присоединение к начавшейся игре должно быть отклонено"
+        except LobbyError as e:
+            assert str(e) == "Игра уже началась"
+    finally:
+        await client.close()
+
+def test_local_client():
+    """Тест прямых вызовов LobbyManager"""
+    print("🔌 Тестирование локального клиента лобби...")
+    store = lobby.SqliteLobbyStore(os.path.join(tempfile.mkdtemp(), 'lobby_data.db'))
+    manager = lobby.LobbyManager(store)
+    asyncio.run(_play_scenario(LocalLobbyClient(manager, lobby.MatchmakingQueue(manager)), 'local'))
+
+    # Медленное присоединение не останавливает цикл событий
+    join_game = manager.join_game
+    def slow_join(*args):
+        time.sleep(0.2)
+        return join_game(*args)
+    manager.join_game = slow_join
+
+    async def join_while_ticking():
+        client = LocalLobbyClient(manager)
+        game = await client.create_game('tick1', 'alice', 'chess')
+        ticks = 0
+        join = asyncio.create_task(client.join_game('tick2', 'bob', game['id']))
+        while not join.done():
+            ticks += 1
+            await asyncio.sleep(0.01)
+        assert (await join)['status'] == 'playing'
+        return ticks
+
+    assert asyncio.run(join_while_ticking()) >= 5
+    print("✅ Локальный клиент лобби работает корректно")
+
+def test_local_client_requires_lobby_app():
+    """Тест: LOBBY_CLIENT=local без API лобби в процессе отклоняется"""
+    print("🚫 Тестирование выбора локального клиента...")
+    assert isinstance(create_lobby_client('http://lobby.test/api/lobby', 'local'), LocalLobbyClient)
+
+    module = sys.modules.pop('api.lobby')
+    try:
+        create_lobby_client('http://lobby.test/api/lobby', 'local')
+        assert False, "Локальный клиент без API лобби должен быть отклонен"
+    except ValueError as e:
+        assert 'LOBBY_CLIENT=local' in str(e)
+    finally:
+        sys.modules['api.lobby'] = module
+    assert isinstance(create_lobby_client('http://lobby.test/api/lobby', 'http'), HttpLobbyClient)
+
+    # Неполный клиент отклоняется при создании, а не посреди запроса
+    class PartialClient(LobbyClient):
+        async def create_game(self, user_id, username, game_type):
+            return {}
+    try:
+        PartialClient()
+        assert False, "Клиент без всех операций лобби не должен создаваться"
+    except TypeError:
+        pass
+    print("✅ Локальный клиент требует API лобби в этом процессе")
+
+def test_http_client():
+    """Тест HTTP-клиента на том же сценарии"""
+    print("🌐 Тестирование HTTP клиента лобби...")
+    client = HttpLobbyClient('http://lobby.test/api/lobby', transport=_flask_transport())
+    asyncio.run(_play_scenario(client, 'http'))
+
+    async def unavailable():
+        def handler(request):
+            raise httpx.ConnectError('refused', request=request)
+        client = HttpLobbyClient('http://lobby.test/api/lobby', transport=httpx.MockTransport(handler))
+        await client.open()
+        try:
+            await client.list_games()
+        finally:
+            await client.close()
+
+    try:
+        asyncio.run(unavailable())
+        assert False, "Ошибка соединения должна превращаться в LobbyUnavailable"
+    except LobbyUnavailable:
+        pass
+    print("✅ HTTP клиент лобби работает корректно")
+
+class CountingLobby:
+    """Клиент лобби, считающий запросы списка игр"""
+
+    def __init__(self):
+        self.version = 1
+        self.games = []
+        self.fetches = 0
+
+    async def list_games_since(self, version, limit=None):
+        self.fetches += 1
+        await asyncio.sleep(0.01)
+        if version == self.version:
+            return self.version, None
+        return self.version, list(self.games)
+
+def test_lobby_listing_cache():
+    """Тест кеша сообщения /lobby"""
+    print("🗂 Тестирование кеша списка лобби...")
+    lobby_stub = CountingLobby()
+    cache = LobbyListingCache(lobby_stub, ttl=60)
+
+    async def burst():
+        return await asyncio.gather(*[cache.get() for _ in range(20)])
+
+    # Одновременные /lobby из разных чатов ждут один запрос
+    messages = asyncio.run(burst())
+    assert lobby_stub.fetches == 1
+    assert all(message is messages[0] for message in messages)
+    assert messages[0][1] is None
+
+    # После TTL лобби перепроверяется: без изменений сообщение не перерисовывается
+    cache.expires_at = 0
+    assert asyncio.run(cache.get()) is messages[0]
+    assert lobby_stub.fetches == 2
+
+    lobby_stub.version = 2
+    lobby_stub.games = [{'id': 'g1', 'type': 'chess', 'players_count': 1, 'max_players': 2, 'creator': 'alice'}]
+    cache.expires_at = 0
+    text, reply_markup = asyncio.run(cache.get())
+    assert reply_markup.inline_keyboard[0][0].callback_data == 'join_game_g1'
+
+    # После своих create/join бот не отдает устаревший список в пределах TTL
+    lobby_stub.version = 3
+    lobby_stub.games = []
+    assert asyncio.run(cache.get())[1] is reply_markup
+    cache.invalidate()
+    assert asyncio.run(cache.get())[1] is None
+    print("✅ Кеш списка лобби работает корректно")
+
+if __name__ == '__main__':
+    test_local_client()
+    test_local_client_requires_lobby_app()
+    test_http_client()
+    test_lobby_listing_cache()
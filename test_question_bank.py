@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Тесты внешнего банка вопросов
+"""
+
+import os
+import tempfile
+
+from game_logic import QuizGame, QUESTIONS_PER_GAME
+from question_bank import QuestionBank, build_question_bank
+
+CATEGORIES = ('history', 'science', 'sport')
+
+def _make_questions(size):
+    """Вопросы с категорией и сложностью по номеру"""
+    return [{
+        'question': f'Вопрос {i} 🧪',
+        'options': ['Да', 'Нет', 'Не знаю'],
+        'correct': i % 3,
+        'explanation': f'Пояснение {i}',
+        'category': CATEGORIES[i % len(CATEGORIES)],
+        'difficulty': 1 + i % 4
+    } for i in range(size)]
+
+def _build(questions):
+    """Собирает банк во временном файле и открывает его"""
+    path = os.path.join(tempfile.mkdtemp(), 'questions.qbank')
+    build_question_bank(path, questions)
+    return QuestionBank(path)
+
+def test_bank_roundtrip():
+    """Тест записи и чтения банка"""
+    print("📚 Тестирование банка вопросов...")
+    questions = _make_questions(3000)
+    bank = _build(questions)
+
+    assert len(bank) == 3000
+    assert bank.categories == sorted(CATEGORIES)
+    # Вопросы сгруппированы, но не потеряны и не искажены
+    key = lambda question: question['question']
+    assert sorted((bank[i] for i in range(len(bank))), key=key) == sorted(questions, key=key)
+    assert bank.count_questions('science') == 1000
+    assert bank.count_questions('science', 2) == 250
+    assert bank.count_questions(difficulty=4) == 750
+    assert bank.count_questions('music') == 0
+
+    try:
+        bank[3000]
+        assert False, "Индекс за пределами банка должен давать IndexError"
+    except IndexError:
+        pass
+    bank.close()
+    print("✅ Банк вопросов читается корректно")
+
+def test_bank_sampling():
+    """Тест выборки по категории и сложности"""
+    print("🎯 Тестирование выборки из банка...")
+    bank = _build(_make_questions(3000))
+
+    indices = bank.sample(QUESTIONS_PER_GAME, 'history', 3)
+    assert len(indices) == len(set(indices)) == QUESTIONS_PER_GAME
+    assert all(bank[i]['category'] == 'history' and bank[i]['difficulty'] == 3 for i in indices)
+    assert all(bank[i]['difficulty'] == 1 for i in bank.sample(50, difficulty=1))
+    assert bank.sample(QUESTIONS_PER_GAME, 'music') == []
+
+    # Игра по банку в файле, с категорией и без
+    game = QuizGame(bank)
+    game.start_game(1, category='sport')
+    session = game.active_games[1]
+    assert all(bank[i]['category'] == 'sport' for i in session.order)
+    text, reply_markup, _ = game.process_answer(1, bank[session.question_index]['correct'])
+    assert text.startswith('✅ Правильно!') and len(reply_markup.inline_keyboard) == 3
+    assert len(game.rendered._cache) == 2
+
+    text, reply_markup = game.start_game(2, category='music')
+    assert reply_markup is None and 2 not in game.active_games
+    game.start_game(3)
+    assert len(game.active_games[3].order) == QUESTIONS_PER_GAME
+    bank.close()
+    print("✅ Выборка по категориям не декодирует весь банк")
+
+if __name__ == '__main__':
+    test_bank_roundtrip()
+    test_bank_sampling()
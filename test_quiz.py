@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Тесты логики викторины (без запуска бота)
+"""
+
+import os
+import random
+import tempfile
+
+from game_logic import Leaderboard, QuizGame, QuizSession, QUESTIONS_PER_GAME, RENDERED_QUIZ_QUESTIONS
+from quiz_store import SqliteQuizStore
+
+def _make_bank(size):
+    """Банк однотипных вопросов; правильный ответ всегда первый"""
+    return [{
+        'question': f'Вопрос {i}',
+        'options': ['Да', 'Нет'],
+        'correct': 0,
+        'explanation': f'Пояснение {i}'
+    } for i in range(size)]
+
+def _play(game, user_id, correct=True, start=True):
+    """Проходит игру до конца (start=False - доигрывает начатую); возвращает итоговый текст"""
+    if start:
+        game.start_game(user_id)
+    while True:
+        session = game.active_games[user_id]
+        question = game.questions[session.question_index]
+        answer = question['correct'] if correct else (question['correct'] + 1) % len(question['options'])
+        text, _, finished = game.process_answer(user_id, answer)
+        if finished:
+            return text
+
+def test_session_stores_indices():
+    """Тест компактной сессии с индексами вопросов"""
+    print("🧮 Тестирование сессии викторины...")
+    game = QuizGame(_make_bank(5000))
+    game.start_game(1)
+    session = game.active_games[1]
+
+    assert isinstance(session, QuizSession) and not hasattr(session, '__dict__')
+    assert session.order.typecode == 'H'
+    assert len(session.order) == QUESTIONS_PER_GAME == len(set(session.order))
+    assert all(0 <= index < 5000 for index in session.order)
+
+    # Игра по стандартному банку задает все его вопросы по одному разу
+    default_game = QuizGame()
+    text = _play(default_game, 2)
+    assert '5/5' in text and 2 not in default_game.active_games
+    assert default_game.user_scores[2] == 5
+    print("✅ Сессия хранит только индексы вопросов")
+
+def test_leaderboard_ranks():
+    """Тест инкрементального рейтинга"""
+    print("🏆 Тестирование рейтинга...")
+    leaderboard = Leaderboard()
+    for user_id in range(1, 101):
+        leaderboard.add(user_id, user_id % 10)
+
+    # Сверяем с полной сортировкой после повторных начислений
+    leaderboard.add(42, 50)
+    leaderboard.add(7, 3)
+    expected = sorted(leaderboard.scores.items(), key=lambda item: (-item[1], item[0]))
+    assert leaderboard.top(10) == expected[:10]
+    assert leaderboard.top(10)[0] == (42, 52)
+    for place, (user_id, score) in enumerate(expected, 1):
+        assert leaderboard.rank(user_id) == place
+    assert leaderboard.rank(1000) is None and leaderboard.around(1000) == []
+
+    rank = leaderboard.rank(55)
+    around = leaderboard.around(55, radius=2)
+    assert [row[0] for row in around] == list(range(rank - 2, rank + 3))
+    assert around[2] == (rank, 55, 5)
+    assert leaderboard.around(42, radius=2)[0] == (1, 42, 52)
+
+    # Рейтинг игры обновляется по завершении викторины
+    game = QuizGame()
+    _play(game, 1, correct=False)
+    _play(game, 2)
+    assert game.get_leaderboard() == [(2, 5), (1, 0)]
+    stats = game.get_user_stats(1)
+    assert stats['rank'] == 2 and stats['players'] == 2
+    print("✅ Рейтинг обновляется без пересортировки")
+
+def test_leaderboard_buckets():
+    """Тест рейтинга на многих игроках: корзины делятся и исчезают"""
+    print("🪣 Тестирование корзин рейтинга...")
+    rng = random.Random(7)
+    leaderboard = Leaderboard(bucket_size=8)
+    leaderboard.load({user_id: rng.randrange(50) for user_id in range(200)})
+    for _ in range(3000):
+        leaderboard.add(rng.randrange(400), rng.randrange(-20, 30))
+    assert len(leaderboard._buckets) > 10
+    assert all(len(bucket) <= 16 for bucket in leaderboard._buckets)
+
+    expected = sorted(leaderboard.scores.items(), key=lambda item: (-item[1], item[0]))
+    assert len(leaderboard) == len(expected)
+    assert leaderboard.top(len(expected) + 5) == expected
+    for place, (user_id, _) in enumerate(expected, 1):
+        assert leaderboard.rank(user_id) == place
+    user_id = expected[100][0]
+    assert leaderboard.around(user_id, radius=3) == [
+        (place, uid, score) for place, (uid, score) in enumerate(expected[97:104], 98)
+    ]
+    print("✅ Корзины рейтинга согласованы с полной сортировкой")
+
+def test_store_warm_start():
+    """Тест сохранения счетов и незавершенных игр"""
+    print("💾 Тестирование хранилища викторины...")
+    path = os.path.join(tempfile.mkdtemp(), 'quiz_data.db')
+    bank = _make_bank(50)
+
+    # Большой интервал: до close() на диск ничего не пишется
+    store = SqliteQuizStore(path, interval_ms=60000)
+    game = QuizGame(bank, store=store)
+    _play(game, 1)
+    _play(game, 1)
+    _play(game, 2, correct=False)
+    game.start_game(3)
+    game.process_answer(3, 0)
+    assert store.load() == {'scores': {}, 'sessions': {}, 'stats': {}}
+    # Изменения одного пользователя схлопываются в одну запись
+    assert len(store._scores) == 2 and len(store._sessions) == 3
+    session = game.active_games[3]
+    store.close()
+
+    restored = QuizGame(bank, store=SqliteQuizStore(path))
+    assert restored.user_scores == {1: 2 * QUESTIONS_PER_GAME, 2: 0}
+    assert restored.get_leaderboard() == [(1, 2 * QUESTIONS_PER_GAME), (2, 0)]
+    assert list(restored.active_games) == [3]
+    copy = restored.active_games[3]
+    assert (copy.order, copy.position, copy.score, copy.answers) == \
+        (session.order, session.position, session.score, session.answers)
+
+    # Восстановленную игру можно доиграть
+    assert '10/10' in _play(restored, 3, start=False)
+    assert restored.user_scores[3] == QUESTIONS_PER_GAME
+    assert restored.get_user_stats(2)['games_completed'] == 1
+    restored.store.close()
+    print("✅ Счета и игры переживают перезапуск")
+
+def test_user_stats_counters():
+    """Тест счетчиков статистики пользователя"""
+    print("📈 Тестирование счетчиков статистики...")
+    game = QuizGame(_make_bank(20))
+    assert game.get_user_stats(1)['games_played'] == 0
+
+    _play(game, 1)
+    game.start_game(1)
+    for answer in (0, 0, 0, 1, 0):
+        game.process_answer(1, answer)
+
+    stats = game.get_user_stats(1)
+    assert stats['games_played'] == 2 and stats['games_completed'] == 1
+    assert stats['answers'] == QUESTIONS_PER_GAME + 5
+    assert stats['correct_answers'] == QUESTIONS_PER_GAME + 4
+    assert stats['best_streak'] == QUESTIONS_PER_GAME + 3
+    assert game.user_stats[1].streak == 1
+    assert 0 <= stats['average_answer_time'] < 1
+    assert stats['current_game']
+    print("✅ Статистика считается по ходу игры")
+
+def test_rendered_questions_are_shared():
+    """Тест заранее подготовленных вопросов и клавиатур"""
+    print("🖼 Тестирование подготовленных вопросов...")
+    game = QuizGame()
+    other = QuizGame()
+    assert game.rendered is other.rendered is RENDERED_QUIZ_QUESTIONS
+
+    text, reply_markup = game.start_game(1)
+    question = game.questions[game.active_games[1].question_index]
+    assert text.endswith(f"❓ Вопрос 1:\n{question['question']}")
+    assert [row[0].text for row in reply_markup.inline_keyboard] == question['options']
+    assert reply_markup.inline_keyboard[-1][0].callback_data == f"answer_{len(question['options']) - 1}"
+
+    # Ответ отдает ту же клавиатуру следующего вопроса, а не новую
+    wrong = (question['correct'] + 1) % len(question['options'])
+    text, next_markup, finished = game.process_answer(1, wrong)
+    next_index = game.active_games[1].question_index
+    assert not finished and next_markup is RENDERED_QUIZ_QUESTIONS[next_index].reply_markup
+    assert text.startswith(f"❌ Неправильно! Правильный ответ: {question['options'][question['correct']]}")
+    assert "❓ Вопрос 2:" in text
+    print("✅ Вопросы и клавиатуры не пересобираются")
+
+def test_idle_sessions_expire():
+    """Тест удаления брошенных игр"""
+    print("⏳ Тестирование удаления брошенных игр...")
+    game = QuizGame(_make_bank(50), session_ttl=60)
+    for user_id in range(100):
+        game.start_game(user_id)
+        game.start_game(user_id)  # Повторный старт не добавляет записей в кучу
+    assert len(game.expiry_heap) == 100
+
+    # Половина пользователей продолжает играть
+    started = game.active_games[0].asked_at
+    for user_id in range(50):
+        game.active_games[user_id].asked_at = started + 30
+    _play(game, 99, start=False)
+
+    assert game.expire_idle_sessions(started + 59) == 0
+    assert game.expire_idle_sessions(started + 61) == 49
+    assert sorted(game.active_games) == list(range(50))
+    assert len(game.expiry_heap) == 50
+
+    assert game.expire_idle_sessions(started + 91) == 50
+    assert game.active_games == {} and game.expiry_heap == []
+    print("✅ Брошенные игры удаляются, память ограничена")
+
+def test_group_round_scoring():
+    """Тест группового раунда"""
+    print("👥 Тестирование группового раунда...")
+    game = QuizGame(_make_bank(20))
+    text, reply_markup = game.start_group_round(-100, duration=30)
+    assert reply_markup.inline_keyboard[0][0].callback_data == 'group_answer_0'
+    assert game.start_group_round(-100)[1] is None
+
+    # Сотни участников: правильный ответ - первый вариант
+    for user_id in range(300):
+        assert game.record_group_answer(-100, user_id, user_id % 3 // 2) == "✍️ Ответ принят"
+    assert game.record_group_answer(-100, 0, 1) == "Ответ уже принят"
+    assert game.record_group_answer(-100, 1000, 5) == "Нет такого варианта"
+    assert list(game.group_rounds[-100].counts) == [200, 100]
+
+    # Опоздавший ответ не учитывается, даже если раунд еще не закрыт
+    game.group_rounds[-100].closes_at -= 60
+    assert game.record_group_answer(-100, 500, 0) == "⌛ Прием ответов закончен"
+
+    result = game.close_group_round(-100)
+    assert "Да — 200 ✅" in result and "Нет — 100" in result
+    assert "Правильно ответили: 200 из 300" in result
+    assert game.close_group_round(-100) is None and game.group_rounds == {}
+    assert len(game.leaderboard) == 200 and game.user_scores[0] == 1 and 2 not in game.user_scores
+    assert game.get_user_stats(2)['answers'] == 1 and game.user_stats[2].correct_answers == 0
+    print("✅ Ответы группы считаются за один проход")
+
+if __name__ == '__main__':
+    test_session_stores_indices()
+    test_leaderboard_ranks()
+    test_leaderboard_buckets()
+    test_store_warm_start()
+    test_user_stats_counters()
+    test_rendered_questions_are_shared()
+    test_idle_sessions_expire()
+    test_group_round_scoring()
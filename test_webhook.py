@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Тесты обработки webhook-обновлений бота (без Telegram)
+"""
+
+import time
+import asyncio
+from types import SimpleNamespace
+
+import api.index as index
+from api._bot_runtime import RecentUpdateIds
+from api.index import BotLoop
+from api.webhook import UpdateQueue
+
+def _update(update_id, chat_id):
+    """Минимальное обновление: update_id и чат"""
+    return SimpleNamespace(update_id=update_id, effective_chat=SimpleNamespace(id=chat_id), effective_user=None)
+
+class FakeApplication:
+    """Заменяет telegram.ext.Application: считает инициализации и обработанные обновления"""
+
+    def __init__(self, blocked_chats=()):
+        self.bot = None
+        self.initialize_calls = 0
+        self.processed = []
+        self.blocked_chats = set(blocked_chats)  # Обработка в этих чатах ждет, пока тест не снимет блок
+
+    async def initialize(self):
+        self.initialize_calls += 1
+        await asyncio.sleep(0.01)
+
+    async def process_update(self, update):
+        while update.effective_chat.id in self.blocked_chats:
+            await asyncio.sleep(0.005)
+        self.processed.append(update.update_id)
+
+def _wait_for(condition, timeout=5):
+    """Ждет выполнения условия, проверяя его периодически"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Условие не выполнилось вовремя"
+        time.sleep(0.005)
+
+def test_bot_loop_initializes_once():
+    """Тест постоянного цикла событий webhook"""
+    print("🔁 Тестирование постоянного цикла бота...")
+    application = FakeApplication()
+    bot_loop = BotLoop(application)
+
+    futures = [bot_loop.submit_update(_update(update_id, update_id)) for update_id in range(5)]
+    for future in futures:
+        future.result(5)
+
+    assert application.initialize_calls == 1
+    assert sorted(application.processed) == list(range(5))
+
+    async def answer():
+        return 42
+    assert bot_loop.call(answer) == 42
+    assert application.initialize_calls == 1
+    print("✅ Application инициализируется один раз")
+
+def test_bot_loop_dedup_and_chat_order():
+    """Тест отбрасывания повторов и порядка внутри чата"""
+    print("🔂 Тестирование повторов и порядка обновлений...")
+    application = FakeApplication(blocked_chats={1})
+    bot_loop = BotLoop(application)
+
+    futures = [bot_loop.submit_update(update) for update in
+               (_update(10, 1), _update(11, 1), _update(12, 2), _update(10, 1))]
+
+    # Медленный чат 1 не задерживает чат 2
+    futures[2].result(5)
+    assert application.processed == [12]
+
+    application.blocked_chats.clear()
+    for future in futures:
+        future.result(5)
+    assert application.processed == [12, 10, 11]
+    assert bot_loop.chat_tails == {}
+
+    # Кольцо update_id вытесняет самые старые
+    recent = RecentUpdateIds(size=2)
+    for update_id in (1, 2, None, 3):
+        recent.add(update_id)
+    assert 1 not in recent and 2 in recent and 3 in recent and len(recent) == 2
+    print("✅ Повторы отброшены, порядок в чате сохранен")
+
+def test_webhook_waits_for_update_on_vercel():
+    """Тест: в бессерверном режиме webhook отвечает после обработки обновления"""
+    print("☁️ Тестирование webhook без фоновой обработки...")
+    application = FakeApplication()
+    saved = index.application, index.bot_loop, index.WEBHOOK_WAIT_FOR_UPDATE
+    index.application, index.bot_loop, index.WEBHOOK_WAIT_FOR_UPDATE = application, BotLoop(application), True
+    try:
+        response = index.app.test_client().post('/api/webhook', json={
+            'update_id': 77,
+            'message': {'message_id': 1, 'date': 0, 'chat': {'id': 5, 'type': 'private'}, 'text': 'hi'}
+        })
+    finally:
+        index.application, index.bot_loop, index.WEBHOOK_WAIT_FOR_UPDATE = saved
+
+    assert response.status_code == 200
+    assert application.processed == [77]
+    print("✅ Ответ Telegram уходит после обработки обновления")
+
+def test_update_queue_backpressure():
+    """Тест ограниченной очереди обновлений"""
+    print("📥 Тестирование очереди обновлений...")
+    application = FakeApplication(blocked_chats={1, 2, 3})
+    updates = UpdateQueue(application, workers=1, maxsize=2)
+
+    # Первое обновление занимает обработчик, следующие два заполняют очередь
+    assert updates.offer(_update(1, 1))
+    _wait_for(lambda: updates.qsize() == 0)
+    assert updates.offer(_update(2, 2)) and updates.offer(_update(3, 3))
+    assert not updates.offer(_update(4, 4))
+
+    application.blocked_chats.clear()
+    _wait_for(lambda: len(application.processed) == 3)
+    assert application.processed == [1, 2, 3]
+    assert application.initialize_calls == 1
+    assert updates.offer(_update(4, 4))
+    print("✅ Очередь обновлений ограничена и не теряет принятые обновления")
+
+def test_update_queue_dedup_and_chat_order():
+    """Тест повторов и почтовых ящиков чатов в очереди обновлений"""
+    print("📬 Тестирование порядка обновлений в очереди...")
+    application = FakeApplication(blocked_chats={1})
+    updates = UpdateQueue(application, workers=2, maxsize=10)
+
+    for update in (_update(20, 1), _update(21, 1), _update(22, 1), _update(23, 2)):
+        assert updates.offer(update)
+    # Повтор принят (Telegram больше не повторит), но не обработан
+    assert updates.offer(_update(21, 1))
+
+    # Второй обработчик не застревает на занятом чате и берет чат 2
+    _wait_for(lambda: application.processed == [23])
+    assert updates.qsize() == 2
+
+    application.blocked_chats.clear()
+    _wait_for(lambda: len(application.processed) == 4)
+    assert application.processed == [23, 20, 21, 22]
+    assert updates.qsize() == 0 and updates.mailboxes == {}
+    print("✅ Обновления чата обрабатываются по порядку и без повторов")
+
+if __name__ == '__main__':
+    test_bot_loop_initializes_once()
+    test_bot_loop_dedup_and_chat_order()
+    test_webhook_waits_for_update_on_vercel()
+    test_update_queue_backpressure()
+    test_update_queue_dedup_and_chat_order()